@@ -1,3 +1,78 @@
 from django.contrib import admin
 
+from article.models import Article, Category, Tag, Avatar
+from article.moderation import update_articles
+from article.signals import relate_later
+from drf_vue_blog.counting import EstimatedCountPaginator
+from sync.models import ChangeLog
+
 # Register your models here.
+
+"""
+后台按大表来配置：列表页外键一次 JOIN 取出，总数用估计值，
+外键和标签用自动补全而不是把整张表渲染进下拉框，批量操作按批 UPDATE/DELETE，不逐个加载对象。
+"""
+
+
+@admin.register(Article)
+class ArticleAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'author', 'category', 'created', 'views']
+    list_select_related = ['author', 'category']
+    # category 外键有索引
+    list_filter = ['category']
+    # 前缀匹配，可以用上标题的索引
+    search_fields = ['^title']
+    autocomplete_fields = ['author', 'category', 'tags']
+    raw_id_fields = ['avatar']
+    readonly_fields = ['views', 'hot_score']
+    paginator = EstimatedCountPaginator
+    # 不再额外算一次全表总数
+    show_full_result_count = False
+    list_per_page = 50
+    actions = ['clear_category', 'mark_for_rerender']
+
+    @admin.action(description='清空所选文章的分类')
+    def clear_category(self, request, queryset):
+        # 和 /api/article/bulk_update/ 一样按批修改，记下变更、更新订阅版本和相关文章
+        updated = update_articles(queryset, category_id=None)
+        self.message_user(request, '{} 篇文章已清空分类'.format(updated))
+
+    @admin.action(description='标记所选文章需要重新渲染')
+    def mark_for_rerender(self, request, queryset):
+        # 之后由 python manage.py rerender_articles 或第一次访问时重新渲染
+        updated = queryset.update(render_version=0)
+        self.message_user(request, '{} 篇文章已标记'.format(updated))
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'created']
+    search_fields = ['title']
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['id', 'text']
+    # text 有索引
+    search_fields = ['^text']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['remove_from_articles']
+
+    @admin.action(description='从所有文章上摘掉所选标签')
+    def remove_from_articles(self, request, queryset):
+        links = Article.tags.through.objects.filter(tag__in=queryset)
+        pks = set(links.values_list('article_id', flat=True))
+        ChangeLog.record('article', pks)
+        deleted, _ = links.delete()
+        # 直接删关联不触发 m2m_changed，相关文章手动更新
+        for pk in pks:
+            relate_later(pk)
+        self.message_user(request, '已删除 {} 条文章标签关联'.format(deleted))
+
+
+@admin.register(Avatar)
+class AvatarAdmin(admin.ModelAdmin):
+    list_display = ['id', 'content']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ArticleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'article'
+
+    def ready(self):
+        # 注册信号处理函数
+        from article import signals  # noqa: F401
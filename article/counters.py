@@ -0,0 +1,124 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+"""
+文章浏览数的写缓冲。
+
+每次打开文章详情都执行 UPDATE ... SET views = views + 1，在 SQLite 上会让所有写请求排队。
+这里每个 worker 进程在内存中累计浏览数，达到 FLUSH_THRESHOLD 次或距上次写入超过 FLUSH_INTERVAL 秒时，
+把相同增量的文章合并成一条 UPDATE 批量写回。进程正常退出时会再写一次，
+异常退出最多丢失一个周期（不超过 FLUSH_THRESHOLD 次）的浏览数。
+写回失败（例如数据库被锁）时浏览数放回缓冲，下次再写：请求里顺带触发的写回只记日志，
+不让文章详情因此返回 500；定时器和进程退出时的写回照常抛出异常。
+
+达到 FLUSH_THRESHOLD 时的写回就在触发它的那个请求的线程里执行：这个请求要多等几条 UPDATE，
+以及 listeners（article/signals.py 把热度分重算放进任务队列，也是一次写入）。
+每 FLUSH_THRESHOLD 次浏览只有一个请求承担，其余请求只改内存；定时器触发的写回在单独的线程里。
+
+缓冲是进程级的，测试中请求过文章详情后要调用 reset()，避免进程退出时把测试的浏览数写进开发库。
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def counter_setting(name, default):
+    return getattr(settings, 'ARTICLE_VIEW_COUNTER', {}).get(name, default)
+
+
+class ViewCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._total = 0
+        self._last_flush = time.monotonic()
+        self._timer = None
+        # 写回之后要通知的函数，参数为 {文章 id: 增量}
+        self.listeners = []
+
+    def incr(self, pk):
+        with self._lock:
+            self._pending[pk] += 1
+            self._total += 1
+            due = (
+                self._total >= counter_setting('FLUSH_THRESHOLD', 100)
+                or time.monotonic() - self._last_flush >= counter_setting('FLUSH_INTERVAL', 10)
+            )
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                # 计数已经放回缓冲，由下一次写回带上
+                logger.warning('Failed to flush article view counts, will retry.', exc_info=True)
+                self._start_timer()
+        else:
+            self._start_timer()
+
+    def pending(self, pk):
+        """还没写回数据库的浏览数"""
+        return self._pending.get(pk, 0)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._total = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        from article.models import Article
+
+        # 增量相同的文章用一条 UPDATE 写回
+        groups = defaultdict(list)
+        for pk, count in pending.items():
+            groups[count].append(pk)
+        groups = list(groups.items())
+        for i, (count, pks) in enumerate(groups):
+            try:
+                Article.objects.filter(pk__in=pks).update(views=F('views') + count)
+            except Exception:
+                # 写失败（例如数据库被锁）时把还没写进去的放回缓冲，下次再试
+                with self._lock:
+                    for count, pks in groups[i:]:
+                        for pk in pks:
+                            self._pending[pk] += count
+                            self._total += count
+                raise
+
+        for listener in self.listeners:
+            listener(pending)
+
+    def reset(self):
+        """丢掉还没写回的浏览数并停掉定时器，测试和 explain_endpoints 回放请求后调用"""
+        with self._lock:
+            self._pending = defaultdict(int)
+            self._total = 0
+            self._last_flush = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _start_timer(self):
+        # 访问量很低时也要按时写回；uWSGI 需要开启 enable-threads 定时器才会运行
+        if self._timer is not None and self._timer.is_alive():
+            return
+        self._timer = threading.Timer(counter_setting('FLUSH_INTERVAL', 10), self._flush_in_thread)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            # 定时器线程用的是自己的数据库连接，用完关掉
+            connection.close()
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.flush)
@@ -0,0 +1,283 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from markdown.extensions import codehilite
+from markdown.extensions.attr_list import AttrListExtension, get_attrs
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension, HiliteTreeprocessor, parse_hl_lines
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.serializers import _escape_attrib_html
+from pygments import highlight
+from pygments.formatters import get_formatter_by_name
+from pygments.lexers import get_lexer_by_name, guess_lexer
+from pygments.util import ClassNotFound
+
+from drf_vue_blog.lru import LRUCache
+
+"""
+代码块高亮的缓存层。
+
+教程类文章里同样的代码片段反复出现，每次渲染都要让 Pygments 重新分词、着色，
+没有写语言的代码块还要逐个 lexer 猜测语言，这是渲染中最贵的部分。
+这里按 (语言, 代码哈希, 样式和其他选项) 缓存高亮结果：进程内一个有界 LRU，
+可选再加一个持久的 Django 缓存（settings.CODE_HIGHLIGHT['CACHE'] 指定别名）。
+lexer 的查找和猜测、formatter 的创建也做了记忆化，输出与 codehilite 原本的结果完全一致。
+"""
+
+
+def highlight_setting(name, default):
+    return getattr(settings, 'CODE_HIGHLIGHT', {}).get(name, default)
+
+
+class HighlightStats:
+    """命中率和节省的时间，按进程统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.render_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def hit(self, cost, persistent=False):
+        with self._lock:
+            self.hits += 1
+            self.persistent_hits += int(persistent)
+            self.saved_seconds += cost
+
+    def miss(self, cost):
+        with self._lock:
+            self.misses += 1
+            self.render_seconds += cost
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'render_seconds': round(self.render_seconds, 6),
+            'saved_seconds': round(self.saved_seconds, 6),
+            'cached_blocks': len(html_cache),
+        }
+
+
+html_cache = LRUCache(highlight_setting('MAX_ENTRIES', 2000))
+lexer_cache = LRUCache(highlight_setting('MAX_LEXERS', 512))
+formatter_cache = LRUCache(highlight_setting('MAX_FORMATTERS', 64))
+stats = HighlightStats()
+
+
+def highlight_stats():
+    return stats.as_dict()
+
+
+def options_key(options):
+    return repr(sorted(options.items()))
+
+
+def memoized(cache, key, factory):
+    value = cache.get(key)
+    if value is None:
+        value = factory()
+        cache.set(key, value)
+    return value
+
+
+def persistent_cache():
+    alias = highlight_setting('CACHE', None)
+    return caches[alias] if alias else None
+
+
+class CachedCodeHilite(CodeHilite):
+    """hilite() 的结果按内容缓存；不使用 Pygments 时退回原实现"""
+
+    def hilite(self, shebang=True):
+        if not (codehilite.pygments and self.use_pygments):
+            return super().hilite(shebang)
+
+        self.src = self.src.strip('\n')
+        if self.lang is None and shebang:
+            self._parseHeader()
+
+        src_hash = hashlib.sha1(self.src.encode()).hexdigest()
+        opts = options_key(self.options)
+        key = hashlib.sha1(repr((
+            self.lang, self.guess_lang, self.lang_prefix, self.pygments_formatter, opts, src_hash
+        )).encode()).hexdigest()
+
+        cached = html_cache.get(key)
+        if cached is not None:
+            stats.hit(cached[1])
+            return cached[0]
+
+        store = persistent_cache()
+        if store is not None:
+            cached = store.get('hilite:' + key)
+            if cached is not None:
+                html_cache.set(key, cached)
+                stats.hit(cached[1], persistent=True)
+                return cached[0]
+
+        start = time.perf_counter()
+        html = self.render(src_hash, opts)
+        cost = time.perf_counter() - start
+
+        html_cache.set(key, (html, cost))
+        if store is not None:
+            store.set('hilite:' + key, (html, cost), None)
+        stats.miss(cost)
+        return html
+
+    def render(self, src_hash, opts):
+        # 和 CodeHilite.hilite() 中使用 Pygments 的分支一致，只是 lexer 和 formatter 换成了记忆化的版本
+        lexer = None
+        if self.lang:
+            lexer = memoized(lexer_cache, ('name', self.lang, opts), lambda: self.lexer_by_name(self.lang))
+        if not lexer:
+            if self.guess_lang:
+                lexer = memoized(lexer_cache, ('guess', src_hash, opts), self.guessed_lexer)
+            else:
+                lexer = memoized(lexer_cache, ('name', 'text', opts), lambda: self.lexer_by_name('text'))
+        if not self.lang:
+            self.lang = lexer.aliases[0]
+
+        lang_str = f'{self.lang_prefix}{self.lang}'
+        if isinstance(self.pygments_formatter, str):
+            formatter = memoized(formatter_cache, (self.pygments_formatter, opts), self.named_formatter)
+        else:
+            formatter = self.pygments_formatter(lang_str=lang_str, **self.options)
+        return highlight(self.src, lexer, formatter)
+
+    def lexer_by_name(self, name):
+        try:
+            return get_lexer_by_name(name, **self.options)
+        except ValueError:
+            # 缓存里用 False 表示“没有这个语言”，避免下次再查
+            return False if name != 'text' else get_lexer_by_name('text', **self.options)
+
+    def guessed_lexer(self):
+        try:
+            return guess_lexer(self.src, **self.options)
+        except ValueError:  # pragma: no cover
+            return get_lexer_by_name('text', **self.options)
+
+    def named_formatter(self):
+        try:
+            return get_formatter_by_name(self.pygments_formatter, **self.options)
+        except ClassNotFound:
+            return get_formatter_by_name('html', **self.options)
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+    """缩进式代码块走这里"""
+
+    def run(self, root):
+        for block in root.iter('pre'):
+            if len(block) == 1 and block[0].tag == 'code':
+                local_config = self.config.copy()
+                code = CachedCodeHilite(
+                    self.code_unescape(block[0].text),
+                    tab_length=self.md.tab_length,
+                    style=local_config.pop('pygments_style', 'default'),
+                    **local_config
+                )
+                placeholder = self.md.htmlStash.store(code.hilite())
+                block.clear()
+                block.tag = 'p'
+                block.text = placeholder
+
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+    """
+    围栏代码块（extra 中的 fenced_code）走这里。
+    fenced_code 在 run() 里直接使用它模块里导入的 CodeHilite，没有配置项可以替换，
+    所以照着 Markdown 3.4 的 run() 写一份，只把 CodeHilite 换成带缓存的版本。
+    """
+
+    def run(self, lines):
+        if not self.checked_for_deps:
+            for ext in self.md.registeredExtensions:
+                if isinstance(ext, CodeHiliteExtension):
+                    self.codehilite_conf = ext.getConfigs()
+                if isinstance(ext, AttrListExtension):
+                    self.use_attr_list = True
+            self.checked_for_deps = True
+
+        text = '\n'.join(lines)
+        while True:
+            m = self.FENCED_BLOCK_RE.search(text)
+            if not m:
+                break
+            lang, id, classes, config = None, '', [], {}
+            if m.group('attrs'):
+                id, classes, config = self.handle_attrs(get_attrs(m.group('attrs')))
+                if len(classes):
+                    lang = classes.pop(0)
+            else:
+                if m.group('lang'):
+                    lang = m.group('lang')
+                if m.group('hl_lines'):
+                    config['hl_lines'] = parse_hl_lines(m.group('hl_lines'))
+
+            if self.codehilite_conf and self.codehilite_conf['use_pygments'] and config.get('use_pygments', True):
+                local_config = self.codehilite_conf.copy()
+                local_config.update(config)
+                if classes:
+                    local_config['css_class'] = '{} {}'.format(' '.join(classes), local_config['css_class'])
+                highliter = CachedCodeHilite(
+                    m.group('code'),
+                    lang=lang,
+                    style=local_config.pop('pygments_style', 'default'),
+                    **local_config
+                )
+                code = highliter.hilite(shebang=False)
+            else:
+                id_attr = lang_attr = class_attr = kv_pairs = ''
+                if lang:
+                    prefix = self.config.get('lang_prefix', 'language-')
+                    lang_attr = f' class="{prefix}{_escape_attrib_html(lang)}"'
+                if classes:
+                    class_attr = f' class="{_escape_attrib_html(" ".join(classes))}"'
+                if id:
+                    id_attr = f' id="{_escape_attrib_html(id)}"'
+                if self.use_attr_list and config and not config.get('use_pygments', False):
+                    kv_pairs = ''.join(
+                        f' {k}="{_escape_attrib_html(v)}"' for k, v in config.items() if k != 'use_pygments'
+                    )
+                code = self._escape(m.group('code'))
+                code = f'<pre{id_attr}{class_attr}><code{lang_attr}{kv_pairs}>{code}</code></pre>'
+
+            placeholder = self.md.htmlStash.store(code)
+            text = f'{text[:m.start()]}\n{placeholder}\n{text[m.end():]}'
+        return text.split('\n')
+
+
+class CachedCodeHiliteExtension(CodeHiliteExtension):
+    """
+    替代 markdown.extensions.codehilite，配置项完全相同。
+    只影响用了这个扩展的 Markdown 实例：同一个实例里已经注册的围栏代码块（extra 或 fenced_code）
+    也换成带缓存的版本，所以扩展列表中要写在 extra / fenced_code 之后。
+    """
+
+    def extendMarkdown(self, md):
+        hiliter = CachedHiliteTreeprocessor(md)
+        hiliter.config = self.getConfigs()
+        md.treeprocessors.register(hiliter, 'hilite', 30)
+
+        if 'fenced_code_block' in md.preprocessors:
+            fenced = md.preprocessors['fenced_code_block']
+            md.preprocessors.register(CachedFencedBlockPreprocessor(md, fenced.config), 'fenced_code_block', 25)
+
+        md.registerExtension(self)
+
+
+def makeExtension(**kwargs):
+    return CachedCodeHiliteExtension(**kwargs)
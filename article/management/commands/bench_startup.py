@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 在新的解释器里执行：加载 wsgi 应用，fork 出 worker，每个 worker 处理请求后报告耗时和内存
+CHILD = r'''
+import io, json, os, sys, time
+
+path, workers = sys.argv[1], int(sys.argv[2])
+started = time.perf_counter()
+from drf_vue_blog.wsgi import application
+startup = time.perf_counter() - started
+
+
+def hit():
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path.split('?')[0],
+        'QUERY_STRING': path.partition('?')[2], 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': False,
+        'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    status = []
+    begin = time.perf_counter()
+    b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+    return time.perf_counter() - begin, status[0]
+
+
+def memory():
+    # smaps_rollup 汇总了整个进程：Rss 包括和 master 共享的页，Private 是这个进程独占的
+    result = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    result[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return result
+
+
+results = []
+for _ in range(workers):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        first, status = hit()
+        second, _ = hit()
+        report = dict(memory(), first=first, second=second, status=status)
+        os.write(write_fd, json.dumps(report).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        results.append(json.loads(f.read()))
+    os.waitpid(pid, 0)
+
+print(json.dumps({'startup': startup, 'master': memory(), 'workers': results}))
+'''
+
+
+class Command(BaseCommand):
+    help = '比较开启和关闭启动预热时，应用加载时间、worker 第一个请求的耗时和每个 worker 的独占内存（Linux）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/article/', help='worker 请求的地址')
+        parser.add_argument('--workers', type=int, default=4, help='fork 出的 worker 数')
+
+    def handle(self, *args, **options):
+        if not hasattr(os, 'fork'):
+            raise CommandError('需要支持 fork 的系统')
+
+        for warmup in ('0', '1'):
+            env = dict(os.environ, DJANGO_WARMUP=warmup)
+            output = subprocess.run(
+                [sys.executable, '-c', CHILD, options['path'], str(options['workers'])],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if output.returncode:
+                raise CommandError(output.stderr)
+            data = json.loads(output.stdout.strip().splitlines()[-1])
+            self.report('warmup on' if warmup == '1' else 'warmup off', data)
+
+    def report(self, title, data):
+        workers = data['workers']
+        average = lambda key: sum(worker.get(key, 0) for worker in workers) / len(workers)
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write('  load application   {:8.3f} s'.format(data['startup']))
+        self.stdout.write('  worker 1st request {:8.1f} ms (status {})'.format(average('first') * 1000, workers[0]['status']))
+        self.stdout.write('  worker 2nd request {:8.1f} ms'.format(average('second') * 1000))
+        if data['master']:
+            self.stdout.write('  master RSS         {:8.1f} MB'.format(data['master']['Rss'] / 1024))
+            self.stdout.write('  worker RSS         {:8.1f} MB'.format(average('Rss') / 1024))
+            self.stdout.write('  worker private     {:8.1f} MB'.format(
+                (average('Private_Clean') + average('Private_Dirty')) / 1024
+            ))
+            self.stdout.write('  worker PSS         {:8.1f} MB'.format(average('Pss') / 1024))
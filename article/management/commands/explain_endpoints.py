@@ -0,0 +1,156 @@
+import io
+import re
+from urllib.parse import urlsplit
+
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+
+from article.counters import view_counter
+from drf_vue_blog.urls import router
+
+"""
+GET 接口并不都是只读的：文章详情会累计浏览数、第一次读到的文章会把渲染结果写回，
+有的还会往任务队列里放任务。所以回放的请求全部放在一个事务里，结束时强制回滚，
+事务提交后才执行的回调（任务入队）也随之丢掉；内存里累计的浏览数在每个请求之后清空，
+不会被定时器或者进程退出时写进数据库。
+回放期间这个事务一直持有写锁（打开 SQLITE_WRITES['IMMEDIATE'] 时），线上库上运行会让写请求等待。
+"""
+
+
+class Command(BaseCommand):
+    help = '依次请求路由中注册的每个 GET 接口，对其发出的查询做 EXPLAIN，标记全表扫描和临时 B 树排序'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', default=[],
+                            help='额外要检查的 url，例如 /api/article/?username=admin，可重复')
+        parser.add_argument('--verbose-plans', action='store_true', help='没有问题的查询也打印执行计划')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError('EXPLAIN is only supported on SQLite and MySQL, got {}.'.format(connection.vendor))
+
+        handler = BaseHandler()
+        handler.load_middleware()
+        flagged = 0
+        with transaction.atomic():
+            try:
+                for path in self.endpoint_paths() + options['paths']:
+                    flagged += self.check_endpoint(handler, path, options)
+            finally:
+                view_counter.reset()
+                transaction.set_rollback(True)
+
+        self.stdout.write('{} problem(s) found.'.format(flagged))
+
+    def get(self, handler, path):
+        """不经过 WSGI 服务器，直接让 Django 处理一个匿名的 GET 请求"""
+        url = urlsplit(path)
+        request = WSGIRequest({
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+        })
+        try:
+            return handler.get_response(request)
+        finally:
+            view_counter.reset()
+
+    def check_endpoint(self, handler, path, options):
+        flagged = 0
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get(handler, path)
+
+        # 只是字面量不同的查询（典型的 N+1）合并成一条，并记下出现次数
+        selects = {}
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if sql.lstrip().upper().startswith('SELECT'):
+                shape = re.sub(r"\b\d+\b|'[^']*'", '?', sql)
+                selects.setdefault(shape, [sql, 0])[1] += 1
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            'GET {} -> {} ({} queries)'.format(path, response.status_code, len(ctx.captured_queries))
+        ))
+        for sql, times in selects.values():
+            plan = self.explain(sql)
+            problems = self.problems(plan)
+            if problems or options['verbose_plans']:
+                self.stdout.write('  ' + sql + (' (x{})'.format(times) if times > 1 else ''))
+                for line in plan:
+                    self.stdout.write('    | ' + line)
+            for problem in problems:
+                flagged += 1
+                self.stdout.write(self.style.WARNING('    ! ' + problem))
+        return flagged
+
+    def endpoint_paths(self):
+        """列表、第一条记录的详情，以及不需要额外参数的自定义 GET 动作"""
+        paths = []
+        for prefix, viewset, basename in router.registry:
+            lookup_field = getattr(viewset, 'lookup_field', 'pk')
+            queryset = getattr(viewset, 'queryset', None)
+            lookup_value = None
+            if queryset is not None:
+                lookup_value = queryset.values_list(
+                    'pk' if lookup_field == 'pk' else lookup_field, flat=True
+                ).first()
+
+            names = [('list', False)]
+            if hasattr(viewset, 'retrieve'):
+                names.append(('detail', True))
+            for extra in viewset.get_extra_actions():
+                if 'get' in extra.mapping:
+                    names.append((extra.url_name, extra.detail))
+
+            for name, detail in names:
+                if detail and lookup_value is None:
+                    continue
+                try:
+                    paths.append(reverse(
+                        '{}-{}'.format(basename, name),
+                        kwargs={lookup_field: lookup_value} if detail else None
+                    ))
+                except NoReverseMatch:
+                    # url 中还有其他参数的动作（如归档的年月）需要用 --path 指定
+                    continue
+        return paths
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                return [row[-1] for row in cursor.fetchall()]
+
+            cursor.execute('EXPLAIN ' + sql)
+            columns = [col[0] for col in cursor.description]
+            return [
+                'table={table} type={type} key={key} rows={rows} extra={Extra}'.format(
+                    **dict(zip(columns, row))
+                )
+                for row in cursor.fetchall()
+            ]
+
+    def problems(self, plan):
+        found = []
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                # "SCAN article_article" 是全表扫描；"SCAN ... USING INDEX" 是按索引顺序读，不算
+                if line.startswith('SCAN') and 'USING' not in line:
+                    found.append('full table scan: ' + line)
+                if 'USE TEMP B-TREE' in line:
+                    found.append('temp b-tree sort: ' + line)
+            else:
+                if ' type=ALL ' in line:
+                    found.append('full table scan: ' + line)
+                if 'Using filesort' in line or 'Using temporary' in line:
+                    found.append('filesort/temporary table: ' + line)
+        return found
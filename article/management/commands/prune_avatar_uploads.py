@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from article.uploads import discard, expired_uploads, upload_setting
+
+
+class Command(BaseCommand):
+    help = '删除长时间没有继续的分块上传和它们的临时文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=upload_setting('EXPIRE_HOURS', 24),
+                            help='超过这么多小时没有新分块的上传算过期')
+
+    def handle(self, *args, **options):
+        total = 0
+        for upload in expired_uploads(options['hours']):
+            discard(upload)
+            total += 1
+        self.stdout.write(self.style.SUCCESS('Removed {} expired upload(s).'.format(total)))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from article.models import ArchiveMonth
+
+
+class Command(BaseCommand):
+    help = '从文章表全量重建按月归档的计数'
+
+    def handle(self, *args, **options):
+        months = ArchiveMonth.rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt {} archive months.'.format(months)))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from article.models import Article
+from article.ranking import refresh_hot_scores
+from drf_vue_blog.chunked import chunked
+
+
+class Command(BaseCommand):
+    help = '全量重算文章的热度分，修改 ARTICLE_RANKING 后或定期（例如每天一次）运行，修正增量更新漏掉的部分'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批重算的文章数')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = 0
+        # 按主键分块，每块一条聚合查询加一次批量写回
+        for chunk in chunked(Article.objects.only('id').order_by('pk'), options['chunk_size']):
+            done += refresh_hot_scores([article.pk for article in chunk])
+
+        self.stdout.write(self.style.SUCCESS('Recomputed hot scores of {} article(s) in {:.1f}s.'.format(
+            done, time.perf_counter() - started
+        )))
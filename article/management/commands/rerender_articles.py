@@ -0,0 +1,78 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from article.models import Article
+from article.rendering import RENDER_VERSION, render_markdown
+
+
+class Command(BaseCommand):
+    help = (
+        '用进程池批量重新渲染文章的 Markdown。默认只处理 render_version 过期的文章，'
+        '中断后重新运行即可从未完成的位置继续'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='不管版本，重新渲染所有文章')
+        parser.add_argument('--chunk-size', type=int, default=200, help='每批读取和写回的文章数')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='渲染进程数')
+        parser.add_argument('--start-after', type=int, default=0,
+                            help='从 id 大于该值的文章开始，配合 --all 断点续跑')
+
+    def handle(self, *args, **options):
+        queryset = Article.objects.all()
+        if not options['all']:
+            queryset = queryset.exclude(render_version=RENDER_VERSION)
+        queryset = queryset.filter(pk__gt=options['start_after']).order_by('pk')
+
+        total = queryset.count()
+        self.stdout.write('Rendering {} article(s) with {} worker(s), version {}.'.format(
+            total, options['workers'], RENDER_VERSION
+        ))
+        if not total:
+            return
+
+        # fork 之前关掉数据库连接，子进程只做渲染，不碰数据库
+        connections.close_all()
+
+        done = 0
+        last_pk = options['start_after']
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                # 按主键分段读取，每次只把一批正文放进内存
+                read_at = timezone.now()
+                chunk = list(queryset.filter(pk__gt=last_pk).values_list('pk', 'body')[:options['chunk_size']])
+                if not chunk:
+                    break
+
+                pks = [pk for pk, _ in chunk]
+                bodies = [body for _, body in chunk]
+                chunksize = max(1, len(bodies) // (options['workers'] * 4))
+                results = executor.map(render_markdown, bodies, chunksize=chunksize)
+
+                Article.objects.bulk_update(
+                    [
+                        Article(pk=pk, rendered_body=html, rendered_toc=toc, render_version=RENDER_VERSION)
+                        for pk, (html, toc) in zip(pks, results)
+                    ],
+                    ['rendered_body', 'rendered_toc', 'render_version'],
+                    batch_size=100,
+                )
+                # 渲染期间被编辑过的文章，写回的可能是旧正文的结果，标记为过期等下次再渲染
+                Article.objects.filter(pk__in=pks, updated__gt=read_at).update(render_version=0)
+
+                done += len(chunk)
+                last_pk = pks[-1]
+                elapsed = time.perf_counter() - started
+                self.stdout.write('{}/{} done, {:.1f} articles/s, last id {}'.format(
+                    done, total, done / elapsed, last_pk
+                ))
+
+        self.stdout.write(self.style.SUCCESS('Rendered {} article(s) in {:.1f}s.'.format(
+            done, time.perf_counter() - started
+        )))
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.1 on 2026-10-19 10:51
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def build_archive(apps, schema_editor):
+    Article = apps.get_model('article', 'Article')
+    ArchiveMonth = apps.get_model('article', 'ArchiveMonth')
+
+    counts = {}
+    for created in Article.objects.values_list('created', flat=True).iterator():
+        created = timezone.localtime(created)
+        bucket = (created.year, created.month)
+        counts[bucket] = counts.get(bucket, 0) + 1
+
+    ArchiveMonth.objects.bulk_create(
+        ArchiveMonth(year=year, month=month, count=count)
+        for (year, month), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0005_avatar_article_avatar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-year', '-month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='archivemonth',
+            constraint=models.UniqueConstraint(fields=('year', 'month'), name='unique_archive_month'),
+        ),
+        migrations.RunPython(build_archive, migrations.RunPython.noop),
+    ]
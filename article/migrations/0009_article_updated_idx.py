@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0008_article_rendered'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['updated'], name='article_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0009_article_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='views',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
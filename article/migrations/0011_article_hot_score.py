@@ -0,0 +1,57 @@
+# Generated by Django 4.1.1 on 2026-10-19 11:06
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# 写这个迁移时 article/ranking.py 的公式和默认参数，抄在这里，以后改排名算法不会改变这个迁移的结果；
+# 改了参数后运行 python manage.py recompute_hot_scores 按新的参数重算
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+COMMENT_WEIGHT = 5
+VIEW_WEIGHT = 1
+HALF_LIFE = 3 * 24 * 3600
+BATCH_SIZE = 500
+
+
+def hot_score(created, comments, views):
+    engagement = comments * COMMENT_WEIGHT + views * VIEW_WEIGHT
+    return math.log2(1 + engagement) + (created - EPOCH).total_seconds() / HALF_LIFE
+
+
+def compute_hot_scores(apps, schema_editor):
+    Article = apps.get_model('article', 'Article')
+
+    # 边读边写，不把所有文章同时放进内存
+    batch = []
+    queryset = Article.objects.annotate(comment_count=Count('comments')).only('id', 'created', 'views')
+    for article in queryset.iterator(chunk_size=BATCH_SIZE):
+        article.hot_score = hot_score(article.created, article.comment_count, article.views)
+        batch.append(article)
+        if len(batch) == BATCH_SIZE:
+            Article.objects.bulk_update(batch, ['hot_score'])
+            batch = []
+    Article.objects.bulk_update(batch, ['hot_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0010_article_views'),
+        # 统计评论数需要评论表
+        ('comment', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-hot_score', '-id'], name='article_hot_idx'),
+        ),
+        migrations.RunPython(compute_hot_scores, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
+import uuid
+from datetime import datetime
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import OperationalError, models, transaction
 from django.utils import timezone
-from markdown import Markdown
+
+from article.ranking import comment_count, hot_score
+from article.rendering import RENDER_VERSION, render_markdown
 
 
 class Category(models.Model):
@@ -22,6 +27,10 @@ class Tag(models.Model):
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            # 按 text 查找标签（SlugRelatedField、新建文章时自动建标签）
+            models.Index(fields=['text'], name='tag_text_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -30,6 +39,29 @@ class Tag(models.Model):
 class Avatar(models.Model):
     content = models.ImageField(upload_to='avatar/%Y%m%d')
 
+
+class AvatarUpload(models.Model):
+    """分块上传中的标题图，全部收到并校验通过后变成 Avatar，见 article/uploads.py"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='avatar_uploads')
+    filename = models.CharField(max_length=255)
+    # 客户端声明的总大小
+    size = models.PositiveBigIntegerField()
+    # 已经收到的字节数，续传时从这里接着发
+    offset = models.PositiveBigIntegerField(default=0)
+    # 客户端给出的 sha256，完成时校验，可以不填
+    sha256 = models.CharField(max_length=64, blank=True)
+    # 正在写入的请求持有的锁，同一个上传同时只能有一个请求在写
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # 清理过期的上传
+            models.Index(fields=['updated'], name='avatarupload_updated_idx'),
+        ]
+
 # 博客文章 model
 class Article(models.Model):
     # 标题
@@ -69,26 +101,152 @@ class Article(models.Model):
         on_delete=models.SET_NULL,
         related_name='article'
     )
+    # 渲染好的正文和目录，以及渲染时的 RENDER_VERSION，0 表示需要重新渲染
+    rendered_body = models.TextField(blank=True, default='', editable=False)
+    rendered_toc = models.TextField(blank=True, default='', editable=False)
+    render_version = models.PositiveIntegerField(default=0, editable=False)
+    # 浏览数，由 article/counters.py 批量写回
+    views = models.PositiveIntegerField(default=0, editable=False)
+    # 热度分，见 article/ranking.py
+    hot_score = models.FloatField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录从数据库读出时的字段值，保存时用来判断哪些字段被改过
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # 正文改过就让已渲染的结果失效
+        loaded = getattr(self, '_loaded_values', {})
+        if 'body' not in self.get_deferred_fields() and self.body != loaded.get('body'):
+            self.render_version = 0
+        # 新文章或改了发布时间时重算热度分
+        if self._state.adding:
+            self.hot_score = hot_score(self.created, 0, self.views)
+        elif 'created' in loaded and self.created != loaded['created']:
+            comments = Article.objects.filter(pk=self.pk).annotate(n=comment_count()).values_list('n', flat=True).get()
+            self.hot_score = hot_score(self.created, comments, self.views)
+        super().save(*args, **kwargs)
+        # 保存之后以这次保存的值为准，信号处理函数用它判断下次保存改了哪些字段
+        deferred = self.get_deferred_fields()
+        self._loaded_values = dict(getattr(self, '_loaded_values', {}), **{
+            name: getattr(self, name) for name in ('body', 'title', 'category_id') if name not in deferred
+        })
+
+    def get_absolute_url(self):
+        # 前端（Vue）中文章详情页的路由，订阅和 sitemap 中使用
+        return '/article/{}'.format(self.pk)
 
     # 新增方法，将 body 转换为带 html 标签的正文
     def get_md(self):
-        md = Markdown(
-            extensions=[
-                'markdown.extensions.extra',
-                'markdown.extensions.codehilite',
-                'markdown.extensions.toc',
-            ]
-        )
-        md_body = md.convert(self.body)
         # toc 是渲染后的目录,方法返回了包含了两个元素的元组，分别为已渲染为 html 的正文和目录
-        return md_body, md.toc
-
+        if self.render_version != RENDER_VERSION:
+            self.rendered_body, self.rendered_toc = render_markdown(self.body)
+            self.render_version = RENDER_VERSION
+            if self.pk is not None:
+                # 用 update 写回，不触发 save() 和 updated 的 auto_now
+                try:
+                    Article.objects.filter(pk=self.pk).update(
+                        rendered_body=self.rendered_body,
+                        rendered_toc=self.rendered_toc,
+                        render_version=self.render_version,
+                    )
+                except OperationalError:
+                    # 写回只是缓存，数据库正忙时不让读请求失败，下次读取再写
+                    pass
+        return self.rendered_body, self.rendered_toc
 
     class Meta:
         # 为了让分页更准确，给模型类规定好查询排序：
         ordering = ['-created']
+        indexes = [
+            # 文章列表按创建时间倒序分页
+            models.Index(fields=['-created'], name='article_created_idx'),
+            # ?username= 过滤某个作者的文章并按时间倒序
+            models.Index(fields=['author', '-created'], name='article_author_created_idx'),
+            # 订阅、sitemap 取最后修改时间
+            models.Index(fields=['updated'], name='article_updated_idx'),
+            # 按热度排序的列表
+            models.Index(fields=['-hot_score', '-id'], name='article_hot_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class RelatedArticle(models.Model):
+    """预先算好的相关文章，每篇文章保留相似度最高的几篇，由 article/related.py 维护"""
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'related'], name='unique_related_article'),
+        ]
+        indexes = [
+            # 详情页按相似度取一篇文章的相关文章
+            models.Index(fields=['article', '-score'], name='related_article_score_idx'),
+        ]
+
+    def __str__(self):
+        return '{} -> {}'.format(self.article_id, self.related_id)
+
+
+class ArchiveMonth(models.Model):
+    """按年月归档的文章数，由 article/signals.py 在文章增删、改日期时维护，侧边栏只需读这张小表"""
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-year', '-month']
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month'], name='unique_archive_month'),
+        ]
+
+    def __str__(self):
+        return '{}-{:02d}'.format(self.year, self.month)
+
+    @staticmethod
+    def bucket_of(value):
+        # 按本地时区（TIME_ZONE）归档，和前端显示的日期保持一致
+        value = timezone.localtime(value)
+        return value.year, value.month
+
+    @classmethod
+    def adjust(cls, value, delta):
+        """给 value 所在月份的计数加上 delta，计数归零的月份直接删掉"""
+        year, month = cls.bucket_of(value)
+        cls.objects.get_or_create(year=year, month=month)
+        cls.objects.filter(year=year, month=month).update(count=models.F('count') + delta)
+        if delta < 0:
+            cls.objects.filter(year=year, month=month, count__lte=0).delete()
+
+    @classmethod
+    def rebuild(cls):
+        """从文章表全量重建归档，用于初始化或修复计数"""
+        counts = {}
+        for created in Article.objects.values_list('created', flat=True).iterator():
+            bucket = cls.bucket_of(created)
+            counts[bucket] = counts.get(bucket, 0) + 1
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(
+                cls(year=year, month=month, count=count)
+                for (year, month), count in counts.items()
+            )
+        return len(counts)
+
+    def date_range(self):
+        """该月份在本地时区下的起止时间 [start, end)"""
+        start = timezone.make_aware(datetime(self.year, self.month, 1))
+        if self.month == 12:
+            end = timezone.make_aware(datetime(self.year + 1, 1, 1))
+        else:
+            end = timezone.make_aware(datetime(self.year, self.month + 1, 1))
+        return start, end
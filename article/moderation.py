@@ -0,0 +1,71 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from article.models import Article, ArchiveMonth
+from article.signals import relate_later
+from comment.models import Comment
+from comment.moderation import bulk_deleting, delete_archived_comments, delete_comments, id_batches, \
+    moderation_setting
+from sync.models import ChangeLog
+from user_info.models import UserStats
+
+"""
+文章的批量管理，做法和 comment/moderation.py 相同。
+
+删除文章时，先按批删掉它们的评论（作者统计按批更新），归档的评论、相关文章、标签关联都是一条 DELETE；
+按月归档、作者的文章数、变更记录按批汇总后各更新一次，而不是每篇文章走一遍 post_delete 信号。
+"""
+
+
+def delete_article_batch(ids):
+    """删除一批文章，返回 (文章数, 评论数)"""
+    with transaction.atomic():
+        rows = list(Article.objects.filter(pk__in=ids).values_list('author_id', 'created'))
+        # 文章都要删了，不用再重算热度
+        comments = delete_comments(Comment.objects.filter(article_id__in=ids), rerank=False)
+        comments += delete_archived_comments(ids)
+
+        with bulk_deleting():
+            # 同样只取出信号用得到的字段，不读正文和渲染缓存
+            articles = Article.objects.filter(pk__in=ids).only('pk', 'author_id', 'created')
+            deleted = articles.delete()[1].get(Article._meta.label, 0)
+
+        # 月份 -> (这个月的任意一个创建时间, 篇数)
+        months = {}
+        for _, created in rows:
+            first, n = months.get(ArchiveMonth.bucket_of(created), (created, 0))
+            months[ArchiveMonth.bucket_of(created)] = (first, n + 1)
+        for created, n in months.values():
+            ArchiveMonth.adjust(created, -n)
+        for author_id, n in Counter(author_id for author_id, _ in rows if author_id is not None).items():
+            UserStats.adjust(author_id, articles=-n)
+        ChangeLog.record('article', ids, ChangeLog.DELETE)
+    return deleted, comments
+
+
+def delete_articles(queryset, batch_size=None):
+    batch_size = batch_size or moderation_setting('BATCH_SIZE', 500)
+    articles = comments = 0
+    for ids in id_batches(queryset, batch_size):
+        deleted, deleted_comments = delete_article_batch(ids)
+        articles += deleted
+        comments += deleted_comments
+    return articles, comments
+
+
+def update_articles(queryset, batch_size=None, **values):
+    """批量修改文章的分类等字段，返回修改的篇数"""
+    batch_size = batch_size or moderation_setting('BATCH_SIZE', 500)
+    updated = 0
+    for ids in id_batches(queryset, batch_size):
+        with transaction.atomic():
+            # update() 不会处理 auto_now
+            updated += Article.objects.filter(pk__in=ids).update(updated=timezone.now(), **values)
+            ChangeLog.record('article', ids)
+            if 'category_id' in values:
+                # 同分类会加分，相关文章要跟着更新（update() 不触发 post_save）
+                for pk in ids:
+                    relate_later(pk)
+    return updated
@@ -0,0 +1,60 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+"""
+文章热度排名。
+
+热度分 = log2(1 + 评论数 * COMMENT_WEIGHT + 浏览数 * VIEW_WEIGHT) + (发布时间 - EPOCH) / HALF_LIFE
+
+相当于按半衰期 HALF_LIFE 做指数衰减：晚发布一个 HALF_LIFE 的文章，互动量只需一半就能排在一起。
+分数只由文章自身的数据决定，不随当前时间变化，所以可以存在 Article.hot_score 上建索引排序，
+评论增删、浏览数写回时只重算相关的几篇（见 article/signals.py），
+调整权重后或定期运行 python manage.py recompute_hot_scores 全量重算。
+"""
+
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def ranking_setting(name, default):
+    return getattr(settings, 'ARTICLE_RANKING', {}).get(name, default)
+
+
+def hot_score(created, comments=0, views=0):
+    engagement = comments * ranking_setting('COMMENT_WEIGHT', 5) + views * ranking_setting('VIEW_WEIGHT', 1)
+    age = (created - EPOCH).total_seconds() / ranking_setting('HALF_LIFE', 3 * 24 * 3600)
+    return math.log2(1 + engagement) + age
+
+
+def comment_count():
+    """
+    文章的评论数，归档的评论也算在内。用作 annotate 的表达式，保存文章和批量重算热度分都用它。
+    两张表各一个走 article_id 索引的子查询，不用 JOIN 两张评论表再去重。
+    """
+    from comment.models import ArchivedComment, Comment
+
+    def count(model):
+        return Coalesce(Subquery(
+            model.objects.filter(article=OuterRef('pk')).order_by().values('article').annotate(n=Count('pk')).values('n')
+        ), 0)
+
+    return count(Comment) + count(ArchivedComment)
+
+
+def refresh_hot_scores(pks):
+    """重算指定文章的热度分，返回更新的文章数"""
+    from article.models import Article
+
+    articles = list(
+        Article.objects.filter(pk__in=pks)
+        .annotate(comment_count=comment_count())
+        .only('id', 'created', 'views', 'hot_score')
+    )
+    for article in articles:
+        article.hot_score = hot_score(article.created, article.comment_count, article.views)
+    # 用 bulk_update 写回，不触发 save() 和 updated 的 auto_now
+    Article.objects.bulk_update(articles, ['hot_score'], batch_size=500)
+    return len(articles)
@@ -0,0 +1,190 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Substr
+
+from article.models import Article, RelatedArticle
+from drf_vue_blog.chunked import chunked
+
+"""
+相关文章推荐。
+
+两篇文章的相似度 = 标签的 Jaccard 系数 * TAG_WEIGHT + 同一分类 * CATEGORY_WEIGHT + 标题和正文词频的余弦 * TERM_WEIGHT。
+每篇文章最相似的 TOP_K 篇存在 RelatedArticle 表里，详情页只需按 (article, -score) 索引查一次。
+
+python manage.py build_related_articles 全量重建：按主键分块读取，正文在数据库里截断到 BODY_CHARS 个字符，
+不会把所有文章的全文同时读进内存；
+文章的标签、分类、标题或正文改动后由 article/signals.py 调用 refresh_related() 增量更新：
+只和有共同标签、同分类或最近发布的文章比较，同时更新对方列表中与这篇文章有关的部分。
+"""
+
+Features = namedtuple('Features', ['pk', 'tags', 'category_id', 'terms'])
+
+# 英文单词，或连续的中文（中文按相邻两个字切成词）
+WORD_RE = re.compile(r'[a-zA-Z][a-zA-Z0-9_+#]*|[\u4e00-\u9fff]+')
+STOPWORDS = {
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'you', 'not', 'but', 'can', 'use',
+    'import', 'return', 'def', 'self', 'class', 'none', 'true', 'false',
+}
+TITLE_WEIGHT = 3
+
+
+def related_setting(name, default):
+    return getattr(settings, 'RELATED_ARTICLES', {}).get(name, default)
+
+
+def tokenize(text):
+    for word in WORD_RE.findall(text):
+        if word[0] >= '\u4e00':
+            if len(word) == 1:
+                yield word
+            for i in range(len(word) - 1):
+                yield word[i:i + 2]
+        else:
+            word = word.lower()
+            if len(word) > 1 and word not in STOPWORDS:
+                yield word
+
+
+def term_vector(title, body):
+    """归一化后的词频向量，只保留出现最多的 MAX_TERMS 个词；body 是截断后的正文，见 with_body_head()"""
+    counts = Counter(tokenize(body))
+    for term in tokenize(title):
+        counts[term] += TITLE_WEIGHT
+    top = counts.most_common(related_setting('MAX_TERMS', 50))
+    # 词频取对数，避免一个词出现很多次就决定相似度
+    weights = {term: 1 + math.log(count) for term, count in top}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1
+    return {term: w / norm for term, w in weights.items()}
+
+
+def with_body_head(queryset):
+    """只取算特征用到的字段，正文用 SUBSTR 截断后取出"""
+    return queryset.annotate(body_head=Substr('body', 1, related_setting('BODY_CHARS', 5000))).only(
+        'id', 'title', 'category_id'
+    )
+
+
+def features_of(articles):
+    tags = defaultdict(set)
+    through = Article.tags.through.objects.filter(article_id__in=[article.pk for article in articles])
+    for article_id, tag_id in through.values_list('article_id', 'tag_id'):
+        tags[article_id].add(tag_id)
+    return {
+        article.pk: Features(
+            article.pk, frozenset(tags[article.pk]), article.category_id, term_vector(article.title, article.body_head)
+        )
+        for article in articles
+    }
+
+
+def load_features(queryset):
+    return features_of(list(with_body_head(queryset)))
+
+
+def similarity(a, b):
+    score = 0.0
+    if a.tags and b.tags:
+        score += related_setting('TAG_WEIGHT', 1.0) * len(a.tags & b.tags) / len(a.tags | b.tags)
+    if a.category_id is not None and a.category_id == b.category_id:
+        score += related_setting('CATEGORY_WEIGHT', 0.3)
+    if len(b.terms) < len(a.terms):
+        a, b = b, a
+    score += related_setting('TERM_WEIGHT', 1.0) * sum(w * b.terms.get(term, 0) for term, w in a.terms.items())
+    return score
+
+
+def top_related(target, candidates):
+    scored = ((similarity(target, other), other.pk) for other in candidates if other.pk != target.pk)
+    return heapq.nlargest(related_setting('TOP_K', 5), (item for item in scored if item[0] > 0))
+
+
+def build_all():
+    """全量重建，返回写入的行数"""
+    features = {}
+    for chunk in chunked(with_body_head(Article.objects.order_by('pk'))):
+        features.update(features_of(chunk))
+
+    # 倒排索引：只和至少有一个共同标签、分类或关键词的文章比较
+    postings = defaultdict(list)
+    for f in features.values():
+        for tag in f.tags:
+            postings['tag', tag].append(f.pk)
+        if f.category_id is not None:
+            postings['category', f.category_id].append(f.pk)
+        for term in f.terms:
+            postings['term', term].append(f.pk)
+    # 太常见的词几乎每篇都有，不拿来找候选
+    max_posting = max(related_setting('CANDIDATES', 200), len(features) // 10)
+
+    rows = []
+    for f in features.values():
+        keys = [('tag', tag) for tag in f.tags] + [('term', term) for term in f.terms]
+        if f.category_id is not None:
+            keys.append(('category', f.category_id))
+        candidate_pks = set()
+        for key in keys:
+            if key[0] != 'term' or len(postings[key]) <= max_posting:
+                candidate_pks.update(postings[key])
+        for score, pk in top_related(f, (features[pk] for pk in candidate_pks)):
+            rows.append(RelatedArticle(article_id=f.pk, related_id=pk, score=score))
+
+    with transaction.atomic():
+        RelatedArticle.objects.all().delete()
+        RelatedArticle.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def refresh_related(pk):
+    """某篇文章改动后，更新它自己的列表以及其他文章列表中和它有关的部分"""
+    target = load_features(Article.objects.filter(pk=pk)).get(pk)
+    if target is None:
+        return
+
+    limit = related_setting('CANDIDATES', 200)
+    shared = Q(category_id=target.category_id) if target.category_id is not None else Q()
+    if target.tags:
+        shared |= Q(tags__in=target.tags)
+    candidate_pks = set()
+    if shared:
+        candidate_pks.update(
+            Article.objects.filter(shared).exclude(pk=pk).order_by('-created').values_list('id', flat=True).distinct()[:limit]
+        )
+    candidate_pks.update(Article.objects.exclude(pk=pk).order_by('-created').values_list('id', flat=True)[:limit])
+    # 原来就和它互相关联的文章也要重新比较，相似度可能降到列表之外
+    candidate_pks.update(RelatedArticle.objects.filter(related_id=pk).values_list('article_id', flat=True))
+
+    candidates = load_features(Article.objects.filter(pk__in=candidate_pks))
+    scores = {other.pk: similarity(target, other) for other in candidates.values()}
+    top_k = related_setting('TOP_K', 5)
+
+    existing = defaultdict(dict)
+    for article_id, related_id, score in RelatedArticle.objects.filter(article_id__in=scores).values_list(
+            'article_id', 'related_id', 'score'):
+        existing[article_id][related_id] = score
+
+    with transaction.atomic():
+        RelatedArticle.objects.filter(article_id=pk).delete()
+        RelatedArticle.objects.bulk_create(
+            RelatedArticle(article_id=pk, related_id=other_pk, score=score)
+            for score, other_pk in top_related(target, candidates.values())
+        )
+
+        for other_pk, score in scores.items():
+            current = existing[other_pk]
+            if pk in current:
+                if score > 0:
+                    RelatedArticle.objects.filter(article_id=other_pk, related_id=pk).update(score=score)
+                else:
+                    # 空出来的位置等下次全量重建时补上
+                    RelatedArticle.objects.filter(article_id=other_pk, related_id=pk).delete()
+            elif score > 0 and (len(current) < top_k or score > min(current.values())):
+                if len(current) >= top_k:
+                    weakest = min(current, key=current.get)
+                    RelatedArticle.objects.filter(article_id=other_pk, related_id=weakest).delete()
+                RelatedArticle.objects.create(article_id=other_pk, related_id=pk, score=score)
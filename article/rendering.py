@@ -0,0 +1,196 @@
+import hashlib
+import re
+
+from django.core.cache import cache
+from markdown import Markdown
+from markdown.extensions.toc import nest_toc_tokens, slugify, unique
+from markdown.postprocessors import Postprocessor
+
+"""
+文章正文的 Markdown 渲染。
+
+渲染结果存在 Article.rendered_body / rendered_toc 中，render_version 记录渲染时的版本。
+修改下面的扩展或 codehilite 样式后，把 RENDER_VERSION 加一，
+再运行 python manage.py rerender_articles 批量重新渲染旧文章。
+
+长文章按顶层块（空行分隔的段落、标题、代码块、列表等）分别渲染，每块的结果按内容哈希缓存，
+编辑一段时只有改动的块需要重新渲染，再由缓存的片段拼出正文和目录。
+块之间有依赖的写法（引用式链接、脚注、缩写、定义列表、[TOC]、自定义 id、原始 HTML）无法分块，退回整篇渲染。
+"""
+
+RENDER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.extra',
+    # 带高亮缓存的 codehilite，见 article/highlight.py
+    'article.highlight:CachedCodeHiliteExtension',
+    'markdown.extensions.toc',
+]
+
+# 渲染片段在缓存中的保存时间（秒）
+BLOCK_CACHE_TIMEOUT = 7 * 24 * 3600
+
+FENCE_RE = re.compile(r'^(`{3,}|~{3,})')
+LIST_ITEM_RE = re.compile(r'^ {0,3}([*+-]|\d+\.)[ \t]')
+# 这些写法会让一个块的渲染结果依赖其他块
+CROSS_BLOCK_RE = re.compile(
+    r'^ {0,3}\[[^\]]+\]:'    # 引用式链接和脚注的定义
+    r'|^\*\['                # 缩写
+    r'|^ {0,3}<'             # 原始 HTML 块
+    r'|^\[TOC\]\s*$'         # 目录标记
+    r'|^:'                   # 定义列表，词条会并入前面相邻的 <dl>
+    r'|\{[^}]*#'             # attr_list 自定义 id
+)
+HEADER_ID_RE = r'(<h[1-6][^>]*\bid="){}"'
+
+
+def render_markdown(body):
+    """返回 (正文 html, 目录 html)，不依赖数据库，可以在进程池中执行"""
+    blocks = split_blocks(body)
+    if not blocks or not body.strip():
+        return render_full(body)
+    return render_blocks(blocks)
+
+
+def render_full(body):
+    """整篇渲染"""
+    md = Markdown(extensions=MARKDOWN_EXTENSIONS)
+    md_body = md.convert(body)
+    return md_body, md.toc
+
+
+def normalize(body):
+    # 和 Markdown 的 NormalizeWhitespace 预处理一致，保证分块的依据和真正渲染的文本相同
+    body = body.replace('\r\n', '\n').replace('\r', '\n').expandtabs(4)
+    return re.sub(r'(?<=\n) +\n', '\n', body)
+
+
+def split_blocks(body):
+    """
+    按空行把正文切成顶层块，代码围栏内部不切；
+    缩进的续行、紧跟在列表后的列表项和连续的引用并入上一块。
+    遇到跨块依赖的写法时返回 None。
+    """
+    blocks = []
+    current = []
+    fence = None
+    after_blank = False
+
+    for line in normalize(body).split('\n'):
+        if fence is not None:
+            current.append(line)
+            if line.rstrip(' ') == fence:
+                fence = None
+            continue
+
+        # 规范化之后只有空字符串才是空行，和 Markdown 按 \n\n 分块的规则一致
+        if not line:
+            after_blank = bool(current)
+            if current:
+                current.append(line)
+            continue
+
+        if CROSS_BLOCK_RE.search(line):
+            return None
+
+        if after_blank and not continues_block(current, line):
+            blocks.append('\n'.join(current).strip('\n'))
+            current = []
+        after_blank = False
+
+        current.append(line)
+        match = FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+
+    if current:
+        blocks.append('\n'.join(current).strip('\n'))
+    return blocks
+
+
+def continues_block(current, line):
+    # 多并几块不影响结果，只是缓存粒度变粗，所以这里宁可多并
+    if line.startswith(' '):
+        return True
+    if LIST_ITEM_RE.match(line) and any(LIST_ITEM_RE.match(prev) for prev in current):
+        return True
+    return line.startswith('>') and any(prev.startswith('>') for prev in current)
+
+
+class OutputRecorder(Postprocessor):
+    """
+    记下 convert() 最后 strip() 之前的输出。
+    代码块等暂存的 html 替换回来后末尾带换行，整篇渲染时这个换行会留在块与块之间。
+    """
+    output = ''
+
+    def run(self, text):
+        self.output = text
+        return text
+
+
+def render_block(md, slugs, block):
+    """渲染单个块，返回 (html, 目录条目, 标题的原始 slug)"""
+    del slugs[:]
+    md.reset()
+    md.convert(block)
+    html = md.postprocessors['output_recorder'].output
+
+    tokens = []
+
+    def flatten(items):
+        for item in items:
+            tokens.append((item['level'], item['id'], item['name']))
+            flatten(item['children'])
+
+    flatten(md.toc_tokens)
+    return html, tokens, list(slugs)
+
+
+def render_blocks(blocks):
+    keys = ['md_block:{}:{}'.format(RENDER_VERSION, hashlib.sha1(block.encode()).hexdigest()) for block in blocks]
+    cached = cache.get_many(keys)
+
+    slugs = []
+    md = Markdown(
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs={
+            'markdown.extensions.toc': {
+                # 记下每个标题自动生成 id 前的 slug，拼接时按整篇文章重新去重
+                'slugify': lambda value, separator: slugs.append(slugify(value, separator)) or slugs[-1],
+            },
+        },
+    )
+    md.postprocessors.register(OutputRecorder(md), 'output_recorder', 0)
+
+    missing = {}
+    for key, block in zip(keys, blocks):
+        if key not in cached and key not in missing:
+            missing[key] = render_block(md, slugs, block)
+    if missing:
+        cache.set_many(missing, BLOCK_CACHE_TIMEOUT)
+        cached.update(missing)
+
+    parts = []
+    toc_tokens = []
+    used_ids = set()
+    for key in keys:
+        html, tokens, raw_slugs = cached[key]
+        pos = 0
+        for (level, block_id, name), slug in zip(tokens, raw_slugs):
+            # 块内生成的 id 只在块内唯一，这里按整篇文章的顺序重新生成，和整篇渲染的结果一致
+            doc_id = unique(slug, used_ids)
+            match = re.compile(HEADER_ID_RE.format(re.escape(block_id))).search(html, pos)
+            if doc_id != block_id:
+                html = html[:match.start()] + match.group(1) + doc_id + '"' + html[match.end():]
+            pos = match.start() + len(match.group(1)) + len(doc_id)
+            toc_tokens.append({'level': level, 'id': doc_id, 'name': name})
+        parts.append(html)
+
+    md.reset()
+    toc_processor = md.treeprocessors['toc']
+    toc = md.serializer(toc_processor.build_toc_div(nest_toc_tokens(toc_tokens)))
+    for postprocessor in md.postprocessors:
+        toc = postprocessor.run(toc)
+
+    return '\n'.join(parts).strip(), toc
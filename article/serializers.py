@@ -1,10 +1,18 @@
 # article/serializers.py
 
+from django.urls import reverse
 from rest_framework import serializers
-
-from comment.serializers import CommentSerializer
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from article.counters import view_counter
+from article.ranking import comment_count
+from comment.archive import attach_parents
+from comment.serializers import serialize_comments
+from drf_vue_blog.chunked import ChunkedListSerializer
 from user_info.serializers import UserDescSerializer
-from .models import Article, Category, Tag, Avatar
+from .models import Article, Category, Tag, Avatar, AvatarUpload, ArchiveMonth, RelatedArticle
+from .uploads import upload_setting
 
 class AvatarSerializer(serializers.ModelSerializer):
     url = serializers.HyperlinkedIdentityField(view_name='avatar-detail')
@@ -13,6 +21,28 @@ class AvatarSerializer(serializers.ModelSerializer):
         model = Avatar
         fields = '__all__'
 
+
+class AvatarUploadSerializer(serializers.ModelSerializer):
+    """分块上传的会话，offset 是服务器已经收到的字节数"""
+    url = serializers.HyperlinkedIdentityField(view_name='avatar-upload-detail')
+
+    def validate_size(self, value):
+        max_size = upload_setting('MAX_SIZE', 10 * 1024 * 1024)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError('Size must be between 1 and {} bytes.'.format(max_size))
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError('sha256 must be 64 hex characters.')
+        return value
+
+    class Meta:
+        model = AvatarUpload
+        fields = ['id', 'url', 'filename', 'size', 'offset', 'sha256', 'created']
+        read_only_fields = ['offset', 'created']
+
 """关于分类的序列化器"""
 class CategorySerializer(serializers.ModelSerializer):
     """分类的序列化器"""
@@ -36,6 +66,8 @@ class ArticleCategoryDetailSerializer(serializers.ModelSerializer):
             'url',
             'title',
         ]
+        # 分类下的文章可能很多，按块查询
+        list_serializer_class = ChunkedListSerializer
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
     """分类详情"""
@@ -180,15 +212,17 @@ class ArticleBaseSerializer(serializers.HyperlinkedModelSerializer):
         tags_data = data.get('tags')
 
         if isinstance(tags_data, list):
-            for text in tags_data:
-                if not Tag.objects.filter(text=text).exists():
-                    Tag.objects.create(text=text)
+            # 一次查出已有的标签，缺的一次批量创建，而不是每个标签查一次、建一次
+            texts = {text for text in tags_data if isinstance(text, str)}
+            existing = set(Tag.objects.filter(text__in=texts).values_list('text', flat=True))
+            Tag.objects.bulk_create([Tag(text=text) for text in texts - existing])
 
         return super().to_internal_value(data)
 
     class Meta:
         model = Article
-        fields = '__all__'
+        # 渲染缓存字段只在服务端使用
+        exclude = ['rendered_body', 'rendered_toc', 'render_version']
 
 
 
@@ -199,20 +233,80 @@ class ArticleSerializer(ArticleBaseSerializer):
     """# 保留 Meta 类 将父类改为 ArticleBaseSerializer"""
     class Meta:
         model = Article
-        fields = '__all__'
+        exclude = ['rendered_body', 'rendered_toc', 'render_version']
         extra_kwargs = {'body': {'write_only': True}}
 
 
 
+"""相关文章，只给出跳转需要的字段"""
+class RelatedArticleSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='related.id')
+    title = serializers.CharField(source='related.title')
+    created = serializers.DateTimeField(source='related.created')
+
+    class Meta:
+        model = RelatedArticle
+        fields = ['id', 'title', 'created', 'score']
+
+
 """继承的父类是 ArticleBaseSerializer"""
 class ArticleDetailSerializer(ArticleBaseSerializer):
     # 渲染后的正文
     body_html = serializers.SerializerMethodField()
     # 渲染后的目录
     toc_html = serializers.SerializerMethodField()
-    # 让评论通过文章接口显示出来
     id = serializers.IntegerField(read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    # 让最新的一页评论通过文章接口显示出来，和 /api/comment/?article=<id> 的第一页一致，
+    # 其余的（包括归档的旧评论）从 comments_next 接着翻页
+    comments = serializers.SerializerMethodField()
+    # 评论总数，归档的评论也算
+    comments_count = serializers.SerializerMethodField()
+    comments_next = serializers.SerializerMethodField()
+    # 浏览数 = 数据库中的值 + 本进程还没写回的部分
+    views = serializers.SerializerMethodField()
+
+    # 预先算好的相关文章，一次走索引的查询
+    related = serializers.SerializerMethodField()
+
+    def get_comments(self, obj):
+        size = api_settings.PAGE_SIZE
+        # 批量获取时已经一起取出了
+        hot = obj.comments.all() if 'comments' in getattr(obj, '_prefetched_objects_cache', {}) \
+            else obj.comments.select_related('author', 'parent__author')
+        comments = list(hot[:size])
+        # 评论表里不满一页、又有归档的评论时，和评论列表一样接着读归档表
+        if len(comments) < size and self.get_comments_count(obj) > len(comments):
+            comments += attach_parents(list(obj.archived_comments.select_related('author')[:size - len(comments)]))
+        return serialize_comments(comments, self.context)
+
+    def get_comments_count(self, obj):
+        # 详情和批量获取的查询集里已经用子查询算好了，见 ArticleViewSet.get_queryset()
+        if not hasattr(obj, 'comment_count'):
+            obj.comment_count = Article.objects.filter(pk=obj.pk).annotate(
+                n=comment_count()
+            ).values_list('n', flat=True).get()
+        return obj.comment_count
+
+    def get_comments_next(self, obj):
+        if self.get_comments_count(obj) <= api_settings.PAGE_SIZE:
+            return None
+        url = '{}?article={}'.format(reverse('comment-list'), obj.pk)
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return replace_query_param(url, 'page', 2)
+
+    def get_views(self, obj):
+        return obj.views + view_counter.pending(obj.pk)
+
+    def get_related(self, obj):
+        if 'related_entries' in getattr(obj, '_prefetched_objects_cache', {}):
+            # 批量获取时已经一起取出了
+            return RelatedArticleSerializer(obj.related_entries.all(), many=True).data
+        entries = RelatedArticle.objects.filter(article=obj).select_related('related').only(
+            'score', 'related__id', 'related__title', 'related__created'
+        )
+        return RelatedArticleSerializer(entries, many=True).data
 
     def get_body_html(self, obj):
         return obj.get_md()[0]
@@ -222,6 +316,44 @@ class ArticleDetailSerializer(ArticleBaseSerializer):
 
     class Meta:
         model = Article
-        fields = '__all__'
+        exclude = ['rendered_body', 'rendered_toc', 'render_version']
+
+
+"""批量管理文章的筛选条件，至少给出一个，见 article/moderation.py"""
+class ArticleModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    # 作者的用户名
+    author = serializers.CharField(required=False)
+    category = serializers.IntegerField(required=False)
+    title_contains = serializers.CharField(required=False, min_length=2)
+    # 批量修改时改成的分类，null 表示清空分类
+    category_id = serializers.IntegerField(required=False, allow_null=True)
+
+    filters = {
+        'ids': 'pk__in',
+        'author': 'author__username',
+        'category': 'category_id',
+        'title_contains': 'title__icontains',
+    }
 
+    def validate_category_id(self, value):
+        if value is not None and not Category.objects.filter(id=value).exists():
+            raise serializers.ValidationError('Category with id {} not exists.'.format(value))
+        return value
+
+    def validate(self, attrs):
+        if not any(name in attrs for name in self.filters):
+            raise serializers.ValidationError('At least one of {} is required.'.format(', '.join(self.filters)))
+        return attrs
 
+    def filter(self, queryset):
+        return queryset.filter(**{
+            lookup: self.validated_data[name] for name, lookup in self.filters.items() if name in self.validated_data
+        })
+
+
+"""按月归档的序列化器"""
+class ArchiveMonthSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchiveMonth
+        fields = ['year', 'month', 'count']
@@ -0,0 +1,99 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from article.counters import view_counter
+from article.models import Article, ArchiveMonth
+from article.rendering import RENDER_VERSION
+from article.tasks import refresh_article_hot_scores, refresh_related_articles, render_article
+from comment.archive import is_archiving
+from comment.models import Comment
+from comment.moderation import is_bulk_deleting
+
+
+"""按月归档的计数在这里维护：新建 +1，删除 -1，创建时间跨月修改时从旧月份挪到新月份"""
+@receiver(post_save, sender=Article)
+def update_archive_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    loaded = getattr(instance, '_loaded_values', {})
+    old_created = loaded.get('created')
+
+    if created:
+        ArchiveMonth.adjust(instance.created, 1)
+    elif old_created is not None and ArchiveMonth.bucket_of(old_created) != ArchiveMonth.bucket_of(instance.created):
+        ArchiveMonth.adjust(old_created, -1)
+        ArchiveMonth.adjust(instance.created, 1)
+
+    # 同一个实例再次保存时，以这次保存的值为准
+    instance._loaded_values = dict(loaded, created=instance.created)
+
+
+@receiver(post_delete, sender=Article)
+def update_archive_on_delete(sender, instance, **kwargs):
+    # 批量删除按月汇总后一次更新，见 article/moderation.py
+    if is_bulk_deleting():
+        return
+    ArchiveMonth.adjust(instance.created, -1)
+
+
+"""正文改动后在后台重新渲染，请求里不用等渲染完成（还没渲染完时 get_md() 会当场渲染）"""
+@receiver(post_save, sender=Article)
+def render_on_save(sender, instance, raw=False, **kwargs):
+    if not raw and instance.render_version != RENDER_VERSION:
+        render_article.delay(pk=instance.pk, dedupe_key='render:{}'.format(instance.pk))
+
+
+"""评论增删、浏览数写回之后在后台重算相关文章的热度分"""
+def rank_later(article_id):
+    refresh_article_hot_scores.delay(pks=[article_id], dedupe_key='hot:{}'.format(article_id))
+
+
+@receiver(post_save, sender=Comment)
+def rank_on_comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rank_later(instance.article_id)
+
+
+@receiver(post_delete, sender=Comment)
+def rank_on_comment_deleted(sender, instance, **kwargs):
+    if is_archiving() or is_bulk_deleting():
+        return
+    # 文章被删除时级联删除的评论也会走到这里，文章已不存在，重算时什么也不更新
+    rank_later(instance.article_id)
+
+
+def rank_on_views_flushed(pending):
+    refresh_article_hot_scores.delay(pks=list(pending))
+
+
+view_counter.listeners.append(rank_on_views_flushed)
+
+
+"""标签、分类、标题或正文改动后在后台增量更新相关文章"""
+def relate_later(pk):
+    refresh_related_articles.delay(pk=pk, dedupe_key='related:{}'.format(pk))
+
+
+@receiver(post_save, sender=Article)
+def relate_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or any(
+        name in loaded and getattr(instance, name) != loaded[name]
+        for name in ('title', 'body', 'category_id')
+    ):
+        relate_later(instance.pk)
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def relate_on_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        relate_later(instance.pk)
+    elif pk_set:
+        # 从标签一侧增删文章，例如 tag.articles.add(...)
+        for pk in pk_set:
+            relate_later(pk)
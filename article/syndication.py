@@ -0,0 +1,159 @@
+from functools import wraps
+
+from django.contrib.sitemaps import Sitemap
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.feedgenerator import Atom1Feed
+from django.views.decorators.http import condition
+
+from article.models import Article
+from article.rendering import RENDER_VERSION
+from sync.models import ChangeLog
+
+"""
+RSS/Atom 订阅和 sitemap。
+
+整份输出按文章的版本号缓存，版本号直接从数据库算出：文章最大的修改时间，
+加上变更记录里最新一条文章记录的 id（见 sync/models.py，删除文章也会写一条）。
+新增、修改、删除文章都会让版本号变化，缓存键随之改变，旧的输出不会再被用到。
+每个 worker 进程、后台任务进程算出的版本号都一样，不依赖共享的缓存；
+缓存只存输出本身，进程内的 LocMem 也不会返回过期的内容，只是每个进程各自生成一次。
+最大修改时间走 article_updated_idx，变更记录从主键的末尾往回找，每个请求只算一次，多两条很便宜的查询。
+版本号同时作为 ETag，配合 Last-Modified 支持条件请求，内容没变时直接返回 304。
+
+订阅里的每篇文章是一个单独缓存的片段，键里带着文章的修改时间，
+整份订阅重新生成时只有改过的文章会重新读取正文，正文直接使用存好的渲染结果（Article.get_md）。
+sitemap 每条只有地址和修改时间，从一条只取 id、updated 的查询生成；
+使用 Django 自带的分页：每页最多 50000 条（协议上限），超过后由 sitemap.xml 索引各页。
+"""
+
+SYNDICATION_CACHE_TIMEOUT = 24 * 3600
+FEED_SIZE = 20
+
+
+def syndication_state(request=None):
+    """返回 (版本号, 最后修改时间)，没有文章也没有变更记录时最后修改时间为 None；结果记在 request 上"""
+    state = getattr(request, '_syndication_state', None)
+    if state is not None:
+        return state
+
+    updated = Article.objects.aggregate(updated=Max('updated'))['updated']
+    change = ChangeLog.objects.filter(model='article').order_by('-id').values_list('id', 'changed').first()
+    change_id, changed = change or (0, None)
+    # 删掉最新的文章后最大修改时间会变小，删除的变更记录保证最后修改时间不往回走
+    last_modified = max(filter(None, [updated, changed]), default=None)
+    version = '{}-{}'.format(int(updated.timestamp() * 1000000) if updated else 0, change_id)
+    state = version, last_modified
+    if request is not None:
+        request._syndication_state = state
+    return state
+
+
+def articles_etag(request=None, *args, **kwargs):
+    return syndication_state(request)[0]
+
+
+def articles_last_modified(request=None, *args, **kwargs):
+    return syndication_state(request)[1]
+
+
+def cached_by_last_modified(view):
+    """按文章版本号缓存整份响应，并处理条件请求"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        version = syndication_state(request)[0]
+        key = 'syndication:{}:{}:{}'.format(request.get_host(), request.get_full_path(), version)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        # sitemap 视图按条目算出的 Last-Modified 在删掉最新的文章后会变小，统一用上面的版本时间
+        if response.has_header('Last-Modified'):
+            del response['Last-Modified']
+        if response.status_code == 200:
+            cache.set(key, (response.content, response['Content-Type']), SYNDICATION_CACHE_TIMEOUT)
+        return response
+
+    return condition(etag_func=articles_etag, last_modified_func=articles_last_modified)(wrapped)
+
+
+def feed_fragments(articles):
+    """每篇文章在订阅中的内容，按 (id, 修改时间) 缓存，只有改过的文章重新读取正文"""
+    keys = {
+        'syndication:item:{}:{}:{}'.format(pk, updated.timestamp(), RENDER_VERSION): pk
+        for pk, updated in articles
+    }
+    fragments = cache.get_many(list(keys))
+    missing = {pk: key for key, pk in keys.items() if key not in fragments}
+    if missing:
+        fresh = {}
+        for article in Article.objects.filter(pk__in=list(missing)).select_related('author'):
+            fresh[missing[article.pk]] = {
+                'title': article.title,
+                'description': article.get_md()[0],
+                'link': article.get_absolute_url(),
+                'pubdate': article.created,
+                'updateddate': article.updated,
+                'author_name': article.author.username if article.author else None,
+            }
+        cache.set_many(fresh, SYNDICATION_CACHE_TIMEOUT)
+        fragments.update(fresh)
+    # 生成期间被删掉的文章不在结果里
+    return [fragments[key] for key in keys if key in fragments]
+
+
+class LatestArticlesFeed(Feed):
+    """最新文章的 RSS"""
+    title = 'drf-vue-blog'
+    link = '/'
+    description = '最新发布的文章'
+
+    def items(self):
+        return feed_fragments(Article.objects.values_list('id', 'updated')[:FEED_SIZE])
+
+    def item_title(self, item):
+        return item['title']
+
+    def item_description(self, item):
+        return item['description']
+
+    def item_link(self, item):
+        return item['link']
+
+    def item_pubdate(self, item):
+        return item['pubdate']
+
+    def item_updateddate(self, item):
+        return item['updateddate']
+
+    def item_author_name(self, item):
+        return item['author_name']
+
+
+class AtomArticlesFeed(LatestArticlesFeed):
+    """最新文章的 Atom"""
+    feed_type = Atom1Feed
+    subtitle = LatestArticlesFeed.description
+
+
+class ArticleSitemap(Sitemap):
+    changefreq = 'weekly'
+    # sitemap 协议规定单个文件最多 50000 条
+    limit = 50000
+
+    def items(self):
+        return Article.objects.only('id', 'updated').order_by('pk')
+
+    def lastmod(self, item):
+        return item.updated
+
+
+sitemaps = {
+    'article': ArticleSitemap,
+}
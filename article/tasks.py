@@ -0,0 +1,25 @@
+from article.models import Article
+from article.ranking import refresh_hot_scores
+from article.related import refresh_related
+from task_queue.queue import task
+
+"""写文章、评论之后的后台任务，由 article/signals.py 入队，python manage.py run_jobs 执行"""
+
+
+@task(name='article.render', concurrency=2)
+def render_article(pk):
+    # get_md() 发现渲染结果过期时会重新渲染并写回
+    article = Article.objects.filter(pk=pk).first()
+    if article is not None:
+        article.get_md()
+
+
+# 更新相关文章时会改其他文章的列表，同时只执行一个，避免互相覆盖
+@task(name='article.refresh_related', concurrency=1)
+def refresh_related_articles(pk):
+    refresh_related(pk)
+
+
+@task(name='article.refresh_hot_scores')
+def refresh_article_hot_scores(pks):
+    refresh_hot_scores(pks)
@@ -1,3 +1,927 @@
-from django.test import TestCase
+import fcntl
+import gc
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, QuerySet
+from django.db.models.functions import Lower
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from markdown import Markdown
+from markdown.extensions import fenced_code
+from markdown.extensions.codehilite import CodeHilite
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from article import highlight, ranking, related, rendering, uploads
+from article.counters import view_counter
+from article.management.commands.explain_endpoints import Command as ExplainCommand
+from article.moderation import update_articles
+from article.models import ArchiveMonth, Article, Avatar, AvatarUpload, Category, RelatedArticle, Tag
+from article.rendering import RENDER_VERSION, render_full, render_markdown, split_blocks
+from article.views import HotCursorPagination
+from comment.models import ArchivedComment, Comment
+from drf_vue_blog.chunked import chunked
+from drf_vue_blog.counting import EstimatedCountPaginator, estimate_count, is_unfiltered
+from drf_vue_blog.profiling import ProfilingMiddleware
+from drf_vue_blog.sqlite.base import DatabaseWrapper
+from drf_vue_blog.sqlite.writer import GroupCommitWriter, PendingWrite
+from drf_vue_blog.warmup import warmup
+
+
+class ArchiveMonthTests(TestCase):
+    """归档表的计数要和文章表保持一致"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('archiver', password='pw')
+
+    def at(self, year, month):
+        return timezone.make_aware(datetime(year, month, 15, 12))
+
+    def counts(self):
+        return {(m.year, m.month): m.count for m in ArchiveMonth.objects.all()}
+
+    def test_create_delete_and_move_between_months(self):
+        jan = Article.objects.create(title='a', body='x', author=self.author, created=self.at(2024, 1))
+        Article.objects.create(title='b', body='x', author=self.author, created=self.at(2024, 1))
+        feb = Article.objects.create(title='c', body='x', author=self.author, created=self.at(2024, 2))
+        self.assertEqual(self.counts(), {(2024, 1): 2, (2024, 2): 1})
+
+        # 同一个月内改日期不动计数，跨月时从旧月份挪到新月份
+        jan.created = self.at(2024, 1).replace(day=20)
+        jan.save()
+        self.assertEqual(self.counts(), {(2024, 1): 2, (2024, 2): 1})
+        jan.created = self.at(2024, 3)
+        jan.save()
+        self.assertEqual(self.counts(), {(2024, 1): 1, (2024, 2): 1, (2024, 3): 1})
+
+        # 计数归零的月份删掉
+        feb.delete()
+        self.assertEqual(self.counts(), {(2024, 1): 1, (2024, 3): 1})
+
+        # 和全量重建的结果一致
+        expected = self.counts()
+        ArchiveMonth.rebuild()
+        self.assertEqual(self.counts(), expected)
+
+    def test_month_endpoint_pages_articles(self):
+        Article.objects.create(title='a', body='x', author=self.author, created=self.at(2024, 1))
+        Article.objects.create(title='b', body='x', author=self.author, created=self.at(2024, 2))
+
+        response = APIClient().get('/api/archive/')
+        self.assertEqual([(m['year'], m['month'], m['count']) for m in response.data], [(2024, 2, 1), (2024, 1, 1)])
+        response = APIClient().get('/api/archive/2024/1/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['title'], 'a')
+        self.assertEqual(APIClient().get('/api/archive/2024/13/').status_code, 404)
+
+
+class ExplainEndpointsTests(TestCase):
+    def test_reports_endpoints_and_flags_scans(self):
+        author = User.objects.create_user('explainer', password='pw')
+        article = Article.objects.create(title='a', body='x', author=author)
+        out = io.StringIO()
+        call_command('explain_endpoints', '--path', '/api/article/?username=explainer', '--verbose-plans', stdout=out)
+        output = out.getvalue()
+
+        # 回放的请求写下的渲染结果被回滚，浏览数也没有留在内存里等着写回
+        self.assertEqual(Article.objects.values_list('render_version', 'views').get(pk=article.pk), (0, 0))
+        self.assertEqual(view_counter.pending(article.pk), 0)
+
+        self.assertIn('GET /api/article/ -> 200', output)
+        self.assertRegex(output, r'GET /api/article/\d+/ -> 200')
+        # 按作者过滤、按时间倒序走复合索引，不再全表扫描加临时排序
+        self.assertIn('article_author_created_idx', output)
+        self.assertRegex(output, r'\d+ problem\(s\) found.')
+
+    def test_problem_detection(self):
+        command = ExplainCommand()
+        self.assertEqual(command.problems(['SCAN article_article USING INDEX article_created_idx']), [])
+        self.assertEqual(len(command.problems(['SCAN article_article', 'USE TEMP B-TREE FOR ORDER BY'])), 2)
+
+
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('renderer', password='pw')
+
+    def stored(self, article):
+        return Article.objects.values_list('render_version', 'rendered_body').get(pk=article.pk)
+
+    def test_get_md_renders_once_and_writes_back(self):
+        article = Article.objects.create(title='a', body='# Title\n\ntext', author=self.author)
+        self.assertEqual(self.stored(article)[0], 0)
+
+        html, toc = Article.objects.get(pk=article.pk).get_md()
+        self.assertEqual(self.stored(article), (RENDER_VERSION, html))
+        # 之后的读取直接用存好的结果，不再渲染也不再写
+        fresh = Article.objects.get(pk=article.pk)
+        with mock.patch('article.models.render_markdown') as render, self.assertNumQueries(0):
+            self.assertEqual(fresh.get_md(), (html, toc))
+        render.assert_not_called()
+
+        # 改了正文就过期
+        fresh.body = 'changed'
+        fresh.save()
+        self.assertEqual(self.stored(article)[0], 0)
+        self.assertIn('changed', Article.objects.get(pk=article.pk).get_md()[0])
+
+    def test_get_md_tolerates_locked_database(self):
+        article = Article.objects.create(title='a', body='text', author=self.author)
+        with mock.patch.object(QuerySet, 'update', side_effect=OperationalError('database is locked')):
+            html, _ = Article.objects.get(pk=article.pk).get_md()
+        self.assertIn('text', html)
+        self.assertEqual(self.stored(article)[0], 0)
+
+    def test_rerender_only_stale_articles(self):
+        stale = Article.objects.create(title='a', body='stale', author=self.author)
+        current = Article.objects.create(title='b', body='current', author=self.author)
+        Article.objects.get(pk=current.pk).get_md()
+        Article.objects.filter(pk=current.pk).update(rendered_body='kept')
+
+        out = io.StringIO()
+        call_command('rerender_articles', '--workers', '1', stdout=out)
+        self.assertIn('Rendering 1 article(s)', out.getvalue())
+        self.assertEqual(self.stored(stale)[0], RENDER_VERSION)
+        self.assertIn('stale', self.stored(stale)[1])
+        self.assertEqual(self.stored(current)[1], 'kept')
+
+    def test_rerender_marks_articles_edited_meanwhile_as_stale(self):
+        article = Article.objects.create(title='a', body='old', author=self.author)
+        # 读取正文的时间早于文章最后修改时间，相当于渲染期间文章又被编辑了
+        past = timezone.now() - timedelta(hours=1)
+        with mock.patch('article.management.commands.rerender_articles.timezone.now', return_value=past):
+            call_command('rerender_articles', '--workers', '1', stdout=io.StringIO())
+        self.assertEqual(self.stored(article)[0], 0)
+
+
+class BlockRenderingTests(SimpleTestCase):
+    """分块渲染的结果必须和整篇渲染完全一致"""
+
+    documents = {
+        'headers': '# Intro\n\nText.\n\n## Intro\n\nMore text.\n\n# Intro\n\n### Deep\n\n## Back',
+        'chinese_headers': '# 第一章\n\n正文\n\n# 第二章\n\n## 小节\n\n正文\n\n# 第一章',
+        'setext': 'Title\n=====\n\nPara\n\nSub\n---\n\n---\n\n* * *',
+        'fenced_code': (
+            '# Code\n\n```python\ndef f():\n\n    return 1\n```\n\ntext\n\n'
+            '~~~\nno language here\n\nstill code\n~~~\n\n```js\nconsole.log(1)\n```'
+        ),
+        'html_in_code': '```html\n<div id="x">\n\n</div>\n```\n\nafter',
+        'indented_code': 'para\n\n    indented code\n\n    more code\n\nafter',
+        'loose_list': '- one\n\n- two\n\n    continued\n\n- three\n\npara\n\n1. a\n\n2. b',
+        'nested_list': '* a\n    * b\n        * c\n\n* d',
+        'blockquote': '> quote one\n\n> quote two\n\nnormal',
+        'table': '| a | b |\n|---|---|\n| 1 | 2 |\n\n# After table',
+        'inline': '**bold** _em_ `code` [link](http://example.com) &amp; <http://example.com>',
+        'crlf': '# A\r\n\r\nline\r\n\r\n\tcode\r\n\r\n# A',
+        'empty': '',
+        'whitespace_lines': '# A\n   \npara\n\t\n# B',
+        'whitespace_only': '  \n\n',
+        'list_inside_block': '# Title\n- a\n- b\n> q\n  \n    code\n\n\n- c\n\n> d',
+        # 下面这些有跨块依赖，会退回整篇渲染
+        'footnote': 'Text[^1]\n\n# H\n\n[^1]: note',
+        'reference_link': '[x][1]\n\n[1]: http://example.com',
+        'abbreviation': 'HTML here\n\n*[HTML]: Hyper Text',
+        'toc_marker': '[TOC]\n\n# A\n\n## B',
+        'attr_list': '# A\n\n# B {#a}',
+        'def_list': 'Term\n:   Definition\n\nOther\n\n:   Second',
+        'raw_html': '<div>\n\n# not a header\n\n</div>\n\n# A',
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matches_full_render(self):
+        for name, body in self.documents.items():
+            with self.subTest(name):
+                self.assertEqual(render_markdown(body), render_full(body))
+
+    def test_matches_full_render_from_cache(self):
+        for body in self.documents.values():
+            render_markdown(body)
+        for name, body in self.documents.items():
+            with self.subTest(name):
+                self.assertEqual(render_markdown(body), render_full(body))
+
+    def test_falls_back_for_cross_block_syntax(self):
+        for name in ['footnote', 'reference_link', 'abbreviation', 'def_list', 'toc_marker', 'attr_list', 'raw_html']:
+            with self.subTest(name):
+                self.assertIsNone(split_blocks(self.documents[name]))
+
+    def test_code_fence_is_one_block(self):
+        self.assertEqual(split_blocks('```\na\n\nb\n```\n\nc'), ['```\na\n\nb\n```', 'c'])
+
+    def test_edit_renders_only_changed_block(self):
+        paragraphs = ['## Section {}\n\nParagraph {} of the article.'.format(i, i) for i in range(20)]
+        render_markdown('\n\n'.join(paragraphs))
+
+        paragraphs[7] = '## Section 7\n\nParagraph 7, edited.'
+        edited = '\n\n'.join(paragraphs)
+        with mock.patch.object(rendering, 'render_block', wraps=rendering.render_block) as render_block:
+            result = render_markdown(edited)
+
+        self.assertEqual(render_block.call_count, 1)
+        self.assertEqual(result, render_full(edited))
+
+    def test_moved_duplicate_headers_keep_document_ids(self):
+        body = '# Same\n\na\n\n# Same\n\nb'
+        render_markdown(body)
+        reordered = '# Same\n\nb\n\n# Same\n\na'
+        self.assertEqual(render_markdown(reordered), render_full(reordered))
+
+
+class HighlightCacheTests(SimpleTestCase):
+    """带缓存的高亮必须和原版 codehilite 输出一致"""
+
+    documents = [
+        '```python\nx = 1\n```',
+        '```\nint main() { return 0; }\n```',
+        '```python hl_lines="2"\na = 1\nb = 2\n```',
+        '```nosuchlang\nfoo bar\n```',
+        '    :::js\n    var a = 1;',
+        '    #!/usr/bin/python\n    print(1)',
+        '    plain indented\n    code',
+        '```{.python .extra-class hl_lines="1"}\nx = 1\n```',
+    ]
+
+    def setUp(self):
+        highlight.html_cache.clear()
+        highlight.stats.reset()
+
+    def stock_render(self, body):
+        return Markdown(extensions=['markdown.extensions.extra', 'markdown.extensions.codehilite']).convert(body)
+
+    def cached_render(self, body):
+        return Markdown(extensions=['markdown.extensions.extra', 'article.highlight:CachedCodeHiliteExtension']).convert(body)
+
+    def test_matches_stock_codehilite(self):
+        for body in self.documents:
+            with self.subTest(body):
+                self.assertEqual(self.cached_render(body), self.stock_render(body))
+                # 第二次来自缓存
+                self.assertEqual(self.cached_render(body), self.stock_render(body))
+
+    def test_repeated_blocks_hit_cache(self):
+        body = '\n\n'.join(['```python\nprint(1)\n```'] * 5)
+        self.cached_render(body)
+
+        stats = highlight.highlight_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 4)
+
+    def test_other_markdown_instances_are_untouched(self):
+        self.cached_render('```python\nx = 1\n```')
+        # 不改 markdown 库的模块，别的 Markdown 实例仍然用原版的 CodeHilite
+        self.assertIs(fenced_code.CodeHilite, CodeHilite)
+        with mock.patch.object(highlight.CachedCodeHilite, 'hilite') as hilite:
+            self.stock_render('```python\nx = 1\n```')
+        hilite.assert_not_called()
+
+
+class SyndicationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('feeder', password='pw')
+        self.old = Article.objects.create(title='old post', body='old', author=self.author)
+        self.new = Article.objects.create(title='new post', body='new', author=self.author)
+
+    def test_deleting_newest_article_does_not_serve_stale_feed(self):
+        for path in ['/feed/rss/', '/sitemap-article.xml']:
+            with self.subTest(path):
+                cache.clear()
+                first = self.client.get(path)
+                self.assertIn('/article/{}'.format(self.new.pk), first.content.decode())
+
+                Article.objects.filter(pk=self.new.pk).delete()
+                # 版本号来自数据库，缓存被清空后也不会退回到删除之前的键
+                cache.clear()
+                second = self.client.get(path)
+                self.assertNotIn('/article/{}'.format(self.new.pk), second.content.decode())
+                self.assertNotEqual(second['ETag'], first['ETag'])
+                # 最后修改时间不会退回到删掉的文章之前
+                self.assertGreaterEqual(parse_http_date(second['Last-Modified']),
+                                        parse_http_date(first['Last-Modified']))
+                self.new = Article.objects.create(title='new post', body='new', author=self.author)
+
+    def test_conditional_get(self):
+        first = self.client.get('/feed/atom/')
+        self.assertEqual(self.client.get('/feed/atom/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        self.old.title = 'edited'
+        self.old.save()
+        response = self.client.get('/feed/atom/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('edited', response.content.decode())
+
+    def test_version_comes_from_the_database(self):
+        first = self.client.get('/feed/rss/')
+        # 别的进程（例如 run_jobs）改了文章，这个进程的缓存里没有任何通知
+        Article.objects.filter(pk=self.old.pk).update(title='edited elsewhere', updated=timezone.now())
+        second = self.client.get('/feed/rss/')
+        self.assertIn('edited elsewhere', second.content.decode())
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/feed/rss/', HTTP_IF_NONE_MATCH=second['ETag']).status_code, 304)
+
+    def test_regenerating_feed_reads_only_changed_articles(self):
+        self.client.get('/feed/rss/')
+        self.old.title = 'edited'
+        self.old.save()
+
+        with mock.patch.object(Article, 'get_md', autospec=True, return_value=('<p>x</p>', '')) as get_md:
+            response = self.client.get('/feed/rss/')
+        self.assertIn('edited', response.content.decode())
+        self.assertEqual([call.args[0].pk for call in get_md.call_args_list], [self.old.pk])
+
+
+@override_settings(ARTICLE_VIEW_COUNTER={'FLUSH_THRESHOLD': 1, 'FLUSH_INTERVAL': 3600})
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        view_counter.reset()
+        self.article = Article.objects.create(title='a', body='x', author=User.objects.create_user('viewer'))
+
+    def tearDown(self):
+        view_counter.reset()
+
+    def views(self):
+        return Article.objects.values_list('views', flat=True).get(pk=self.article.pk)
+
+    def test_failed_write_back_does_not_break_the_request(self):
+        locked = OperationalError('database is locked')
+        with mock.patch.object(QuerySet, 'update', side_effect=locked), \
+                self.assertLogs('article.counters', 'WARNING'):
+            response = self.client.get('/api/article/{}/'.format(self.article.pk))
+        self.assertEqual(response.status_code, 200)
+        # 没写进去的浏览数留在缓冲里，接口照常显示
+        self.assertEqual(self.views(), 0)
+        self.assertEqual(view_counter.pending(self.article.pk), 1)
+        self.assertEqual(response.data['views'], 1)
+
+        self.client.get('/api/article/{}/'.format(self.article.pk))
+        self.assertEqual(self.views(), 2)
+        self.assertEqual(view_counter.pending(self.article.pk), 0)
+
+    def test_timer_and_exit_flush_raise(self):
+        locked = OperationalError('database is locked')
+        with mock.patch.object(QuerySet, 'update', side_effect=locked), self.assertLogs('article.counters'):
+            view_counter.incr(self.article.pk)
+            with self.assertRaises(OperationalError):
+                view_counter.flush()
+        self.assertEqual(view_counter.pending(self.article.pk), 1)
+        view_counter.flush()
+        self.assertEqual(self.views(), 1)
+
+
+class HotRankingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('ranker', password='pw')
+        self.now = timezone.now()
+
+    def score(self, article):
+        return Article.objects.values_list('hot_score', flat=True).get(pk=article.pk)
+
+    def comment(self, article, **kwargs):
+        return Comment.objects.create(article=article, author=self.author, content='x', **kwargs)
+
+    def test_hot_list_orders_by_score_and_pages_with_cursor(self):
+        articles = [
+            Article.objects.create(title=str(i), body='x', author=self.author, created=self.now - timedelta(hours=i))
+            for i in range(12)
+        ]
+        # 旧一些但评论多的文章排到前面，分数相同时按 id 倒序
+        for _ in range(3):
+            self.comment(articles[11])
+        ranking.refresh_hot_scores([article.pk for article in articles])
+
+        first = self.client.get('/api/article/hot/').data
+        self.assertEqual(len(first['results']), HotCursorPagination.page_size)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        self.assertIsNone(second['next'])
+
+        ids = [item['id'] for item in first['results'] + second['results']]
+        expected = list(Article.objects.order_by('-hot_score', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(ids[0], articles[11].pk)
+
+    def test_comment_created_and_deleted_refresh_the_score(self):
+        article = Article.objects.create(title='a', body='x', author=self.author, created=self.now)
+        base = self.score(article)
+
+        with override_settings(TASK_QUEUE={'EAGER': True}):
+            with self.captureOnCommitCallbacks(execute=True):
+                comment = self.comment(article)
+            self.assertAlmostEqual(self.score(article), ranking.hot_score(article.created, 1, 0))
+            self.assertGreater(self.score(article), base)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                comment.delete()
+            self.assertAlmostEqual(self.score(article), base)
+
+    def test_save_and_refresh_count_archived_comments(self):
+        article = Article.objects.create(title='a', body='x', author=self.author, created=self.now)
+        self.comment(article)
+        ArchivedComment.objects.create(id=10 ** 6, article=article, author=self.author, content='x', created=self.now)
+
+        # 改了发布时间，保存时就地重算
+        article.created = self.now - timedelta(days=1)
+        article.save()
+        saved = self.score(article)
+        self.assertAlmostEqual(saved, ranking.hot_score(article.created, 2, 0))
+        ranking.refresh_hot_scores([article.pk])
+        self.assertAlmostEqual(self.score(article), saved)
+
+
+class RelatedArticleTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('relater', password='pw')
+        self.django, self.vue = Tag.objects.create(text='django'), Tag.objects.create(text='vue')
+        self.backend = Category.objects.create(title='backend')
+
+    def post(self, title, body, tags=(), category=None):
+        article = Article.objects.create(title=title, body=body, author=self.author, category=category)
+        article.tags.set(tags)
+        return article
+
+    def related(self, article):
+        return list(RelatedArticle.objects.filter(article=article).order_by('-score').values_list('related_id', 'score'))
+
+    def test_similarity_combines_tags_category_and_terms(self):
+        a = related.Features(1, frozenset({1, 2}), 7, {})
+        b = related.Features(2, frozenset({2, 3}), 7, {})
+        self.assertAlmostEqual(related.similarity(a, b), 1 / 3 + 0.3)
+
+        terms = related.term_vector('Django 信号', 'django signals receiver')
+        c = related.Features(3, frozenset(), None, terms)
+        d = related.Features(4, frozenset(), None, terms)
+        self.assertAlmostEqual(related.similarity(c, d), 1.0)
+        self.assertEqual(related.similarity(c, related.Features(5, frozenset(), None, {'rust': 1.0})), 0)
+
+    def test_build_ranks_by_similarity_and_skips_unrelated(self):
+        a = self.post('Django signals', 'django signals receiver', [self.django], self.backend)
+        b = self.post('Django models', 'django models queryset', [self.django], self.backend)
+        c = self.post('Vue router', 'vue router component', [self.vue])
+        d = self.post('Django signals again', 'django signals receiver dispatch', [self.django], self.backend)
+
+        related.build_all()
+        self.assertEqual([pk for pk, _ in self.related(a)], [d.pk, b.pk])
+        self.assertEqual(self.related(c), [])
+
+    def test_incremental_refresh_matches_full_build(self):
+        a = self.post('Django signals', 'django signals receiver', [self.django], self.backend)
+        b = self.post('Django models', 'django models queryset', [self.django], self.backend)
+        related.build_all()
+
+        d = self.post('Django signals again', 'django signals receiver dispatch', [self.django], self.backend)
+        related.refresh_related(d.pk)
+        incremental = {pk: self.related(pk) for pk in (a.pk, b.pk, d.pk)}
+
+        related.build_all()
+        for pk, rows in incremental.items():
+            with self.subTest(pk=pk):
+                self.assertEqual([r[0] for r in rows], [r[0] for r in self.related(pk)])
+                for (_, got), (_, expected) in zip(rows, self.related(pk)):
+                    self.assertAlmostEqual(got, expected)
+
+    @override_settings(RELATED_ARTICLES={'BODY_CHARS': 20})
+    def test_build_reads_only_the_head_of_the_body(self):
+        a = self.post('Django', 'django signals receiver ' + 'x' * 30 + ' rust')
+        b = self.post('Rust', 'rust ownership')
+        with CaptureQueriesContext(connection) as queries:
+            related.build_all()
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'article_article' in q['sql']]
+        self.assertTrue(selects)
+        for sql in selects:
+            # 正文只出现在 SUBSTR 里
+            self.assertNotIn('"article_article"."body"', sql.replace('SUBSTR("article_article"."body"', ''))
+        # 截断之后的词不参与相似度
+        self.assertNotIn(b.pk, [pk for pk, _ in self.related(a)])
+
+    def test_category_changes_without_save_refresh_related(self):
+        a = self.post('Django signals', 'django signals receiver', category=self.backend)
+        b = self.post('Django models', 'django models queryset', category=self.backend)
+        related.build_all()
+        before = dict(self.related(a))[b.pk]
+
+        superuser = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(superuser)
+        with override_settings(TASK_QUEUE={'EAGER': True}):
+            with self.captureOnCommitCallbacks(execute=True):
+                update_articles(Article.objects.filter(pk=a.pk), category_id=None)
+            self.assertAlmostEqual(dict(self.related(a))[b.pk], before - 0.3)
+
+            Article.objects.filter(pk=a.pk).update(category=self.backend)
+            related.build_all()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/admin/article/article/', {'action': 'clear_category', '_selected_action': [a.pk]})
+            self.assertIsNone(Article.objects.get(pk=a.pk).category_id)
+            self.assertAlmostEqual(dict(self.related(a))[b.pk], before - 0.3)
+
+
+class ChunkedIterationTests(TestCase):
+    """分块遍历的顺序、预取和内存"""
+
+    def test_keyset_order_with_duplicate_sort_values(self):
+        now = timezone.now()
+        # 分类按 -created 排序，一半的分类创建时间相同，靠主键区分先后
+        Category.objects.bulk_create(
+            Category(title=str(i), created=now - timedelta(seconds=i // 2)) for i in range(25)
+        )
+        expected = list(Category.objects.values_list('pk', flat=True).order_by('-created', '-pk'))
+        chunks = list(chunked(Category.objects.all(), chunk_size=4))
+        self.assertEqual([c.pk for chunk in chunks for c in chunk], expected)
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+
+    def test_prefetch_runs_per_chunk(self):
+        user = User.objects.create_user('chunk')
+        tag = Tag.objects.create(text='t')
+        for i in range(6):
+            Article.objects.create(title=str(i), body='x', author=user).tags.add(tag)
+
+        with self.assertNumQueries(7):
+            # 3 块，每块一次查询文章、一次预取标签；最后一块是满的，还要再查一次才知道没有下一块
+            for chunk in chunked(Article.objects.prefetch_related('tags'), chunk_size=2):
+                self.assertTrue(all(a.tags.all()[0] == tag for a in chunk))
+
+    def stream_peak(self, total):
+        Tag.objects.all().delete()
+        Tag.objects.bulk_create(Tag(text='tag-{}'.format(i)) for i in range(total))
+
+        response = self.client.get('/api/tag/')
+        tracemalloc.start()
+        try:
+            size = 0
+            for part in response.streaming_content:
+                size += len(part)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, total * 10)
+        return peak
+
+    def test_streamed_list_memory_stays_flat(self):
+        small = self.stream_peak(1000)
+        large = self.stream_peak(8000)
+        # 行数变成 8 倍，峰值内存只取决于块的大小
+        self.assertLess(large, small * 1.5)
+
+
+class EstimatedCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('counter')
+        self.articles = [Article.objects.create(title=str(i), body='x', author=self.author) for i in range(5)]
+        # SQLite 上用 MAX(id) 估计总数，删掉中间的一篇后估计值偏大
+        self.articles[1].delete()
+
+    def test_only_whole_table_queries_use_the_table_estimate(self):
+        self.assertTrue(is_unfiltered(Article.objects.all()))
+        self.assertTrue(is_unfiltered(Article.objects.annotate(lower=Lower('title'))))
+
+        for i, queryset in enumerate([
+            Article.objects.filter(title='0'),
+            Article.objects.values('author_id').annotate(n=Count('pk')),
+            Article.objects.annotate(comment_count=Count('comments')),
+            Article.objects.order_by().union(Article.objects.order_by()),
+        ]):
+            with self.subTest(i=i):
+                self.assertFalse(is_unfiltered(queryset))
+
+        with self.settings(COUNTING={'ESTIMATE_THRESHOLD': 1}):
+            grouped = Article.objects.order_by().values('author_id').annotate(n=Count('pk'))
+            self.assertEqual(estimate_count(grouped), (1, False))
+
+    def test_paginator_pages_past_an_estimated_count(self):
+        with self.settings(COUNTING={'ESTIMATE_THRESHOLD': 3}):
+            paginator = EstimatedCountPaginator(Article.objects.order_by('id'), 2)
+            self.assertEqual(paginator.count, 5)
+            self.assertTrue(paginator.approximate)
+
+            page = paginator.page(2)
+            self.assertEqual([a.title for a in page], ['3', '4'])
+            # 按有没有多取到一条判断，而不是按估计的总数
+            self.assertFalse(page.has_next())
+            with self.assertRaises(EmptyPage):
+                paginator.page(3)
+
+            self.assertEqual(EstimatedCountPaginator(Article.objects.order_by('id'), 2, exact=True).count, 4)
+
+    def test_count_approximate_in_api_responses(self):
+        client = APIClient()
+        with self.settings(COUNTING={'ESTIMATE_THRESHOLD': 3}):
+            response = client.get('/api/article/')
+            self.assertEqual((response.data['count'], response.data['count_approximate']), (5, True))
+            response = client.get('/api/article/', {'exact_count': '1'})
+            self.assertEqual((response.data['count'], response.data['count_approximate']), (4, False))
+            # 有过滤条件时精确计数
+            response = client.get('/api/article/', {'search': '3'})
+            self.assertEqual((response.data['count'], response.data['count_approximate']), (1, False))
+
+
+class HomeViewTests(TestCase):
+    def test_page_links_point_at_the_article_list(self):
+        author = User.objects.create_user('home')
+        # 默认每页 5 篇
+        Article.objects.bulk_create(Article(title=str(i), body='x', author=author) for i in range(6))
+
+        articles = APIClient().get('/api/home/').data['articles']
+        self.assertEqual(articles['next'], 'http://testserver/api/article/?page=2')
+        self.assertIsNone(articles['previous'])
+        self.assertEqual(len(APIClient().get(articles['next']).data['results']), 1)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        cache.clear()
+
+    def test_middleware_is_removed_when_disabled(self):
+        with override_settings(REQUEST_PROFILING={'ENABLED': False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_profile_detail_does_not_expose_server_paths(self):
+        admin = User.objects.create_superuser('profiler', password='pw')
+        client = APIClient(HTTP_AUTHORIZATION='Bearer {}'.format(RefreshToken.for_user(admin).access_token))
+
+        with override_settings(REQUEST_PROFILING={'ENABLED': True, 'DIR': self.directory}):
+            profile_id = client.get('/api/article/', HTTP_X_PROFILE='1')['X-Profile-Id']
+            response = client.get('/api/profiles/{}/'.format(profile_id))
+        self.assertEqual(response.data['path'], '/api/article/')
+        self.assertEqual(response.data['profile_file'], '{}/profile.prof'.format(profile_id))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, response.data['profile_file'])))
+        self.assertNotIn(self.directory, response.content.decode())
+
+
+class WarmupTests(SimpleTestCase):
+    def test_warmup_builds_everything_without_touching_the_database(self):
+        self.addCleanup(gc.unfreeze)
+        # SimpleTestCase 里执行任何查询都会报错
+        with mock.patch('drf_vue_blog.warmup.connections.close_all') as close_all:
+            self.assertGreater(warmup(), 0)
+        close_all.assert_called_once_with()
+        self.assertGreater(gc.get_freeze_count(), 0)
+        for module in ('pygments.lexers.python', 'pygments.lexers.javascript', 'rest_framework_simplejwt.authentication'):
+            with self.subTest(module=module):
+                self.assertIn(module, sys.modules)
+
+
+class SQLiteWriteTests(TestCase):
+    locked = OperationalError('database is locked')
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.lock_path = os.path.join(self.tmp, 'writer.lock')
+
+    def file_connection(self):
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(self.tmp, 'db.sqlite3')},
+                                  alias='sqlite_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def lock_is_free(self):
+        fd = os.open(self.lock_path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def begin(self, wrapper, *results):
+        cursor = mock.Mock(**{'execute.side_effect': results})
+        with mock.patch.object(wrapper, 'cursor', return_value=cursor), \
+                mock.patch('drf_vue_blog.sqlite.base.time.sleep') as sleep:
+            try:
+                wrapper._start_transaction_under_autocommit()
+            finally:
+                self.attempts = cursor.execute.call_count
+                self.sleeps = [call.args[0] for call in sleep.call_args_list]
+
+    def test_lock_errors_are_retried_with_growing_backoff(self):
+        wrapper = self.file_connection()
+        with self.settings(SQLITE_WRITES={'RETRIES': 3, 'BACKOFF': 0.1}):
+            self.begin(wrapper, self.locked, self.locked, None)
+            self.assertEqual(self.attempts, 3)
+            self.assertTrue(0.05 <= self.sleeps[0] <= 0.15 and 0.1 <= self.sleeps[1] <= 0.3)
+
+            with self.assertRaises(OperationalError):
+                self.begin(wrapper, self.locked, self.locked, self.locked, self.locked)
+            self.assertEqual(self.attempts, 4)
+
+            # 不是锁冲突的错误不重试
+            with self.assertRaises(OperationalError):
+                self.begin(wrapper, OperationalError('disk I/O error'), None)
+            self.assertEqual(self.attempts, 1)
+
+    def test_total_wait_is_bounded(self):
+        wrapper = self.file_connection()
+        with self.settings(SQLITE_WRITES={'RETRIES': 5, 'BACKOFF': 0.1, 'MAX_WAIT': 0}):
+            with self.assertRaises(OperationalError):
+                self.begin(wrapper, self.locked, None)
+        self.assertEqual((self.attempts, self.sleeps), (1, []))
+
+    def test_writer_lock_is_released_on_rollback_and_failed_begin(self):
+        wrapper = self.file_connection()
+        with self.settings(SQLITE_WRITES={'WRITER_LOCK': self.lock_path, 'RETRIES': 0}):
+            wrapper.ensure_connection()
+            wrapper._start_transaction_under_autocommit()
+            self.assertTrue(wrapper.writer_locked)
+            self.assertFalse(self.lock_is_free())
+            wrapper._rollback()
+            self.assertTrue(self.lock_is_free())
+
+            with self.assertRaises(OperationalError):
+                self.begin(wrapper, self.locked)
+            self.assertFalse(wrapper.writer_locked)
+            self.assertTrue(self.lock_is_free())
+
+    def batch(self, *funcs):
+        items = [PendingWrite(func, (), {}) for func in funcs]
+        GroupCommitWriter().commit(items)
+        self.assertTrue(all(item.done.is_set() for item in items))
+        return items
+
+    @staticmethod
+    def create_tag(text, fail=False):
+        def write():
+            tag = Tag.objects.create(text=text)
+            if fail:
+                raise ValueError(text)
+            return tag
+        return write
+
+    def test_group_commit_rolls_back_only_the_failed_item(self):
+        ok, failed, later = self.batch(self.create_tag('a'), self.create_tag('b', fail=True), self.create_tag('c'))
+        self.assertEqual(sorted(Tag.objects.values_list('text', flat=True)), ['a', 'c'])
+        self.assertEqual((ok.result.text, ok.error, later.result.text), ('a', None, 'c'))
+        self.assertIsInstance(failed.error, ValueError)
+
+    def test_failed_batch_commit_fails_every_item(self):
+        real_atomic = transaction.atomic
+        outer = []
+
+        @contextmanager
+        def failing_commit():
+            with real_atomic():
+                yield
+                raise OperationalError('disk I/O error')
+
+        def atomic(*args, **kwargs):
+            # 只让最外层的整批事务在提交时失败
+            if not outer:
+                outer.append(True)
+                return failing_commit()
+            return real_atomic(*args, **kwargs)
+
+        with mock.patch('drf_vue_blog.sqlite.writer.transaction.atomic', side_effect=atomic), \
+                mock.patch('drf_vue_blog.sqlite.writer.connection.close') as close:
+            items = self.batch(self.create_tag('a'), self.create_tag('b', fail=True))
+        close.assert_called_once_with()
+        self.assertFalse(Tag.objects.exists())
+        self.assertEqual(str(items[0].error), 'disk I/O error')
+        self.assertIsNone(items[0].result)
+        # 自己已经失败的写操作保留原来的异常
+        self.assertIsInstance(items[1].error, ValueError)
+
+    def test_timed_out_write_is_skipped_or_awaited(self):
+        abandoned, kept = PendingWrite(self.create_tag('a'), (), {}), PendingWrite(self.create_tag('b'), (), {})
+        self.assertTrue(abandoned.abandon())
+        GroupCommitWriter().commit([abandoned, kept])
+        # 请求线程已经报错的写操作，写线程不再执行
+        self.assertEqual(list(Tag.objects.values_list('text', flat=True)), ['b'])
+        self.assertEqual(kept.result.text, 'b')
+
+        started = PendingWrite(self.create_tag('c'), (), {})
+        self.assertTrue(started.claim())
+        self.assertFalse(started.abandon())
+
+        writer = GroupCommitWriter()
+        with self.settings(SQLITE_WRITES={'BATCH': True, 'BATCH_TIMEOUT': 0}), \
+                mock.patch.object(writer, 'queue') as pending, \
+                mock.patch('drf_vue_blog.sqlite.writer.connection', in_atomic_block=False):
+            with self.assertRaises(OperationalError):
+                writer.run(self.create_tag('d'))
+            item = pending.return_value.put.call_args.args[0]
+        writer.commit([item])
+        self.assertFalse(Tag.objects.filter(text='d').exists())
+
+
+class AvatarUploadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        settings = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp, 'media'),
+            AVATAR_UPLOAD={'DIR': os.path.join(self.tmp, 'uploads'), 'MAX_SIZE': 1024 * 1024},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'red').save(buffer, 'PNG')
+        self.data = buffer.getvalue()
+
+    def start(self, data, **extra):
+        response = self.client.post('/api/avatar-upload/', {
+            'filename': 'a.png', 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest(), **extra,
+        })
+        self.assertEqual(response.status_code, 201)
+        return '/api/avatar-upload/{}/'.format(response.data['id'])
+
+    def send(self, url, offset, chunk):
+        return self.client.generic(
+            'PATCH', url, chunk, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_resumed_upload_creates_avatar(self):
+        url = self.start(self.data)
+        half = len(self.data) // 2
+        self.assertEqual(self.send(url, 0, self.data[:half]).data['offset'], half)
+
+        # 偏移量对不上的分块被拒绝，断线后按服务器记录的 offset 续传
+        self.assertEqual(self.send(url, 0, self.data[:half]).status_code, 409)
+        self.assertEqual(self.client.get(url)['Upload-Offset'], str(half))
+        self.assertEqual(self.send(url, half, self.data[half:]).data['offset'], len(self.data))
+
+        response = self.client.post(url + 'complete/')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(AvatarUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.tmp, 'uploads')), [])
+        with Image.open(os.path.join(self.tmp, 'media', response.data['content'].split('/media/')[1])) as image:
+            self.assertEqual(image.size, (64, 48))
+
+    def test_rejects_oversized_chunks_and_non_images(self):
+        url = self.start(self.data)
+        self.assertEqual(self.send(url, 0, self.data + b'extra').status_code, 413)
+
+        junk = b'not an image at all'
+        url = self.start(junk)
+        self.send(url, 0, junk)
+        response = self.client.post(url + 'complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content', response.data)
+
+    def uploaded(self):
+        url = self.start(self.data)
+        self.send(url, 0, self.data)
+        return url, AvatarUpload.objects.get()
+
+    def media_files(self):
+        media = os.path.join(self.tmp, 'media')
+        return [name for _, _, names in os.walk(media) for name in names]
+
+    def test_storage_failure_releases_the_lock(self):
+        url, upload = self.uploaded()
+        with mock.patch.object(FileSystemStorage, 'save', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                uploads.finish(upload)
+        self.assertIsNone(AvatarUpload.objects.get().locked_at)
+        self.assertEqual(self.client.post(url + 'complete/').status_code, 201)
+
+    def test_failed_commit_moves_the_file_back(self):
+        url, upload = self.uploaded()
+        with mock.patch.object(Avatar, 'save', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                uploads.finish(upload)
+        upload = AvatarUpload.objects.get()
+        self.assertIsNone(upload.locked_at)
+        self.assertTrue(os.path.exists(uploads.upload_path(upload)))
+        self.assertEqual(self.media_files(), [])
+        self.assertEqual(self.client.post(url + 'complete/').status_code, 201)
+
+    def test_upload_is_discarded_when_the_file_cannot_be_moved_back(self):
+        url, upload = self.uploaded()
+        with mock.patch.object(Avatar, 'save', side_effect=OperationalError('database is locked')), \
+                mock.patch.object(FileSystemStorage, 'open', side_effect=OSError('gone')), \
+                self.assertLogs('article.uploads', 'WARNING'):
+            with self.assertRaises(OperationalError):
+                uploads.finish(upload)
+        self.assertFalse(AvatarUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.tmp, 'uploads')), [])
+        self.assertEqual(self.client.post(url + 'complete/').status_code, 404)
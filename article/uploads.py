@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from article.models import Avatar, AvatarUpload
+from drf_vue_blog.lru import LRUCache
+
+"""
+标题图的分块、可续传上传。
+
+普通的 multipart 上传由 Django 整个收下来再交给 Pillow 打开，大图会让 worker 的内存突增，
+连接一断又得从头再传。这里改成：
+1. POST 建立一次上传，声明文件名、总大小（不超过 MAX_SIZE）和可选的 sha256；
+2. PATCH 发送原始字节，请求头 Upload-Offset 标明这一块从哪里开始，边读边写进临时文件、边算 sha256，
+   内存里只有一个 64KB 的缓冲区；连接中途断开时已经写下的部分照样算数；
+3. 断线后 GET 查询 offset，从那里接着发；
+4. 收齐后 POST complete：校验大小和 sha256，Pillow 只读文件头确认格式和尺寸，
+   再把临时文件移动到媒体目录，在一个事务里建 Avatar、删掉上传记录；
+   这一步失败时文件放回临时目录、解除锁定，可以重试。
+
+sha256 的中间状态存在进程内，同一个上传的后续分块落到别的 worker 上时，从临时文件重新算一遍已有的部分。
+"""
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 64 * 1024
+
+# 上传 id -> (已经计算到的 offset, sha256 对象)
+hashers = LRUCache(256)
+
+
+def upload_setting(name, default):
+    return getattr(settings, 'AVATAR_UPLOAD', {}).get(name, default)
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Upload offset does not match or another request is writing this upload.'
+    default_code = 'upload_conflict'
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload exceeds the declared size.'
+    default_code = 'upload_too_large'
+
+
+class LengthRequired(APIException):
+    status_code = status.HTTP_411_LENGTH_REQUIRED
+    default_detail = 'Content-Length is required.'
+    default_code = 'length_required'
+
+
+def upload_path(upload):
+    return os.path.join(upload_setting('DIR', os.path.join(settings.BASE_DIR, 'upload_tmp')), str(upload.pk))
+
+
+def start(upload):
+    """新建上传时创建空的临时文件"""
+    path = upload_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+def lock(upload, offset=None):
+    """
+    抢占写入锁：用带条件的 UPDATE，同一时刻只有一个请求能写；
+    持锁的请求崩溃后，锁在 LEASE 秒后失效。
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=upload_setting('LEASE', 300))
+    claimed = AvatarUpload.objects.filter(Q(locked_at__isnull=True) | Q(locked_at__lt=stale), pk=upload.pk)
+    if offset is not None:
+        claimed = claimed.filter(offset=offset)
+    if not claimed.update(locked_at=now):
+        raise UploadConflict()
+    upload.locked_at = now
+
+
+def unlock(upload, **fields):
+    AvatarUpload.objects.filter(pk=upload.pk).update(locked_at=None, updated=timezone.now(), **fields)
+    for name, value in fields.items():
+        setattr(upload, name, value)
+    upload.locked_at = None
+
+
+def hasher_for(upload):
+    """取进程内已有的 sha256 状态；没有或者对不上时从临时文件重算"""
+    cached = hashers.get(upload.pk)
+    if cached is not None and cached[0] == upload.offset:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    remaining = upload.offset
+    with open(upload_path(upload), 'rb') as f:
+        while remaining:
+            block = f.read(min(BUFFER_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def write_chunk(upload, stream, offset, length):
+    """把请求体追加到 offset 处，返回新的 offset"""
+    if length is None:
+        raise LengthRequired()
+    if offset + length > upload.size:
+        raise UploadTooLarge()
+    max_chunk = upload_setting('MAX_CHUNK', 8 * 1024 * 1024)
+    if length > max_chunk:
+        raise UploadTooLarge('A single chunk may not exceed {} bytes.'.format(max_chunk))
+
+    lock(upload, offset)
+    written = 0
+    digest = None
+    try:
+        digest = hasher_for(upload)
+        with open(upload_path(upload), 'r+b') as f:
+            # 上次写到一半崩溃的请求可能在 offset 之后留下了数据
+            f.truncate(offset)
+            f.seek(offset)
+            while written < length:
+                block = stream.read(min(BUFFER_SIZE, length - written))
+                if not block:
+                    # 客户端断开了，已经收到的部分保留，续传时从新的 offset 开始
+                    break
+                f.write(block)
+                digest.update(block)
+                written += len(block)
+    finally:
+        new_offset = offset + written
+        if digest is not None:
+            hashers.set(upload.pk, (new_offset, digest))
+        unlock(upload, offset=new_offset)
+    return upload.offset
+
+
+def check_image(path):
+    """只读文件头：确认是允许的格式，并且像素数不超过 MAX_PIXELS，不解码整张图"""
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError, ValueError):
+        raise ValidationError({'content': 'Upload is not a valid image.'})
+
+    if image_format not in upload_setting('FORMATS', ('JPEG', 'PNG', 'GIF', 'WEBP')):
+        raise ValidationError({'content': 'Image format {} is not allowed.'.format(image_format)})
+    if width * height > upload_setting('MAX_PIXELS', 40 * 1000 * 1000):
+        raise ValidationError({'content': 'Image is too large: {}x{}.'.format(width, height)})
+    return image_format
+
+
+class TemporaryFile(File):
+    """告诉 FileSystemStorage 这是一个磁盘上的临时文件，保存时直接移动而不是复制"""
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def finish(upload):
+    """收齐之后校验并建 Avatar，返回新的 Avatar"""
+    lock(upload)
+    try:
+        if upload.offset != upload.size:
+            raise ValidationError({'offset': 'Upload is incomplete: {} of {} bytes received.'.format(
+                upload.offset, upload.size,
+            )})
+        digest = hasher_for(upload).hexdigest()
+        if upload.sha256 and digest != upload.sha256:
+            raise ValidationError({'sha256': 'Checksum mismatch, got {}.'.format(digest)})
+        image_format = check_image(upload_path(upload))
+    except Exception:
+        unlock(upload)
+        raise
+
+    ext = {'JPEG': '.jpg'}.get(image_format, '.' + image_format.lower())
+    # delete() 之后 upload.pk 会变成 None
+    pk = upload.pk
+    path = upload_path(upload)
+    avatar = Avatar()
+    try:
+        with open(path, 'rb') as f:
+            # 同一个文件系统上是一次 rename，不会再读写一遍文件
+            avatar.content.save(digest[:16] + ext, TemporaryFile(f, name=path), save=False)
+        with transaction.atomic():
+            avatar.save()
+            upload.delete()
+    except Exception:
+        upload.pk = pk
+        abort_finish(upload, avatar, path)
+        raise
+    # 跨文件系统时存储是复制过去的，临时文件还在
+    if os.path.exists(path):
+        os.remove(path)
+    hashers.set(pk, None)
+    return avatar
+
+
+def abort_finish(upload, avatar, path):
+    """
+    建 Avatar 失败时，把已经移到媒体目录的文件放回临时文件的位置再解锁，客户端可以再 complete 一次；
+    放不回去的话这次上传没法继续了，直接丢弃，不留下一个之后每次都出错的记录。
+    """
+    if avatar.content.name:
+        partial = path + '.part'
+        try:
+            if not os.path.exists(path):
+                with avatar.content.storage.open(avatar.content.name, 'rb') as src, open(partial, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, BUFFER_SIZE)
+                os.replace(partial, path)
+            avatar.content.storage.delete(avatar.content.name)
+        except OSError:
+            logger.warning('Failed to move %s back to avatar upload %s.', avatar.content.name, upload.pk,
+                           exc_info=True)
+            if os.path.exists(partial):
+                os.remove(partial)
+    if os.path.exists(path):
+        unlock(upload)
+    else:
+        discard(upload)
+
+
+def discard(upload):
+    """放弃一次上传，删掉临时文件和记录"""
+    try:
+        os.remove(upload_path(upload))
+    except FileNotFoundError:
+        pass
+    hashers.set(upload.pk, None)
+    upload.delete()
+
+
+def expired_uploads(hours):
+    cutoff = timezone.now() - timedelta(hours=hours)
+    return AvatarUpload.objects.filter(updated__lt=cutoff)
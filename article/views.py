@@ -1,19 +1,36 @@
 # article/views.py
 
+from urllib.parse import urlsplit, urlunsplit
+
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery
 from django.http import JsonResponse, Http404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, mixins, generics, viewsets, filters
-from rest_framework.decorators import api_view
-from rest_framework.permissions import IsAdminUser
+from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from article.models import Article, Category, Tag, Avatar
+from article.counters import view_counter
+from article.highlight import highlight_stats
+from article import uploads
+from article.moderation import delete_articles, update_articles
+from article.models import Article, Category, Tag, Avatar, AvatarUpload, ArchiveMonth, RelatedArticle
 from article.permissions import IsAdminUserOrReadOnly
+from article.ranking import comment_count
 # 这个 ArticleListSerializer 暂时还没有
 from article.serializers import ArticleListSerializer, ArticleDetailSerializer, CategorySerializer, \
-    CategoryDetailSerializer, TagSerializer, AvatarSerializer
+    CategoryDetailSerializer, TagSerializer, AvatarSerializer, AvatarUploadSerializer, ArchiveMonthSerializer, \
+    ArticleModerationSerializer
 from article.serializers import ArticleSerializer
+from comment.models import Comment
+from drf_vue_blog.chunked import streaming_response
+from drf_vue_blog.multiget import MultiGetMixin
+from drf_vue_blog.sqlite.writer import writer
 
 """第一次写文章列表接口函数"""
 # def article_list(request):
@@ -109,8 +126,33 @@ from article.serializers import ArticleSerializer
 #     # permission_classes = [IsAdminUser]
 #     permission_classes = [IsAdminUserOrReadOnly]
 
+def article_list_queryset():
+    """文章列表序列化时要用到的外键和标签一次取出，列表、热门和首页共用"""
+    return Article.objects.select_related('author', 'category', 'avatar').prefetch_related('tags')
+
+
+def first_page_comments():
+    """
+    每篇文章最新的一页评论，批量获取详情时预取，不把整篇的评论都读出来。
+    以第 PAGE_SIZE 新的评论时间为下限（走 comment_article_created_idx），时间相同多出的几条由序列化器截掉。
+    """
+    size = api_settings.PAGE_SIZE
+    floor = Comment.objects.filter(article=OuterRef('article')).order_by('-created').values('created')[size - 1:size]
+    return (
+        Comment.objects.select_related('author', 'parent__author')
+        .annotate(floor=Subquery(floor))
+        .filter(Q(floor__isnull=True) | Q(created__gte=F('floor')))
+    )
+
+
+class HotCursorPagination(CursorPagination):
+    """按热度分排序的游标分页，走 article_hot_idx 索引，翻到后面也不需要 OFFSET"""
+    ordering = ('-hot_score', '-id')
+    page_size = 10
+
+
 """最后用视图集来写文章列表和文章详情的接口集成在一起，并提供了默认的增删改查"""
-class ArticleViewSet(viewsets.ModelViewSet):
+class ArticleViewSet(MultiGetMixin, viewsets.ModelViewSet):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
     permission_classes = [IsAdminUserOrReadOnly]
@@ -124,7 +166,62 @@ class ArticleViewSet(viewsets.ModelViewSet):
     search_fields = ['title']
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # 文章和信号里的各种计数在一个写事务里完成，只拿一次写锁
+        writer.run(serializer.save, author=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # ?ids=1,2,3 一次取回多篇文章的详情
+        response = self.multi_get_response(request)
+        if response is not None:
+            return response
+        return super().list(request, *args, **kwargs)
+
+    def get_multi_get_queryset(self):
+        # 详情还要显示评论和相关文章，也一次取出；归档的评论只在评论表不满一页时再读
+        return self.filter_queryset(self.get_queryset()).annotate(comment_count=comment_count()).prefetch_related(
+            Prefetch('comments', queryset=first_page_comments()),
+            Prefetch('related_entries', queryset=RelatedArticle.objects.select_related('related')),
+        )
+
+    def get_multi_get_serializer_class(self):
+        return ArticleDetailSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # 浏览数先记在内存里，批量写回数据库
+        view_counter.incr(instance.pk)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def hot(self, request):
+        """热门文章：/api/article/hot/，用返回的 next 链接翻页"""
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = HotCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ArticleSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    def moderation_filter(self, request):
+        # 这两个接口只有管理员能用（IsAdminUserOrReadOnly），筛选条件直接作用在整张表上
+        serializer = ArticleModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer, serializer.filter(Article.objects.all())
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """POST /api/article/bulk_delete/ {"author": "someone"}，连同评论一起删除，返回删除的数量"""
+        _, queryset = self.moderation_filter(request)
+        articles, comments = delete_articles(queryset)
+        return Response({'deleted': articles, 'comments_deleted': comments})
+
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """POST /api/article/bulk_update/ {"category": 1, "category_id": 2}，返回修改的篇数"""
+        serializer, queryset = self.moderation_filter(request)
+        if 'category_id' not in serializer.validated_data:
+            raise ValidationError({'category_id': 'This field is required.'})
+        return Response({'updated': update_articles(queryset, category_id=serializer.validated_data['category_id'])})
 
     # 虽然视图集默认只提供一个序列化器，但是通过覆写 get_serializer_class() 方法可以根据条件而访问不同的序列化器：
     def get_serializer_class(self):
@@ -136,6 +233,11 @@ class ArticleViewSet(viewsets.ModelViewSet):
     # 有些时候用户需要某个特定范围的文章（比如搜索功能），这时候后端需要把返回的数据进行过滤。
     def get_queryset(self):
         queryset = self.queryset
+        if self.action in ('list', 'hot'):
+            queryset = article_list_queryset()
+        elif self.action == 'retrieve':
+            # 详情里的评论总数，两张评论表各一个子查询，和文章一起查出
+            queryset = queryset.annotate(comment_count=comment_count())
         username = self.request.query_params.get('username', None)
         if username is not None:
             queryset = queryset.filter(author__username=username)
@@ -160,6 +262,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
         else:
             return CategoryDetailSerializer
 
+    def list(self, request, *args, **kwargs):
+        # 不分页，但也不一次把整张表读进内存，按块查询、边查边输出
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(queryset, self.get_serializer_class(), self.get_serializer_context())
+
 
 class TagViewSet(viewsets.ModelViewSet):
     """标签视图集"""
@@ -169,7 +276,126 @@ class TagViewSet(viewsets.ModelViewSet):
     # 由于博客文章的分类、标签通常不会太多，因此对这两个接口，为了方便起见我并不想翻页而是希望一次请求直接返回所有的数据。
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(queryset, self.get_serializer_class(), self.get_serializer_context())
+
 class AvatarViewSet(viewsets.ModelViewSet):
     queryset = Avatar.objects.all()
     serializer_class = AvatarSerializer
-    permission_classes = [IsAdminUserOrReadOnly]
\ No newline at end of file
+    permission_classes = [IsAdminUserOrReadOnly]
+
+
+class AvatarUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    大图的分块、可续传上传，流程见 article/uploads.py：
+    POST   /api/avatar-upload/                 {"filename", "size", "sha256"} 建立上传
+    PATCH  /api/avatar-upload/<id>/            请求头 Upload-Offset，请求体是原始字节
+    GET    /api/avatar-upload/<id>/            断线后查询已经收到的 offset
+    POST   /api/avatar-upload/<id>/complete/   校验并生成 Avatar
+    DELETE /api/avatar-upload/<id>/            放弃
+    """
+    queryset = AvatarUpload.objects.all()
+    serializer_class = AvatarUploadSerializer
+    permission_classes = [IsAuthenticated, IsAdminUserOrReadOnly]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        uploads.start(serializer.save(owner=self.request.user))
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Upload-Offset'] = response.data['offset']
+        return response
+
+    def partial_update(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'detail': 'Upload-Offset header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        length = request.META.get('CONTENT_LENGTH')
+        # 不碰 request.data，直接从 request.stream 读，不让 Django 把请求体整个读进内存
+        offset = uploads.write_chunk(upload, request.stream, offset, int(length) if length else None)
+        return Response({'offset': offset}, headers={'Upload-Offset': offset})
+
+    def destroy(self, request, *args, **kwargs):
+        uploads.discard(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        avatar = uploads.finish(self.get_object())
+        serializer = AvatarSerializer(avatar, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+"""按年月归档的视图集"""
+class ArchiveViewSet(viewsets.GenericViewSet):
+    """
+    /api/archive/ 返回每个月的文章数，直接读归档表，不扫描文章表
+    /api/archive/<year>/<month>/ 分页返回该月的文章
+    """
+    queryset = ArchiveMonth.objects.filter(count__gt=0)
+    serializer_class = ArchiveMonthSerializer
+    permission_classes = [IsAdminUserOrReadOnly]
+
+    def list(self, request):
+        # 月份数量很少，不分页
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, url_path=r'(?P<year>\d{4})/(?P<month>\d{1,2})')
+    def month(self, request, year=None, month=None):
+        bucket = ArchiveMonth(year=int(year), month=int(month))
+        if not 1 <= bucket.month <= 12:
+            raise Http404
+
+        start, end = bucket.date_range()
+        articles = Article.objects.filter(created__gte=start, created__lt=end)
+        # 这个月的文章数归档表里已经有了，分页时不用再 COUNT
+        self.pagination_count = ArchiveMonth.objects.filter(
+            year=bucket.year, month=bucket.month
+        ).values_list('count', flat=True).first() or 0
+
+        page = self.paginate_queryset(articles)
+        if page is not None:
+            serializer = ArticleSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+
+        serializer = ArticleSerializer(articles, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+
+class HighlightStatsView(APIView):
+    """代码高亮缓存的命中率和节省的时间，统计的是处理这次请求的 worker 进程"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(highlight_stats())
+
+
+class HomeView(APIView):
+    """
+    首页需要的数据一次返回：文章列表第一页（和 /api/article/ 的分页格式相同）、全部分类和标签，
+    前端首页不用再分别请求三个接口
+    """
+
+    def get(self, request):
+        context = {'request': request, 'view': self}
+
+        paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+        page = paginator.paginate_queryset(article_list_queryset(), request, view=self)
+        articles = paginator.get_paginated_response(ArticleSerializer(page, many=True, context=context).data).data
+        # 分页器按当前地址生成翻页链接，换成文章列表接口的地址，前端直接用它翻页
+        for name in ('next', 'previous'):
+            if articles[name] is not None:
+                articles[name] = urlunsplit(urlsplit(articles[name])._replace(path=reverse('article-list')))
+
+        return Response({
+            'articles': articles,
+            'categories': CategorySerializer(Category.objects.all(), many=True, context=context).data,
+            'tags': TagSerializer(Tag.objects.all(), many=True, context=context).data,
+        })
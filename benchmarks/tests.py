@@ -0,0 +1,249 @@
+import json
+import os
+import time
+from pathlib import Path
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import RequestFactory, TestCase, tag
+from django.test.utils import CaptureQueriesContext
+
+from article import highlight
+from article.models import Article, Category, RelatedArticle, Tag
+from article.ranking import comment_count
+from article.serializers import ArticleDetailSerializer, ArticleSerializer, CategoryDetailSerializer, TagSerializer
+from article.views import article_list_queryset, first_page_comments
+from comment.models import Comment
+from comment.serializers import CommentSerializer
+from user_info.serializers import UserRegisterSerializer
+
+"""
+序列化器的性能基准。
+
+在固定的种子数据上测几个主要序列化器：每个对象平均耗时（多次运行取最快的一次）和一共执行的查询数，
+和 baselines.json 中记录的基线比较。
+
+计时用的是进程的 CPU 时间，其他进程抢占 CPU 不算在内；但 CPU 时间仍然随机器和频率变化，不能直接和基线比。
+每次运行用例时交替运行一个固定的参照任务（序列化一批不落库的标签），比较的是用例耗时和参照耗时的比值：
+比值超出基线的 BENCHMARK_TOLERANCE 倍（默认 0.5，即慢 50%）算退化；查询数是确定的，比基线多一条就算退化。
+基线里的 per_object_ms 只作参考。
+
+基准默认跳过，不在普通的 python manage.py test 中运行：
+    BENCHMARK=1 python manage.py test benchmarks
+有意改变了性能时重新生成基线：
+    BENCHMARK_UPDATE=1 python manage.py test benchmarks
+"""
+
+BASELINES_PATH = Path(__file__).with_name('baselines.json')
+TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', '0.5'))
+UPDATE = os.environ.get('BENCHMARK_UPDATE') == '1'
+ENABLED = UPDATE or os.environ.get('BENCHMARK') == '1'
+REPEAT = 5
+# 参照任务序列化的标签数
+REFERENCE_OBJECTS = 200
+
+ARTICLES = 30
+COMMENTS_PER_ARTICLE = 5
+CATEGORIES = 5
+
+BODY = '''# 第 {n} 篇
+
+这是正文的第一段，带一些 **加粗**、`行内代码` 和 [链接](http://example.com)。
+
+## 代码
+
+```python
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a + {n}
+```
+
+## 列表
+
+* 第一项
+* 第二项
+* 第三项
+
+    print("没有写语言的代码块 {n}")
+
+> 引用的一段话。
+'''
+
+
+def load_baselines():
+    if BASELINES_PATH.exists():
+        return json.loads(BASELINES_PATH.read_text())
+    return {}
+
+
+def reference():
+    """参照任务：只占 CPU，不查数据库"""
+    tags = [Tag(id=i, text='参照{}'.format(i)) for i in range(REFERENCE_OBJECTS)]
+    TagSerializer(tags, many=True).data
+
+
+def timed(run):
+    # 只算本进程占用的 CPU 时间，同一台机器上其他进程抢 CPU 时不会算进来
+    start = time.process_time()
+    run()
+    return time.process_time() - start
+
+
+@tag('benchmark')
+@skipUnless(ENABLED, '基准默认跳过，用 BENCHMARK=1 运行')
+class SerializerBenchmarks(TestCase):
+    baselines = load_baselines()
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_superuser('bench', password='bench')
+        readers = [User.objects.create_user('reader{}'.format(i)) for i in range(5)]
+        categories = [Category.objects.create(title='分类{}'.format(i)) for i in range(CATEGORIES)]
+        tags = [Tag.objects.create(text='标签{}'.format(i)) for i in range(10)]
+
+        articles = []
+        for n in range(ARTICLES):
+            article = Article.objects.create(
+                title='文章{}'.format(n), body=BODY.format(n=n), author=cls.author,
+                category=categories[n % CATEGORIES],
+            )
+            article.tags.set(tags[n % 7:n % 7 + 3])
+            articles.append(article)
+
+            parent = None
+            for i in range(COMMENTS_PER_ARTICLE):
+                comment = Comment.objects.create(
+                    article=article, author=readers[i], content='评论 {} {}'.format(n, i), parent=parent,
+                )
+                parent = parent or comment
+
+        RelatedArticle.objects.bulk_create(
+            RelatedArticle(article=article, related=articles[(i + step) % ARTICLES], score=1.0 / step)
+            for i, article in enumerate(articles) for step in range(1, 4)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if UPDATE and cls.results:
+            baselines = load_baselines()
+            baselines.update(cls.results)
+            BASELINES_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/')
+        self.context = {'request': self.request}
+
+    def measure(self, name, run, count, prepare=None):
+        """
+        和参照任务交替运行 REPEAT 次，两边各取最快的一次，记录用例和参照的耗时比、每个对象的平均耗时、最多的查询数。
+        交替运行让两边受到差不多的负载影响，比值比绝对耗时稳定。
+        """
+        best = reference_best = None
+        queries = 0
+        for _ in range(REPEAT):
+            reference_elapsed = timed(reference)
+            reference_best = reference_elapsed if reference_best is None else min(reference_best, reference_elapsed)
+            if prepare is not None:
+                prepare()
+            with CaptureQueriesContext(connection) as ctx:
+                elapsed = timed(run)
+            best = elapsed if best is None else min(best, elapsed)
+            queries = max(queries, len(ctx))
+
+        result = {
+            'per_object_ms': round(best * 1000 / count, 4),
+            'relative': round(best / reference_best, 4),
+            'queries': queries,
+            'objects': count,
+        }
+        type(self).results[name] = result
+        self.check_regression(name, result)
+
+    def check_regression(self, name, result):
+        if UPDATE:
+            return
+        baseline = self.baselines.get(name)
+        if baseline is None:
+            self.skipTest('{} 还没有基线，用 BENCHMARK_UPDATE=1 生成'.format(name))
+
+        self.assertLessEqual(
+            result['queries'], baseline['queries'],
+            '{}: 查询数 {} 超过基线 {}'.format(name, result['queries'], baseline['queries']),
+        )
+        if 'relative' not in baseline:
+            self.skipTest('{} 的基线没有参照耗时比，用 BENCHMARK_UPDATE=1 重新生成'.format(name))
+        allowed = baseline['relative'] * (1 + TOLERANCE)
+        self.assertLessEqual(
+            result['relative'], allowed,
+            '{}: 耗时是参照任务的 {:.2f} 倍，基线 {:.2f} 倍，允许 {:.2f} 倍（每个对象 {:.4f}ms）'.format(
+                name, result['relative'], baseline['relative'], allowed, result['per_object_ms'],
+            ),
+        )
+
+    def test_article_list(self):
+        def run():
+            ArticleSerializer(article_list_queryset(), many=True, context=self.context).data
+
+        self.measure('article_list', run, ARTICLES)
+
+    def detail_queryset(self):
+        # 和 ?ids= 批量获取详情时的预取一致
+        return Article.objects.select_related('author', 'category', 'avatar').annotate(
+            comment_count=comment_count()
+        ).prefetch_related(
+            'tags',
+            Prefetch('comments', queryset=first_page_comments()),
+            Prefetch('related_entries', queryset=RelatedArticle.objects.select_related('related')),
+        )
+
+    def test_article_detail(self):
+        for article in Article.objects.all():
+            article.get_md()
+
+        def run():
+            ArticleDetailSerializer(self.detail_queryset(), many=True, context=self.context).data
+
+        self.measure('article_detail', run, ARTICLES)
+
+    def test_article_detail_markdown(self):
+        """正文没有渲染过：包括 Markdown 渲染、代码高亮和写回渲染结果"""
+        def prepare():
+            Article.objects.update(render_version=0)
+            cache.clear()
+            highlight.html_cache.clear()
+
+        def run():
+            ArticleDetailSerializer(self.detail_queryset(), many=True, context=self.context).data
+
+        self.measure('article_detail_markdown', run, ARTICLES, prepare)
+
+    def test_comment_list(self):
+        def run():
+            queryset = Comment.objects.select_related('author', 'parent__author')
+            CommentSerializer(queryset, many=True, context=self.context).data
+
+        self.measure('comment_list', run, ARTICLES * COMMENTS_PER_ARTICLE)
+
+    def test_category_detail(self):
+        def run():
+            for category in Category.objects.all():
+                CategoryDetailSerializer(category, context=self.context).data
+
+        self.measure('category_detail', run, CATEGORIES)
+
+    def test_user_register_validation(self):
+        payloads = [{'username': 'new{}'.format(i), 'password': 'secret{}'.format(i)} for i in range(20)]
+        payloads.append({'username': 'bench', 'password': 'taken'})
+
+        def run():
+            for data in payloads:
+                UserRegisterSerializer(data=data, context=self.context).is_valid()
+
+        self.measure('user_register_validation', run, len(payloads))
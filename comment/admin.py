@@ -1,3 +1,44 @@
 from django.contrib import admin
 
+from comment.models import ArchivedComment, Comment
+from comment.moderation import delete_comments
+from drf_vue_blog.counting import EstimatedCountPaginator
+
 # Register your models here.
+
+
+@admin.register(Comment)
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ['id', '__str__', 'author', 'article', 'created']
+    list_select_related = ['author', 'article']
+    # 按 id、文章 id 和作者用户名精确查找，都有索引
+    search_fields = ['=id', '=article__id', '=author__username']
+    autocomplete_fields = ['author', 'article', 'parent']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    actions = ['delete_comments']
+
+    @admin.action(description='删除所选评论（不列出关联对象）')
+    def delete_comments(self, request, queryset):
+        # 默认的删除操作会先把所有关联对象列出来确认，评论多时页面很慢，这里直接删除；
+        # 和 /api/comment/bulk_delete/ 一样分批删除，不逐条加载评论、逐条触发信号
+        deleted = delete_comments(queryset)
+        self.message_user(request, '已删除 {} 条评论'.format(deleted))
+
+
+@admin.register(ArchivedComment)
+class ArchivedCommentAdmin(admin.ModelAdmin):
+    """归档的评论只看不改"""
+    list_display = ['id', '__str__', 'author', 'article', 'created', 'archived']
+    list_select_related = ['author', 'article']
+    search_fields = ['=id', '=article__id', '=author__username']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
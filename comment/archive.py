@@ -0,0 +1,141 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from comment.models import ArchivedComment, Comment
+
+"""
+旧评论的冷热分离。
+
+长期没有新评论的文章，把早于 OLDER_THAN_DAYS 的评论挪到 ArchivedComment 表，评论表只留下活跃的部分。
+每批在一个事务里复制再删除，中断后重新运行即可继续。回复总比它回复的评论晚，
+每批只挪没有回复留在评论表里的评论（按 id 从新到旧），删除父评论时就不会把留下的回复的 parent 置空。
+
+挪动不是真正的删除：期间触发的评论 post_delete 信号通过 is_archiving() 判断后跳过，
+作者的评论数、文章热度分都把归档表算在内。
+"""
+
+_state = threading.local()
+
+
+def archive_setting(name, default):
+    return getattr(settings, 'COMMENT_ARCHIVE', {}).get(name, default)
+
+
+@contextmanager
+def archiving():
+    _state.active = True
+    try:
+        yield
+    finally:
+        _state.active = False
+
+
+def is_archiving():
+    return getattr(_state, 'active', False)
+
+
+def inactive_articles(inactive_days, older_than_days):
+    """最近 inactive_days 天没有新评论、且有可归档评论的文章 id"""
+    now = timezone.now()
+    return (
+        Comment.objects.values('article_id')
+        .annotate(last=Max('created'))
+        .filter(last__lt=now - timedelta(days=inactive_days))
+        .filter(article_id__in=Comment.objects.filter(created__lt=now - timedelta(days=older_than_days))
+                .values('article_id'))
+        .order_by('article_id')
+        .values_list('article_id', flat=True)
+    )
+
+
+def archive_batch(article_id, cutoff, batch_size):
+    """归档一批，返回挪动的评论数"""
+    with transaction.atomic():
+        comments = list(
+            Comment.objects
+            .filter(article_id=article_id, created__lt=cutoff, children__isnull=True)
+            .order_by('-id')[:batch_size]
+        )
+        if not comments:
+            return 0
+
+        ArchivedComment.objects.bulk_create([
+            ArchivedComment(
+                id=comment.id,
+                author_id=comment.author_id,
+                article_id=comment.article_id,
+                content=comment.content,
+                created=comment.created,
+                parent_id=comment.parent_id,
+            )
+            for comment in comments
+        ], ignore_conflicts=True)
+        with archiving():
+            Comment.objects.filter(pk__in=[comment.pk for comment in comments]).delete()
+    return len(comments)
+
+
+def archive_article(article_id, cutoff, batch_size):
+    total = 0
+    while True:
+        moved = archive_batch(article_id, cutoff, batch_size)
+        if not moved:
+            return total
+        total += moved
+
+
+class ReadThroughComments:
+    """
+    把评论表和归档表接成一个序列交给分页器：先是评论表里的评论，再是归档的。
+    只有翻过评论表的部分时才会查询归档表的内容，前面的页只多一次走索引的 COUNT。
+    取出的归档评论会带上 parent，和评论表里的评论用同样的方式序列化，见 comment/serializers.py。
+    """
+
+    def __init__(self, hot, archived):
+        self.hot = hot
+        self.archived = archived
+        self._hot_count = None
+
+    @property
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return list(self[item:item + 1])[0]
+
+        start, stop = item.start or 0, item.stop
+        items = list(self.hot[start:stop]) if start < self.hot_count else []
+        if stop is None or stop > self.hot_count:
+            archived_stop = None if stop is None else stop - self.hot_count
+            items += attach_parents(list(self.archived[max(start - self.hot_count, 0):archived_stop]))
+        return items
+
+
+def attach_parents(archived):
+    """
+    给归档评论设置 parent 属性。父评论可能还在评论表，也可能已经归档，
+    两张表各查一次，而不是每条评论查一次。
+    """
+    ids = {comment.parent_id for comment in archived if comment.parent_id is not None}
+    parents = {}
+    if ids:
+        parents.update(Comment.objects.select_related('author').in_bulk(ids))
+        parents.update(ArchivedComment.objects.select_related('author').in_bulk(ids - parents.keys()))
+    for comment in archived:
+        comment.parent = parents.get(comment.parent_id)
+    return archived
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from comment.archive import archive_article, archive_setting, inactive_articles
+
+
+class Command(BaseCommand):
+    help = (
+        '把不活跃文章下的旧评论挪到归档表。每批一个事务，'
+        '中断后重新运行即可继续'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=archive_setting('OLDER_THAN_DAYS', 180),
+                            help='归档早于这么多天的评论')
+        parser.add_argument('--inactive-days', type=int, default=archive_setting('INACTIVE_DAYS', 30),
+                            help='只处理最近这么多天没有新评论的文章')
+        parser.add_argument('--batch-size', type=int, default=archive_setting('BATCH_SIZE', 500),
+                            help='每个事务最多挪动的评论数')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        article_ids = list(inactive_articles(options['inactive_days'], options['older_than']))
+        self.stdout.write('{} inactive article(s) with comments older than {}.'.format(
+            len(article_ids), cutoff.date()
+        ))
+
+        started = time.perf_counter()
+        total = 0
+        for article_id in article_ids:
+            moved = archive_article(article_id, cutoff, options['batch_size'])
+            total += moved
+            if moved:
+                self.stdout.write('article {}: archived {} comment(s)'.format(article_id, moved))
+
+        self.stdout.write(self.style.SUCCESS('Archived {} comment(s) in {:.1f}s.'.format(
+            total, time.perf_counter() - started
+        )))
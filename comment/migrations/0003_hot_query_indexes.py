@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0002_comment_parent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', '-created'], name='comment_article_created_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.1 on 2026-10-19 11:20
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def backfill_updated(apps, schema_editor):
+    Comment = apps.get_model('comment', 'Comment')
+    Comment.objects.update(updated=F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0004_archivedcomment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated, migrations.RunPython.noop),
+    ]
@@ -20,6 +20,7 @@ class Comment(models.Model):
 
     content = models.TextField()
     created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
 
     # 父评论
     parent = models.ForeignKey(
@@ -32,6 +33,42 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            # 文章下的评论按时间倒序
+            models.Index(fields=['article', '-created'], name='comment_article_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.content[:20]
+
+
+class ArchivedComment(models.Model):
+    """
+    归档的旧评论，由 comment/archive.py 从 Comment 表批量挪过来，字段和原评论一致。
+    保留原来的 id；父评论可能在评论表也可能已经归档，所以 parent_id 只是一个整数，不做外键。
+    """
+    id = models.BigIntegerField(primary_key=True)
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments'
+    )
+    article = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        related_name='archived_comments'
+    )
+
+    content = models.TextField()
+    created = models.DateTimeField()
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    archived = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['article', '-created'], name='archived_article_created_idx'),
+        ]
 
     def __str__(self):
         return self.content[:20]
@@ -0,0 +1,102 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from article.tasks import refresh_article_hot_scores
+from comment.models import ArchivedComment, Comment
+from sync.models import ChangeLog
+from user_info.models import UserStats
+
+"""
+评论的批量管理：按作者、文章、内容等条件一次删除或修改一批评论。
+
+逐条走 CommentViewSet 删除时，每条评论都要做一次对象权限检查，post_delete 信号再逐条更新作者统计、
+入队热度重算、写变更记录。这里按 BATCH_SIZE 分批，每批一个事务：
+先用一条分组查询算出每个作者、每篇文章受影响的数量，删除本身是一条 DELETE，
+统计、热度、变更记录也按批一次更新。期间的 post_delete 信号通过 is_bulk_deleting() 判断后跳过。
+"""
+
+_state = threading.local()
+
+
+def moderation_setting(name, default):
+    return getattr(settings, 'MODERATION', {}).get(name, default)
+
+
+@contextmanager
+def bulk_deleting():
+    _state.active = True
+    try:
+        yield
+    finally:
+        _state.active = False
+
+
+def is_bulk_deleting():
+    return getattr(_state, 'active', False)
+
+
+def id_batches(queryset, batch_size):
+    """按主键从小到大分批取 id，每批重新查询，前面批次的修改不影响后面的结果"""
+    last = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def delete_comment_batch(ids, rerank=True):
+    """删除一批评论，返回删除的条数"""
+    with transaction.atomic():
+        affected = Comment.objects.filter(pk__in=ids).values('author_id', 'article_id').annotate(n=Count('pk'))
+        authors = Counter()
+        articles = set()
+        for row in affected:
+            authors[row['author_id']] += row['n']
+            articles.add(row['article_id'])
+
+        with bulk_deleting():
+            # 连着 post_delete 信号，删除前 Django 要把这批评论取出来；信号里会跳过，只取用得到的字段，不读评论内容。
+            # 回复这些评论的子评论 parent 置空是一条 UPDATE
+            comments = Comment.objects.filter(pk__in=ids).only('pk', 'author_id', 'article_id')
+            deleted = comments.delete()[1].get(Comment._meta.label, 0)
+
+        for author_id, n in authors.items():
+            UserStats.adjust(author_id, comments=-n)
+        ChangeLog.record('comment', ids, ChangeLog.DELETE)
+        if rerank:
+            for article_id in articles:
+                refresh_article_hot_scores.delay(pks=[article_id], dedupe_key='hot:{}'.format(article_id))
+    return deleted
+
+
+def delete_comments(queryset, batch_size=None, rerank=True):
+    batch_size = batch_size or moderation_setting('BATCH_SIZE', 500)
+    return sum(delete_comment_batch(ids, rerank) for ids in id_batches(queryset, batch_size))
+
+
+def update_comments(queryset, batch_size=None, **values):
+    """批量修改评论（例如把垃圾评论的内容替换掉），返回修改的条数"""
+    batch_size = batch_size or moderation_setting('BATCH_SIZE', 500)
+    updated = 0
+    for ids in id_batches(queryset, batch_size):
+        with transaction.atomic():
+            # update() 不会处理 auto_now
+            updated += Comment.objects.filter(pk__in=ids).update(updated=timezone.now(), **values)
+            ChangeLog.record('comment', ids)
+    return updated
+
+
+def delete_archived_comments(article_ids):
+    """删除这些文章归档的评论，作者的评论数把归档的也算在内"""
+    affected = ArchivedComment.objects.filter(article_id__in=article_ids).values('author_id').annotate(n=Count('pk'))
+    for row in affected:
+        UserStats.adjust(row['author_id'], comments=-row['n'])
+    return ArchivedComment.objects.filter(article_id__in=article_ids).delete()[0]
@@ -42,5 +42,6 @@ class IsOwnerOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
         return self.safe_methods_or_owner(
             request,
-            lambda: obj.author == request.user
+            # 比较外键的 id，不用为了权限检查再查一次作者
+            lambda: obj.author_id == request.user.id
         )
\ No newline at end of file
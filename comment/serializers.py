@@ -1,6 +1,8 @@
+from itertools import groupby
+
 from rest_framework import serializers
 
-from comment.models import Comment
+from comment.models import ArchivedComment, Comment
 from user_info.serializers import UserDescSerializer
 
 class CommentChildrenSerializer(serializers.ModelSerializer):
@@ -34,3 +36,87 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = '__all__'
         extra_kwargs = {'created':{'read_only': True}}
+
+
+class ArchivedChildrenSerializer(serializers.ModelSerializer):
+    """已经归档的父评论，字段和 CommentChildrenSerializer 一致"""
+    url = serializers.SerializerMethodField()
+    author = UserDescSerializer(read_only=True)
+    updated = serializers.DateTimeField(source='created', read_only=True)
+
+    def get_url(self, obj):
+        return None
+
+    class Meta:
+        model = ArchivedComment
+        fields = ['id', 'url', 'author', 'content', 'created', 'updated']
+
+
+class ArchivedCommentSerializer(serializers.ModelSerializer):
+    """
+    归档的评论只读，字段和 CommentSerializer 一致，两种评论可以放在同一个列表里：
+    没有详情接口，url 为 null；归档后不再修改，updated 就是 created；
+    parent 由 comment/archive.py 的 attach_parents() 批量取出，可能在评论表也可能已经归档。
+    """
+    url = serializers.SerializerMethodField()
+    author = UserDescSerializer(read_only=True)
+    article = serializers.HyperlinkedRelatedField(view_name='article-detail', read_only=True)
+    parent = serializers.SerializerMethodField()
+    updated = serializers.DateTimeField(source='created', read_only=True)
+
+    def get_url(self, obj):
+        return None
+
+    def get_parent(self, obj):
+        parent = getattr(obj, 'parent', None)
+        if parent is None:
+            return None
+        serializer_class = ArchivedChildrenSerializer if isinstance(parent, ArchivedComment) \
+            else CommentChildrenSerializer
+        return serializer_class(parent, context=self.context).data
+
+    class Meta:
+        model = ArchivedComment
+        fields = ['id', 'url', 'author', 'article', 'parent', 'content', 'created', 'updated', 'archived']
+
+
+def serialize_comments(comments, context):
+    """
+    评论表和归档表的评论混在一起时按类型选序列化器，见 comment/archive.py 的 ReadThroughComments。
+    相邻的同类评论一起交给 many=True 的序列化器，字段只绑定一次，而不是每条评论新建一个序列化器。
+    """
+    data = []
+    for archived, group in groupby(comments, key=lambda comment: isinstance(comment, ArchivedComment)):
+        serializer_class = ArchivedCommentSerializer if archived else CommentSerializer
+        data += serializer_class(list(group), many=True, context=context).data
+    return data
+
+
+class CommentModerationSerializer(serializers.Serializer):
+    """批量管理评论的筛选条件，至少给出一个，见 comment/moderation.py"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    # 作者的用户名
+    author = serializers.CharField(required=False)
+    article = serializers.IntegerField(required=False)
+    contains = serializers.CharField(required=False, min_length=2)
+    before = serializers.DateTimeField(required=False)
+    # 批量修改时替换成的内容
+    content = serializers.CharField(required=False)
+
+    filters = {
+        'ids': 'pk__in',
+        'author': 'author__username',
+        'article': 'article_id',
+        'contains': 'content__icontains',
+        'before': 'created__lt',
+    }
+
+    def validate(self, attrs):
+        if not any(name in attrs for name in self.filters):
+            raise serializers.ValidationError('At least one of {} is required.'.format(', '.join(self.filters)))
+        return attrs
+
+    def filter(self, queryset):
+        return queryset.filter(**{
+            lookup: self.validated_data[name] for name, lookup in self.filters.items() if name in self.validated_data
+        })
@@ -1,3 +1,162 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Prefetch
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from article.counters import view_counter
+from article.models import Article, ArchiveMonth
+from article.views import first_page_comments
+from comment.archive import archive_batch
+from comment.models import ArchivedComment, Comment
+from sync.models import ChangeLog
+from user_info.models import UserStats
+
+
+class BulkModerationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.spammer = User.objects.create_user('spammer')
+        self.reader = User.objects.create_user('reader')
+        self.article = Article.objects.create(title='a', body='x', author=self.admin)
+        UserStats.rebuild(self.spammer)
+        self.client = APIClient()
+
+    def comment(self, author, content='hello', count=1):
+        for _ in range(count):
+            Comment.objects.create(article=self.article, author=author, content=content)
+
+    def test_delete_by_author_runs_in_batches(self):
+        self.comment(self.spammer, 'buy now', 30)
+        self.comment(self.reader)
+        self.client.force_authenticate(self.admin)
+
+        with self.settings(MODERATION={'BATCH_SIZE': 10}):
+            response = self.client.post('/api/comment/bulk_delete/', {'author': 'spammer'}, format='json')
+        self.assertEqual(response.data, {'deleted': 30})
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(UserStats.objects.get(user=self.spammer).comment_count, 0)
+        self.assertEqual(ChangeLog.objects.filter(model='comment', action=ChangeLog.DELETE).count(), 30)
+
+        # 查询数只和批数有关，和评论条数无关：3 批每批 11 条，再加上最后一次没有取到 id
+        self.comment(self.spammer, 'buy now', 30)
+        with self.settings(MODERATION={'BATCH_SIZE': 10}), self.assertNumQueries(34):
+            self.client.post('/api/comment/bulk_delete/', {'contains': 'buy'}, format='json')
+
+    def test_non_admin_only_touches_own_comments(self):
+        self.comment(self.spammer, 'spam')
+        self.comment(self.reader, 'spam')
+        self.client.force_authenticate(self.reader)
+
+        self.assertEqual(self.client.post('/api/comment/bulk_delete/', {}, format='json').status_code, 400)
+        response = self.client.post('/api/comment/bulk_update/', {'contains': 'spam', 'content': 'removed'},
+                                    format='json')
+        self.assertEqual(response.data, {'updated': 1})
+        self.assertEqual(Comment.objects.get(author=self.spammer).content, 'spam')
+
+    def test_delete_does_not_load_full_rows(self):
+        self.comment(self.reader, count=3)
+        self.client.force_authenticate(self.admin)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/article/bulk_delete/', {'ids': [self.article.pk]}, format='json')
+        self.assertEqual(response.data, {'deleted': 1, 'comments_deleted': 3})
+        # 删除前按 id 取出要删的行时只取信号用得到的字段
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        comments = [sql for sql in selects if 'WHERE "comment_comment"."id" IN' in sql]
+        articles = [sql for sql in selects if 'WHERE "article_article"."id" IN' in sql]
+        self.assertTrue(comments and articles)
+        self.assertFalse([sql for sql in comments if '"comment_comment"."content"' in sql])
+        self.assertFalse([sql for sql in articles if '"article_article"."body"' in sql])
+
+    def test_admin_action_uses_the_batched_delete(self):
+        self.comment(self.spammer, 'buy now', 30)
+        self.comment(self.reader)
+        self.client.force_login(self.admin)
+
+        ids = Comment.objects.filter(author=self.spammer).values_list('pk', flat=True)
+        with self.settings(MODERATION={'BATCH_SIZE': 10}), CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/admin/comment/comment/', {
+                'action': 'delete_comments', '_selected_action': list(ids),
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Comment.objects.count(), 1)
+        # 作者统计每批调整一次，而不是 post_delete 信号逐条调整
+        stats_updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "user_info_userstats"')]
+        self.assertEqual(len(stats_updates), 3)
+        self.assertEqual(UserStats.objects.get(user=self.spammer).comment_count, 0)
+        self.assertEqual(ChangeLog.objects.filter(model='comment', action=ChangeLog.DELETE).count(), 30)
+
+    def test_delete_articles_with_their_comments(self):
+        self.comment(self.reader, count=3)
+        Article.objects.create(title='b', body='x', author=self.admin)
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.post('/api/article/bulk_delete/', {'ids': [self.article.pk]}, format='json')
+        self.assertEqual(response.data, {'deleted': 1, 'comments_deleted': 3})
+        self.assertEqual(ArchiveMonth.objects.get().count, 1)
+        self.assertEqual(UserStats.for_user(self.admin).article_count, 1)
+
+
+class ArchivedCommentTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('reader')
+        self.article = Article.objects.create(title='a', body='x', author=self.author)
+        old = timezone.now() - timedelta(days=400)
+        self.root = Comment.objects.create(article=self.article, author=self.author, content='root', created=old)
+        self.archived = Comment.objects.create(article=self.article, author=self.author, content='reply',
+                                               created=old + timedelta(minutes=1), parent=self.root)
+        Comment.objects.create(article=self.article, author=self.author, content='new', parent=self.root)
+        archive_batch(self.article.pk, timezone.now() - timedelta(days=180), 10)
+        self.client = APIClient()
+
+    def tearDown(self):
+        view_counter.reset()
+
+    def test_archived_comments_have_the_same_fields(self):
+        self.assertEqual(list(ArchivedComment.objects.values_list('pk', flat=True)), [self.archived.pk])
+
+        comments = self.client.get('/api/comment/', {'article': self.article.pk}).data['results']
+        hot, archived = comments[0], comments[-1]
+        self.assertEqual([comment['content'] for comment in comments], ['new', 'root', 'reply'])
+        self.assertEqual(set(archived) - set(hot), {'archived'})
+        self.assertIsNone(archived['url'])
+        self.assertEqual(archived['updated'], archived['created'])
+        self.assertEqual(archived['parent'], hot['parent'])
+
+    def test_article_detail_reads_through_to_the_archive(self):
+        detail = self.client.get('/api/article/{}/'.format(self.article.pk)).data
+        listed = self.client.get('/api/comment/', {'article': self.article.pk}).data['results']
+        self.assertEqual(detail['comments'], listed)
+
+        self.assertEqual(detail['comments_count'], 3)
+        self.assertIsNone(detail['comments_next'])
+
+        # 批量获取时评论表不满一页，同样接着读归档表
+        multi = self.client.get('/api/article/', {'ids': str(self.article.pk)}).data
+        self.assertEqual(multi[0]['comments'], listed)
+
+    def test_article_detail_shows_only_the_first_page(self):
+        now = timezone.now()
+        for i in range(6):
+            Comment.objects.create(article=self.article, author=self.author, content=str(i),
+                                   created=now + timedelta(minutes=10 - i))
+
+        detail = self.client.get('/api/article/{}/'.format(self.article.pk)).data
+        self.assertEqual([comment['content'] for comment in detail['comments']], ['0', '1', '2', '3', '4'])
+        self.assertEqual(detail['comments_count'], 9)
+        # 剩下的评论（包括归档的）从评论列表的第二页接着翻
+        rest = self.client.get(detail['comments_next']).data
+        self.assertEqual([comment['content'] for comment in rest['results']], ['5', 'new', 'root', 'reply'])
+        self.assertEqual(rest['count'], 9)
 
-# Create your tests here.
+        # 批量获取只预取每篇的第一页
+        article = Article.objects.prefetch_related(Prefetch('comments', queryset=first_page_comments())).get()
+        self.assertEqual(len(article.comments.all()), 5)
+        multi = self.client.get('/api/article/', {'ids': str(self.article.pk)}).data
+        self.assertEqual(multi[0]['comments'], detail['comments'])
+        self.assertEqual(multi[0]['comments_next'], detail['comments_next'])
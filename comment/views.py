@@ -1,16 +1,79 @@
 from django.shortcuts import render
-from rest_framework import viewsets
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-from comment.models import Comment
-from comment.serializers import CommentSerializer
+from comment.archive import ReadThroughComments
+from comment.models import ArchivedComment, Comment
+from comment.moderation import delete_comments, update_comments
+from comment.serializers import CommentModerationSerializer, CommentSerializer, serialize_comments
 from comment.permissions import IsOwnerOrReadOnly
+from drf_vue_blog.multiget import MultiGetMixin
+from drf_vue_blog.sqlite.writer import writer
+from drf_vue_blog.throttling import CommentThrottle
 
 # Create your views here.
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(MultiGetMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsOwnerOrReadOnly]
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # 评论和信号里的统计、任务、变更记录在一个写事务里完成，打开合并提交时和同时到达的评论一起提交
+        writer.run(serializer.save, author=self.request.user)
 
+    def get_throttles(self):
+        # 新建评论要写库，按用户限流
+        if self.action == 'create':
+            return [CommentThrottle()]
+        return super().get_throttles()
+
+    def get_multi_get_queryset(self):
+        return self.get_queryset().select_related('author', 'parent__author')
+
+    def list(self, request, *args, **kwargs):
+        # ?ids=1,2,3 一次取回多条评论
+        response = self.multi_get_response(request)
+        if response is not None:
+            return response
+
+        # ?article=<id> 时按时间倒序分页返回这篇文章的评论，翻过评论表的部分后接着读归档表
+        article_id = request.query_params.get('article')
+        if not article_id or not article_id.isdigit():
+            return super().list(request, *args, **kwargs)
+
+        comments = ReadThroughComments(
+            Comment.objects.filter(article_id=article_id).select_related('author', 'parent__author'),
+            ArchivedComment.objects.filter(article_id=article_id).select_related('author'),
+        )
+        page = self.paginate_queryset(comments)
+        data = serialize_comments(page if page is not None else comments[:], self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def get_moderation_queryset(self):
+        # 权限按查询集检查：管理员可以处理所有评论，其他用户只能处理自己的，不用逐条加载对象比对作者
+        queryset = Comment.objects.all()
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(author=self.request.user)
+        return queryset
+
+    def moderation_filter(self, request):
+        serializer = CommentModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer, serializer.filter(self.get_moderation_queryset())
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """POST /api/comment/bulk_delete/ {"author": "spammer"}，返回删除的条数"""
+        _, queryset = self.moderation_filter(request)
+        return Response({'deleted': delete_comments(queryset)})
+
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """POST /api/comment/bulk_update/ {"contains": "buy now", "content": "[已删除]"}，返回修改的条数"""
+        serializer, queryset = self.moderation_filter(request)
+        if 'content' not in serializer.validated_data:
+            raise serializers.ValidationError({'content': 'This field is required.'})
+        return Response({'updated': update_comments(queryset, content=serializer.validated_data['content'])})
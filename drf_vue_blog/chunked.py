@@ -0,0 +1,114 @@
+from django.db.models import Manager, Q, QuerySet, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+"""
+分块遍历大的查询集。
+
+list(queryset) 或者不分页地序列化整张表，会把所有行同时变成模型实例放在内存里。
+chunked() 按排序字段做键集分页（WHERE (排序字段) > 上一块最后一行 ... LIMIT n），每次只取一块，
+prefetch_related 也按块执行，内存只和块的大小有关，和总行数无关。
+不用 OFFSET，越往后也不会越慢；也不用服务端游标，遍历期间不会长时间占着一个查询。
+
+排序字段只能是模型自己的字段，不能为 NULL；会自动补上主键保证顺序唯一。
+"""
+
+CHUNK_SIZE = 500
+
+
+def keyset_ordering(queryset):
+    ordering = list(queryset.query.order_by or queryset.model._meta.ordering or [])
+    names = []
+    for field in ordering:
+        if not isinstance(field, str) or '__' in field or field.lstrip('-') == '?':
+            raise ValueError('chunked() 只支持按模型自身字段排序，收到 {!r}'.format(field))
+        names.append(field)
+    if not any(name.lstrip('-') in ('pk', queryset.model._meta.pk.name) for name in names):
+        # 主键放在最后，保证相同排序值的行也有确定的先后
+        names.append('-pk' if names and names[0].startswith('-') else 'pk')
+    return names
+
+
+def field_value(obj, name):
+    if name == 'pk':
+        return obj.pk
+    return getattr(obj, obj._meta.get_field(name).attname)
+
+
+def after(ordering, obj):
+    """排在 obj 之后的行：按字典序逐个比较排序字段"""
+    condition = Q()
+    equal = Q()
+    for field in ordering:
+        name = field.lstrip('-')
+        lookup = '{}__{}'.format(name, 'lt' if field.startswith('-') else 'gt')
+        value = field_value(obj, name)
+        condition |= equal & Q(**{lookup: value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def chunked(queryset, chunk_size=CHUNK_SIZE):
+    """按块产出模型实例的列表"""
+    if queryset.query.is_sliced:
+        raise ValueError('chunked() 不支持已经切片的查询集')
+
+    lookups = queryset._prefetch_related_lookups
+    ordering = keyset_ordering(queryset)
+    queryset = queryset.prefetch_related(None).order_by(*ordering)
+
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(after(ordering, last))
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+
+
+def iterate(queryset, chunk_size=CHUNK_SIZE):
+    """逐个产出模型实例，内部按块查询"""
+    for chunk in chunked(queryset, chunk_size):
+        yield from chunk
+
+
+def stream_json(queryset, serializer_class, context, chunk_size=CHUNK_SIZE):
+    """把查询集按块序列化成一个 JSON 数组，边查询边输出"""
+    renderer = JSONRenderer()
+    # 序列化器只建一个，逐块调用 to_representation()：.data 和序列化器、实例之间有循环引用，
+    # 每块新建一个的话，整块的模型实例要等垃圾回收才释放，内存会随总行数上涨
+    serializer = serializer_class(many=True, context=context)
+    yield b'['
+    first = True
+    for chunk in chunked(queryset, chunk_size):
+        body = renderer.render(serializer.to_representation(chunk))[1:-1]
+        if body:
+            if not first:
+                yield b','
+            yield body
+            first = False
+    yield b']'
+
+
+def streaming_response(queryset, serializer_class, context, chunk_size=CHUNK_SIZE):
+    """不分页的列表接口用它代替 Response(serializer.data)"""
+    return StreamingHttpResponse(
+        stream_json(queryset, serializer_class, context, chunk_size),
+        content_type='application/json',
+    )
+
+
+class ChunkedListSerializer(serializers.ListSerializer):
+    """嵌套的 many=True 字段按块查询，例如分类详情中的全部文章"""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        if isinstance(iterable, QuerySet) and not iterable.query.is_sliced:
+            return [self.child.to_representation(item) for item in iterate(iterable)]
+        return super().to_representation(data)
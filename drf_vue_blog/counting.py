@@ -0,0 +1,153 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+"""
+大表的计数。
+
+精确的 COUNT(*) 要扫描整张表或整个索引，表大了以后比取一页数据还慢。这里按查询分两种情况：
+- 没有过滤条件：直接用数据库的统计信息（PostgreSQL 的 pg_class.reltuples、MySQL 的 information_schema），
+  SQLite 没有现成的统计，用 MAX(id) 近似，删除过的行会让它偏大；
+- 有过滤条件：精确计数一次，结果按 SQL 缓存 CACHE_TIMEOUT 秒。
+小于 ESTIMATE_THRESHOLD 的数量总是精确计算，只有大数量才会返回估计值。
+"""
+
+
+def counting_setting(name, default):
+    return getattr(settings, 'COUNTING', {}).get(name, default)
+
+
+def table_estimate(queryset):
+    """数据库统计信息中的表行数，拿不到时返回 None"""
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+            )
+        else:
+            # 自增主键的最大值，走主键索引，不用扫描
+            if model._meta.pk.get_internal_type() not in ('AutoField', 'BigAutoField'):
+                return None
+            return model._default_manager.using(queryset.db).aggregate(top=Max('pk'))['top'] or 0
+        row = cursor.fetchone()
+    # 从没 ANALYZE 过的表 reltuples 为 -1
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def is_unfiltered(queryset):
+    """查询结果是否就是整张表：没有过滤、去重、切片，也没有分组、UNION 之类让行数和表行数不一致的部分"""
+    query = queryset.query
+    return (
+        not query.where and not query.distinct and query.low_mark == 0 and query.high_mark is None
+        and not query.group_by and not query.combinator
+        and not any(getattr(annotation, 'contains_aggregate', False) for annotation in query.annotations.values())
+    )
+
+
+def count_cache_key(queryset):
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    return 'count:{}:{}'.format(queryset.db, hashlib.sha1(repr((sql, params)).encode()).hexdigest())
+
+
+def estimate_count(queryset, threshold=None):
+    """返回 (数量, 是否为估计值)"""
+    if threshold is None:
+        threshold = counting_setting('ESTIMATE_THRESHOLD', 10000)
+
+    if is_unfiltered(queryset):
+        estimate = table_estimate(queryset)
+        if estimate is not None and estimate >= threshold:
+            return estimate, True
+        return queryset.count(), False
+
+    key = count_cache_key(queryset)
+    if key is None:
+        return 0, False
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    count = queryset.count()
+    if count >= threshold:
+        cache.set(key, count, counting_setting('CACHE_TIMEOUT', 60))
+    return count, False
+
+
+class EstimatedPage(Page):
+    """总数是估计值时，是否还有下一页看这一页之后还有没有数据"""
+    has_more = None
+
+    def has_next(self):
+        if self.has_more is not None:
+            return self.has_more
+        return super().has_next()
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    大表的列表用估计的总数，不必每页都 COUNT(*) 一次。
+    exact=True 时总是精确计数；known_count 是从别处（例如归档表）已经知道的总数。
+    总数是估计值时页码不受它限制，每页多取一条来判断后面还有没有。
+    """
+    approximate = False
+
+    def __init__(self, *args, exact=False, known_count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact = exact
+        self.known_count = known_count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None and not self.exact:
+            return self.known_count
+        if self.exact or not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.approximate = estimate_count(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        # 先算出总数，才知道它是不是估计值
+        self.count
+        if not self.approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return super().validate_number(number)
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if number > 1 and not items:
+            raise EmptyPage(_('That page contains no results'))
+        page = self._get_page(items[:self.per_page], number, self)
+        page.has_more = len(items) > self.per_page
+        return page
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedPage(*args, **kwargs)
@@ -0,0 +1,24 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from user_info.hashers import HashingBusy
+
+"""
+DRF 的异常处理，在 settings.REST_FRAMEWORK['EXCEPTION_HANDLER'] 中启用。
+
+有些异常来自 DRF 之外也会用到的代码（例如密码哈希，后台登录、createsuperuser 也会调用），
+那些代码不能抛 APIException；这里只在 API 请求中把它们转换成对应的响应。
+"""
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Service temporarily unavailable, please retry later.'
+    default_code = 'service_unavailable'
+
+
+def exception_handler(exc, context):
+    if isinstance(exc, HashingBusy):
+        exc = ServiceUnavailable('Too many password operations in progress, please retry later.', 'hashing_busy')
+    return drf_exception_handler(exc, context)
@@ -0,0 +1,40 @@
+import threading
+from collections import OrderedDict
+
+"""
+进程内的有界 LRU。
+
+代码高亮的结果、lexer、formatter，以及分块上传时每个上传的 sha256 状态都用它缓存：
+超过 max_entries 时丢掉最久没用到的一项，get/set 都加锁，可以在多个请求线程里共用。
+"""
+
+
+class LRUCache:
+    """线程安全的有界 LRU"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
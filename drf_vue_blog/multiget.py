@@ -0,0 +1,46 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+"""
+?ids=1,2,3 批量获取。
+
+前端一次拿多篇文章（或多条评论）时不用逐个请求详情接口，一个请求、一条带 IN 的查询就能取回，
+结果按 ids 中的顺序返回，不存在的 id 直接跳过。
+"""
+
+
+def parse_ids(value, limit):
+    if value is None:
+        return None
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ValidationError({'ids': 'ids 应该是用逗号分隔的整数'})
+    if len(ids) > limit:
+        raise ValidationError({'ids': '一次最多获取 {} 个'.format(limit)})
+    # 去重并保持顺序
+    return list(dict.fromkeys(ids))
+
+
+class MultiGetMixin:
+    """给视图集的 list 加上 ?ids= 批量获取，视图集在 list() 开头调用 multi_get_response()"""
+    multi_get_limit = 100
+
+    def get_multi_get_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_multi_get_serializer_class(self):
+        return self.get_serializer_class()
+
+    def multi_get_response(self, request):
+        """请求中没有 ids 时返回 None"""
+        ids = parse_ids(request.query_params.get('ids'), self.multi_get_limit)
+        if ids is None:
+            return None
+
+        by_pk = {obj.pk: obj for obj in self.get_multi_get_queryset().filter(pk__in=ids)}
+        serializer_class = self.get_multi_get_serializer_class()
+        serializer = serializer_class(
+            [by_pk[pk] for pk in ids if pk in by_pk], many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from functools import partial
+
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from drf_vue_blog.counting import EstimatedCountPaginator
+
+"""
+默认的分页类。
+
+和 PageNumberPagination 一样按页码翻页，但总数不再每次 COUNT(*)：
+小数量精确计算，大数量用数据库统计信息或缓存的计数（见 drf_vue_blog/counting.py），
+这时响应里的 count_approximate 为 true。需要精确总数时加上 ?exact_count=1。
+视图上设置了 pagination_count 时直接用它作为总数，例如归档表里已经存好的每月文章数。
+"""
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    exact_count_query_param = 'exact_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.exact = request.query_params.get(self.exact_count_query_param) in ('1', 'true')
+        self.known_count = getattr(view, 'pagination_count', None)
+        return super().paginate_queryset(queryset, request, view)
+
+    @property
+    def django_paginator_class(self):
+        return partial(EstimatedCountPaginator, exact=self.exact, known_count=self.known_count)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_approximate', self.page.paginator.approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_approximate'] = {
+            'type': 'boolean',
+            'example': False,
+        }
+        return response_schema
@@ -0,0 +1,181 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+"""
+按需的请求性能分析。
+
+线上某个接口变慢时，超级用户在请求里带上 X-Profile: 1 请求头，这一次请求就在 cProfile 下执行，
+调用统计（可以用 snakeviz 等工具打开的 .prof）、按累计时间排序的调用树和执行过的 SQL 保存到 REQUEST_PROFILING['DIR']，
+响应头 X-Profile-Id 给出这次结果的 id，/api/profiles/ 列出已保存的结果。
+
+REQUEST_PROFILING['ENABLED'] 为 False 时中间件在启动时就被移除（MiddlewareNotUsed），对请求没有任何开销；
+打开时没有请求头的请求也只多一次字典查找。RATE 限制每分钟最多分析几次，同一进程同时只分析一个请求。
+"""
+
+ID_RE = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$')
+_lock = threading.Lock()
+
+
+def profiling_setting(name, default=None):
+    return getattr(settings, 'REQUEST_PROFILING', {}).get(name, default)
+
+
+def profile_dir():
+    return str(profiling_setting('DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def is_superuser(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_superuser
+    # API 请求用的是 JWT，这时 DRF 还没有认证过
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return result is not None and result[0].is_superuser
+
+
+def allow_by_rate():
+    count, seconds = profiling_setting('RATE', (10, 60))
+    key = 'profiling:rate:{}'.format(int(time.time() // seconds))
+    cache.add(key, 0, seconds)
+    try:
+        return cache.incr(key) <= count
+    except ValueError:
+        return False
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not profiling_setting('ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = 'HTTP_' + profiling_setting('HEADER', 'X-Profile').upper().replace('-', '_')
+
+    def __call__(self, request):
+        if self.header not in request.META:
+            return self.get_response(request)
+        if not is_superuser(request) or not allow_by_rate():
+            return self.get_response(request)
+        if not _lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            _lock.release()
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = profiler.runcall(self.get_response, request)
+        duration = time.perf_counter() - started
+
+        profile_id = '{}-{}'.format(timezone.now().strftime('%Y%m%dT%H%M%S%f'), uuid.uuid4().hex[:8])
+        save_profile(profile_id, profiler, queries.captured_queries, {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration': round(duration, 6),
+            'queries': len(queries.captured_queries),
+            'created': timezone.now().isoformat(),
+        })
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+def save_profile(profile_id, profiler, queries, meta):
+    directory = os.path.join(profile_dir(), profile_id)
+    os.makedirs(directory, exist_ok=True)
+
+    profiler.dump_stats(os.path.join(directory, 'profile.prof'))
+
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative')
+    stats.print_stats(profiling_setting('TOP_FUNCTIONS', 80))
+    stats.print_callees(profiling_setting('TOP_FUNCTIONS', 80) // 4)
+    with open(os.path.join(directory, 'calltree.txt'), 'w') as f:
+        f.write(out.getvalue())
+
+    with open(os.path.join(directory, 'sql.json'), 'w') as f:
+        json.dump(queries, f, ensure_ascii=False, indent=1)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # 只保留最近的 KEEP 份
+    for stale in sorted(list_profile_ids(), reverse=True)[profiling_setting('KEEP', 50):]:
+        shutil.rmtree(os.path.join(profile_dir(), stale), ignore_errors=True)
+
+
+def list_profile_ids():
+    try:
+        return [name for name in os.listdir(profile_dir()) if ID_RE.match(name)]
+    except FileNotFoundError:
+        return []
+
+
+def read_profile_file(profile_id, name):
+    with open(os.path.join(profile_dir(), profile_id, name)) as f:
+        return f.read()
+
+
+class IsSuperUser(BasePermission):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
+
+
+class ProfileListView(APIView):
+    """已保存的分析结果，新的在前"""
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        profiles = []
+        for profile_id in sorted(list_profile_ids(), reverse=True):
+            try:
+                profiles.append(json.loads(read_profile_file(profile_id, 'meta.json')))
+            except (OSError, ValueError):
+                continue
+        return Response(profiles)
+
+
+class ProfileDetailView(APIView):
+    """
+    一次分析的调用树和 SQL。完整的统计数据在 REQUEST_PROFILING['DIR'] 下以 id 命名的目录中，
+    profile_file 只给出相对这个目录的文件名，不暴露服务器上的路径。
+    """
+    permission_classes = [IsSuperUser]
+
+    def get(self, request, profile_id):
+        if not ID_RE.match(profile_id):
+            raise Http404
+        try:
+            meta = json.loads(read_profile_file(profile_id, 'meta.json'))
+            meta['sql'] = json.loads(read_profile_file(profile_id, 'sql.json'))
+            meta['calltree'] = read_profile_file(profile_id, 'calltree.txt')
+        except (OSError, ValueError):
+            raise Http404
+        meta['profile_file'] = '{}/profile.prof'.format(profile_id)
+        return Response(meta)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
 from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,11 +39,16 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.sitemaps',
     # 自己后装的
     'rest_framework',
     'article',
     'user_info',
     'comment',
+    'task_queue',
+    'sync',
+    # 只为了注册 SQLite 后端自带的 stress_sqlite_writes 命令
+    'drf_vue_blog.sqlite',
     'corsheaders',
 
 ]
@@ -54,6 +60,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     #'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # 超级用户带上 X-Profile 请求头时分析这次请求，REQUEST_PROFILING['ENABLED'] 为 False 时不加载
+    'drf_vue_blog.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,11 +94,155 @@ WSGI_APPLICATION = 'drf_vue_blog.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # 在 Django 自带的 SQLite 后端上加了写入协调，见 drf_vue_blog/sqlite/base.py
+        'ENGINE': 'drf_vue_blog.sqlite',
+        # 压力测试（python manage.py stress_sqlite_writes）用环境变量指向临时数据库
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # 拿不到写锁时最多等多少秒
+            'timeout': 5,
+        },
     }
 }
 
+# SQLite 写入协调，见 drf_vue_blog/sqlite/
+SQLITE_WRITES = {
+    # 写事务用 BEGIN IMMEDIATE 开始，拿不到锁时重试的次数和初始退避时间（秒）
+    'IMMEDIATE': True,
+    'RETRIES': 5,
+    'BACKOFF': 0.05,
+    # 每次尝试都会先按 DATABASES 的 timeout 等锁（5 秒），只按 RETRIES 算最坏要等 30 秒；
+    # 超过 MAX_WAIT 秒后不再重试，一个写事务开始前最多等 MAX_WAIT + timeout 秒（单写者模式下再加上等锁文件的时间）
+    'MAX_WAIT': 10,
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    # 单写者：所有进程的写事务在这个锁文件上排队，None 表示不启用
+    'WRITER_LOCK': os.environ.get('SQLITE_WRITER_LOCK') or None,
+    'WRITER_LOCK_TIMEOUT': 30,
+    # 进程内合并提交发评论这类小写入，见 drf_vue_blog/sqlite/writer.py
+    'BATCH': os.environ.get('SQLITE_BATCH_WRITES') == '1',
+    'MAX_BATCH': 50,
+    'MAX_DELAY': 0.002,
+    'BATCH_TIMEOUT': 30,
+}
+
+# 缓存，默认用进程内存；多个 uWSGI worker 需要共享时换成 redis/memcached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'drf-vue-blog',
+        'OPTIONS': {
+            # Markdown 分块渲染的片段也存在这里，默认的 300 条太少
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# 代码高亮缓存，见 article/highlight.py
+# CACHE 填上面 CACHES 中的别名（例如一个 FileBasedCache）即可在进程内 LRU 之外再加一层持久缓存
+CODE_HIGHLIGHT = {
+    'MAX_ENTRIES': 2000,
+    'CACHE': None,
+}
+
+# 文章浏览数的写缓冲，见 article/counters.py
+ARTICLE_VIEW_COUNTER = {
+    'FLUSH_INTERVAL': 10,
+    'FLUSH_THRESHOLD': 100,
+}
+
+# 文章热度排名的权重和半衰期（秒），见 article/ranking.py
+ARTICLE_RANKING = {
+    'COMMENT_WEIGHT': 5,
+    'VIEW_WEIGHT': 1,
+    'HALF_LIFE': 3 * 24 * 3600,
+}
+
+# 相关文章的相似度权重，见 article/related.py
+RELATED_ARTICLES = {
+    'TOP_K': 5,
+    'TAG_WEIGHT': 1.0,
+    'CATEGORY_WEIGHT': 0.3,
+    'TERM_WEIGHT': 1.0,
+    # 增量更新时最多和多少篇文章比较
+    'CANDIDATES': 200,
+}
+
+# 旧评论归档，见 comment/archive.py
+COMMENT_ARCHIVE = {
+    'OLDER_THAN_DAYS': 180,
+    'INACTIVE_DAYS': 30,
+    'BATCH_SIZE': 500,
+}
+
+# 登录、注册、发评论的令牌桶限流，见 drf_vue_blog/throttling.py
+# BACKEND 为 local 时每个进程各自计数；多个 worker 要共用限额时改成 cache，并把 CACHE 指向一个共享的缓存
+THROTTLING = {
+    'BACKEND': 'local',
+    'CACHE': 'default',
+    'RATES': {
+        'login': '20/min:10',
+        'login_username': '10/min:5',
+        'register': '5/hour:3',
+        'comment': '10/min:5',
+    },
+}
+
+# 评论、文章的批量管理接口每个事务处理的条数，见 comment/moderation.py
+MODERATION = {
+    'BATCH_SIZE': 500,
+}
+
+# 数据库任务队列，见 task_queue/queue.py；用 python manage.py run_jobs 启动 worker
+TASK_QUEUE = {
+    # True 时不入队，事务提交后直接在当前进程执行，开发时不用另外启动 worker
+    'EAGER': os.environ.get('TASK_QUEUE_EAGER') == '1',
+    'POLL_INTERVAL': 1.0,
+    'LEASE': 300,
+    'KEEP_DAYS': 7,
+}
+
+# 标题图的分块上传，见 article/uploads.py；python manage.py prune_avatar_uploads 清理过期的上传
+AVATAR_UPLOAD = {
+    'DIR': os.path.join(BASE_DIR, 'upload_tmp'),
+    'MAX_SIZE': 10 * 1024 * 1024,
+    'MAX_CHUNK': 2 * 1024 * 1024,
+    # 只读文件头检查，超过这个像素数的图片直接拒绝
+    'MAX_PIXELS': 40 * 1000 * 1000,
+    'FORMATS': ('JPEG', 'PNG', 'GIF', 'WEBP'),
+    # 写入锁的有效期（秒）
+    'LEASE': 300,
+    'EXPIRE_HOURS': 24,
+}
+
+# 大表计数，见 drf_vue_blog/counting.py
+COUNTING = {
+    # 超过这个数量时允许返回估计值
+    'ESTIMATE_THRESHOLD': 10000,
+    # 有过滤条件的精确计数缓存时间（秒）
+    'CACHE_TIMEOUT': 60,
+}
+
+# 增量同步，见 sync/views.py
+SYNC = {
+    'MAX_LIMIT': 1000,
+    # 变更记录写入后等这么多秒才发给客户端，等并发的事务都提交
+    'SETTLE_SECONDS': 1,
+    # python manage.py prune_changelog 默认保留的天数
+    'KEEP_DAYS': 30,
+}
+
+# 按需的请求性能分析，见 drf_vue_blog/profiling.py
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('REQUEST_PROFILING') == '1',
+    'HEADER': 'X-Profile',
+    'DIR': os.path.join(BASE_DIR, 'profiles'),
+    # 每 60 秒最多分析 10 次
+    'RATE': (10, 60),
+    # 最多保留的结果份数
+    'KEEP': 50,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -111,6 +263,37 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# 密码哈希配置，具体见 user_info/hashers.py
+# ALGORITHM 可选 scrypt / argon2 / pbkdf2，argon2 需要安装 argon2-cffi，没装时退回 scrypt
+# 修改首选算法或参数后，老用户的密码会在下次登录成功时自动按新配置重新哈希
+PASSWORD_HASHING = {
+    'ALGORITHM': os.environ.get('PASSWORD_HASHER', 'scrypt'),
+    'SCRYPT_WORK_FACTOR': 2 ** 14,
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 64 * 1024,
+    'ARGON2_PARALLELISM': 2,
+    # 每个进程同时计算的哈希数、允许排队的数量，以及排队的最长等待秒数
+    'MAX_CONCURRENCY': 2,
+    'MAX_PENDING': 8,
+    'WAIT_TIMEOUT': 5,
+}
+if PASSWORD_HASHING['ALGORITHM'] == 'argon2' and find_spec('argon2') is None:
+    PASSWORD_HASHING['ALGORITHM'] = 'scrypt'
+
+_BOUNDED_HASHERS = {
+    'scrypt': 'user_info.hashers.BoundedScryptPasswordHasher',
+    'argon2': 'user_info.hashers.BoundedArgon2PasswordHasher',
+    'pbkdf2': 'user_info.hashers.BoundedPBKDF2PasswordHasher',
+}
+# 第一个是新密码使用的算法，其余的只用来校验老密码
+PASSWORD_HASHERS = [_BOUNDED_HASHERS[PASSWORD_HASHING['ALGORITHM']]] + [
+    hasher for name, hasher in _BOUNDED_HASHERS.items() if name != PASSWORD_HASHING['ALGORITHM']
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -145,13 +328,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # DRF 框架继承了 Django 方便易用的分页实现。
 REST_FRAMEWORK = {
     # 分页配置
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # 大表的总数用估计值，见 drf_vue_blog/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'drf_vue_blog.pagination.EstimatedCountPagination',
     'PAGE_SIZE': 5,
     # 用于过滤的轮子，将它作为默认的过滤引擎后端，写到配置文件中：
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # 把 DRF 之外的异常（例如密码哈希排队超时）转换成对应的响应
+    'EXCEPTION_HANDLER': 'drf_vue_blog.exceptions.exception_handler',
 
 
 }
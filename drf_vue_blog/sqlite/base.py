@@ -0,0 +1,121 @@
+import os
+import random
+import time
+
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+from django.db.utils import OperationalError
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+"""
+协调写入的 SQLite 数据库后端，在 settings.DATABASES 中用 ENGINE = 'drf_vue_blog.sqlite' 启用。
+
+Django 自带的后端用 BEGIN 开始事务，SQLite 会等到事务里第一条写语句才去拿写锁。
+多个 worker 同时写时，已经读过数据的事务再升级成写事务，拿不到锁会直接报 database is locked，
+连接上的 busy timeout 在这种情况下不会等待。这里做了几件事：
+- atomic() 的事务用 BEGIN IMMEDIATE 开始，一进事务就拿写锁，拿不到就按 busy timeout 等；
+  超时后再按指数退避加随机抖动重试 RETRIES 次，这时事务里什么都还没执行，重试是安全的；
+  每次尝试都可能等满 busy timeout，过了 MAX_WAIT 秒就不再重试，最坏的总等待是 MAX_WAIT 加一次 busy timeout；
+- 打开 WAL，读不阻塞写、写不阻塞读，synchronous=NORMAL 在 WAL 下仍然不会损坏数据库；
+- 可选的单写者：WRITER_LOCK 指定一个锁文件，写事务先拿这个文件锁（fcntl.flock），
+  各进程的写事务在锁文件上排队，而不是一起轮询 SQLite 的锁。
+
+配置在 settings.SQLITE_WRITES 中；把 IMMEDIATE 设为 False 就和 Django 自带的后端行为一致。
+"""
+
+
+def write_setting(name, default):
+    return getattr(settings, 'SQLITE_WRITES', {}).get(name, default)
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    writer_fd = None
+    writer_locked = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            journal_mode = write_setting('JOURNAL_MODE', 'WAL')
+            # WAL 记录在数据库文件里，已经是这个模式时不再切换，切换要拿锁，并发打开连接时会报 locked
+            if journal_mode and conn.execute('PRAGMA journal_mode').fetchone()[0].lower() != journal_mode.lower():
+                conn.execute('PRAGMA journal_mode = {}'.format(journal_mode))
+            synchronous = write_setting('SYNCHRONOUS', 'NORMAL')
+            if synchronous:
+                conn.execute('PRAGMA synchronous = {}'.format(synchronous))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if not write_setting('IMMEDIATE', True):
+            return super()._start_transaction_under_autocommit()
+
+        self.acquire_writer_lock()
+        retries = write_setting('RETRIES', 5)
+        backoff = write_setting('BACKOFF', 0.05)
+        # 每次 BEGIN IMMEDIATE 自己就可能按 busy timeout 等上几秒，重试之间的总时间另外用 MAX_WAIT 封顶
+        deadline = time.monotonic() + write_setting('MAX_WAIT', 10)
+        for attempt in range(retries + 1):
+            try:
+                self.cursor().execute('BEGIN IMMEDIATE')
+                return
+            except OperationalError as exc:
+                remaining = deadline - time.monotonic()
+                if not is_lock_error(exc) or attempt == retries or remaining <= 0:
+                    self.release_writer_lock()
+                    raise
+            time.sleep(min(backoff * 2 ** attempt * random.uniform(0.5, 1.5), remaining))
+
+    def acquire_writer_lock(self):
+        """单写者模式下先拿锁文件，最多等 WRITER_LOCK_TIMEOUT 秒"""
+        path = write_setting('WRITER_LOCK', None)
+        if not path or fcntl is None or self.is_in_memory_db():
+            return
+        if self.writer_fd is None:
+            self.writer_fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        deadline = time.monotonic() + write_setting('WRITER_LOCK_TIMEOUT', 30)
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self.writer_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.writer_locked = True
+                return
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise OperationalError('database is locked (timed out waiting for the writer lock)')
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
+
+    def release_writer_lock(self):
+        if self.writer_locked:
+            fcntl.flock(self.writer_fd, fcntl.LOCK_UN)
+            self.writer_locked = False
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_writer_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_writer_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_writer_lock()
+            if self.writer_fd is not None:
+                os.close(self.writer_fd)
+                self.writer_fd = None
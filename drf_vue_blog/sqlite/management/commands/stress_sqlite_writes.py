@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+from django.test.utils import override_settings
+
+from article.models import Article, Tag
+
+# 每种模式在 settings.SQLITE_WRITES 上覆盖的配置
+MODES = {
+    # 和 Django 自带的 SQLite 后端一样：BEGIN 开始事务、回滚日志模式、不重试
+    'default': {'IMMEDIATE': False, 'JOURNAL_MODE': 'DELETE', 'SYNCHRONOUS': 'FULL', 'BATCH': False},
+    'immediate': {},
+    'single-writer': {'WRITER_LOCK': '{dir}/writer.lock'},
+    'batched': {'BATCH': True},
+}
+
+
+# 这些模式下每个请求包在一个事务里，和打开 ATOMIC_REQUESTS 的 Django 项目一样。
+# 用 BEGIN 开始的事务先读后写（例如发文章时先查标签再建），要把读锁升级成写锁，
+# 别的连接正拿着写锁时 SQLite 不会等 busy timeout，直接报 database is locked
+ATOMIC_REQUEST_MODES = {'default'}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        '对临时的 SQLite 数据库做并发写入压力测试：多个进程、每个进程多个线程按目标速率调用发评论接口'
+        '（每 10 次里有 1 次发文章，另外每次写入后读一次评论列表），统计 database is locked 错误数、吞吐量和延迟。不会碰 db.sqlite3'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=list(MODES) + ['all'], default='all')
+        parser.add_argument('--workers', type=int, default=4, help='进程数，相当于 uWSGI 的 worker')
+        parser.add_argument('--threads', type=int, default=4, help='每个进程的线程数')
+        parser.add_argument('--rate', type=float, default=25, help='每个线程每秒的目标写入次数，0 表示不限')
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--busy-timeout', type=float, default=None,
+                            help='覆盖连接的 busy timeout（秒），调小可以在负载不高的机器上模拟锁等待超时')
+        # 以下两个参数是内部使用的，由父进程传给子进程
+        parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+        parser.add_argument('--worker', help=argparse.SUPPRESS)
+        parser.add_argument('--atomic-requests', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            # 在这个进程打开数据库连接之前换上这种模式的配置
+            with override_settings(SQLITE_WRITES=dict(settings.SQLITE_WRITES, **json.loads(options['worker']))):
+                # 准备数据时就切换好日志模式，免得各个 worker 启动时一起切换
+                return self.seed() if options['seed'] else self.worker(options)
+
+        if settings.DATABASES['default']['ENGINE'] != 'drf_vue_blog.sqlite':
+            raise CommandError('需要使用 drf_vue_blog.sqlite 数据库后端')
+
+        modes = list(MODES) if options['mode'] == 'all' else [options['mode']]
+        failed = []
+        for mode in modes:
+            report = self.run_mode(mode, options)
+            self.stdout.write(
+                '{mode:<14} writes {writes:>6}  {throughput:>7.1f}/s  locked {locked:>4}  errors {errors:>3}  '
+                'read errors {read_errors:>3}  p50 {p50:>6.1f}ms  p99 {p99:>7.1f}ms  rows ok: {consistent}'.format(
+                    mode=mode, **report
+                )
+            )
+            # 调小 busy timeout 是为了比较各模式出错的多少，重试次数用完后报 locked 是预期的
+            locked = report['locked'] and options['busy_timeout'] is None
+            if mode != 'default' and (locked or report['errors'] or not report['consistent']):
+                failed.append(mode)
+
+        if failed:
+            raise CommandError('出现写入错误的模式：{}'.format(', '.join(failed)))
+        self.stdout.write(self.style.SUCCESS('协调写入的模式没有出现 database is locked'))
+
+    def run_mode(self, mode, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, SQLITE_PATH=os.path.join(tmp, 'db.sqlite3'), DJANGO_WARMUP='0')
+            overrides = {
+                key: value.format(dir=tmp) if isinstance(value, str) else value for key, value in MODES[mode].items()
+            }
+            manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+            subprocess.run(manage + ['migrate', '-v', '0'], env=env, check=True)
+            subprocess.run(
+                manage + ['stress_sqlite_writes', '--seed', '--worker', json.dumps(overrides)], env=env, check=True,
+            )
+
+            worker_args = manage + [
+                'stress_sqlite_writes', '--worker', json.dumps(overrides), '--threads', str(options['threads']),
+                '--rate', str(options['rate']), '--seconds', str(options['seconds']),
+            ]
+            if options['busy_timeout'] is not None:
+                worker_args += ['--busy-timeout', str(options['busy_timeout'])]
+            if mode in ATOMIC_REQUEST_MODES:
+                worker_args.append('--atomic-requests')
+            workers = [
+                subprocess.Popen(worker_args, env=env, stdout=subprocess.PIPE, text=True)
+                for _ in range(options['workers'])
+            ]
+            results = [json.loads(worker.communicate()[0]) for worker in workers]
+
+            with sqlite3.connect(env['SQLITE_PATH']) as db:
+                rows = db.execute('SELECT COUNT(*) FROM comment_comment').fetchone()[0]
+                rows += db.execute('SELECT COUNT(*) FROM article_article').fetchone()[0] - 1
+
+        latencies = [value for result in results for value in result['latencies']]
+        writes = sum(result['writes'] for result in results)
+        return {
+            'writes': writes,
+            'throughput': writes / options['seconds'],
+            'locked': sum(result['locked'] for result in results),
+            'errors': sum(result['errors'] for result in results),
+            'read_errors': sum(result['read_errors'] for result in results),
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            # 报告成功的写入都真的落库了，没有多也没有少
+            'consistent': rows == writes,
+        }
+
+    def seed(self):
+        user = User.objects.create_superuser('stress', password='stress')
+        Article.objects.create(title='stress', body='stress', author=user)
+        # 发文章时用到的标签事先建好，请求里只查不建
+        Tag.objects.create(text='stress')
+
+    def worker(self, options):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from article.views import ArticleViewSet
+        from comment.views import CommentViewSet
+
+        user = User.objects.get(username='stress')
+        article_id = Article.objects.values_list('id', flat=True).get(title='stress')
+        if options['busy_timeout'] is not None:
+            # 准备数据用默认的超时，之后各线程新开的连接才用调小的超时
+            connection.settings_dict['OPTIONS'] = dict(connection.settings_dict['OPTIONS'],
+                                                       timeout=options['busy_timeout'])
+            connection.close()
+        result = {'writes': 0, 'locked': 0, 'errors': 0, 'read_errors': 0, 'latencies': []}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+        interval = 1 / options['rate'] if options['rate'] else 0
+        # 直接调用视图而不是用测试客户端：测试客户端通过全局信号收集请求中的异常，多线程时会收到别的线程的异常
+        factory = APIRequestFactory()
+        create_article = ArticleViewSet.as_view({'post': 'create'})
+        create_comment = CommentViewSet.as_view({'post': 'create'})
+        list_comments = CommentViewSet.as_view({'get': 'list'})
+
+        def call(view, request):
+            force_authenticate(request, user)
+            with transaction.atomic() if options['atomic_requests'] else nullcontext():
+                response = view(request)
+                response.render()
+            return response
+
+        def run():
+            started = time.monotonic()
+            n = 0
+            while time.monotonic() < deadline:
+                begin = time.monotonic()
+                outcome = 'writes'
+                try:
+                    if n % 10 == 9:
+                        response = call(create_article, factory.post(
+                            '/api/article/', {'title': 'stress', 'body': 'x', 'tags': ['stress']}, format='json',
+                        ))
+                    else:
+                        response = call(create_comment, factory.post(
+                            '/api/comment/', {'article_id': article_id, 'content': 'hi'},
+                        ))
+                    if response.status_code != 201:
+                        outcome = 'errors'
+                except OperationalError as exc:
+                    outcome = 'locked' if 'locked' in str(exc) else 'errors'
+                except Exception:
+                    outcome = 'errors'
+                latency = time.monotonic() - begin
+                try:
+                    # 读请求拿着共享锁，回滚日志模式下会挡住别人的提交
+                    call(list_comments, factory.get('/api/comment/', {'article': article_id}))
+                except Exception:
+                    with lock:
+                        result['read_errors'] += 1
+                with lock:
+                    result[outcome] += 1
+                    if outcome == 'writes':
+                        result['latencies'].append(latency)
+                n += 1
+                # 按目标速率发请求，落后时不补
+                pause = started + n * interval - time.monotonic()
+                if pause > 0:
+                    time.sleep(pause)
+            connection.close()
+
+        # 压力测试不受发评论的限流影响
+        with override_settings(THROTTLING={'RATES': {}}):
+            threads = [threading.Thread(target=run) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(json.dumps(result))
@@ -0,0 +1,119 @@
+import os
+import queue
+import threading
+import time
+
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+
+from drf_vue_blog.sqlite.base import write_setting
+
+"""
+小写入的合并提交（group commit）。
+
+发评论这类请求每个都是一个很小的写事务，并发时各自抢一次写锁、各自 fsync 一次。
+打开 SQLITE_WRITES['BATCH'] 后，请求线程把写操作交给本进程唯一的写线程，自己等结果：
+写线程把同时到达的写操作（最多 MAX_BATCH 个，最多再等 MAX_DELAY 秒凑一批）放进同一个事务，
+每个写操作各占一个保存点，一个失败只回滚它自己；整批提交成功后才把结果交还给请求线程。
+这样一批只拿一次写锁、提交一次，同一进程里的写也不会互相争锁。
+
+请求线程等满 BATCH_TIMEOUT 时，只有写线程还没开始执行的写操作会被放弃（写线程之后跳过它），
+这时请求线程报错；已经开始执行的写操作结果未定，请求线程继续等到整批提交或回滚，
+不会出现请求报了错、数据却写进去的情况。
+
+没有打开 BATCH，或者调用方已经在事务里时，直接在当前线程的 atomic() 中执行。
+"""
+
+
+class PendingWrite:
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._abandoned = False
+
+    def claim(self):
+        """写线程开始执行前调用，请求线程已经放弃时返回 False"""
+        with self._lock:
+            if not self._abandoned:
+                self._started = True
+            return self._started
+
+    def abandon(self):
+        """请求线程等待超时后调用，写线程已经开始执行时返回 False"""
+        with self._lock:
+            if not self._started:
+                self._abandoned = True
+            return self._abandoned
+
+
+class GroupCommitWriter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def run(self, func, *args, **kwargs):
+        """执行一个写操作并返回它的结果，写操作抛出的异常原样抛出"""
+        if not write_setting('BATCH', False) or connection.in_atomic_block:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+
+        item = PendingWrite(func, args, kwargs)
+        self.queue().put(item)
+        if not item.done.wait(write_setting('BATCH_TIMEOUT', 30)):
+            if item.abandon():
+                raise OperationalError('database is locked (timed out waiting for the batch writer)')
+            item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def queue(self):
+        # fork 出的 worker 里没有父进程的写线程，按进程 id 重新启动
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self.loop, args=(self._queue,), name='sqlite-writer', daemon=True).start()
+            return self._queue
+
+    def loop(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + write_setting('MAX_DELAY', 0.002)
+            while len(batch) < write_setting('MAX_BATCH', 50):
+                try:
+                    batch.append(pending.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self.commit(batch)
+
+    def commit(self, batch):
+        try:
+            with transaction.atomic():
+                for item in batch:
+                    if not item.claim():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            item.result = item.func(*item.args, **item.kwargs)
+                    except Exception as exc:
+                        item.error = exc
+        except Exception as exc:
+            # 整批没有提交成功，全部按失败处理；连接可能已经不可用，下一批重新连接
+            for item in batch:
+                item.result = None
+                item.error = item.error or exc
+            connection.close()
+        finally:
+            for item in batch:
+                item.done.set()
+
+
+writer = GroupCommitWriter()
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.base_user import AbstractBaseUser
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+"""
+令牌桶限流。
+
+登录、注册要算密码哈希，发评论要抢 SQLite 的写锁，一波机器人请求就能把 worker 全部占住。
+这里给这些接口加上令牌桶：每个 (接口, IP 或用户) 一个桶，容量是允许的突发量，按速率匀速补充令牌，
+没有令牌时返回 429，Retry-After 给出还要等几秒（DRF 根据 wait() 自动加上这个响应头）。
+
+桶的状态只用一个数表示（GCRA：下一个令牌的理论到达时间），每个请求只做一次读、一次写：
+- local：进程内的字典加锁，最便宜，但每个 worker 各算各的，N 个 worker 时实际上限是 N 倍；
+- cache：存在 Django 缓存里（settings.THROTTLING['CACHE'] 指定别名，例如 Redis 或 Memcached），
+  多个 worker 共用一个桶。读和写之间没有加锁，并发很高时可能多放过几个请求。
+
+速率写成 DRF 的格式，例如 '10/min'，容量默认等于周期内的请求数，也可以写成 '10/min:3' 单独指定容量。
+"""
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def throttle_setting(name, default):
+    return getattr(settings, 'THROTTLING', {}).get(name, default)
+
+
+def parse_rate(rate):
+    """'10/min:3' -> (容量 3, 每个令牌的间隔 6 秒)"""
+    rate, _, burst = rate.partition(':')
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return int(burst or count), PERIODS[period] / count
+
+
+class LocalBuckets:
+    """进程内的桶，最多 MAX_KEYS 个，最久没用的先丢掉（丢掉的桶相当于装满了）"""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._tat = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, interval):
+        """取一个令牌，返回 (是否允许, 需要等待的秒数)"""
+        now = time.monotonic()
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            wait = tat - now - interval * (capacity - 1)
+            if wait > 0:
+                return False, wait
+            self._tat[key] = tat + interval
+            self._tat.move_to_end(key)
+            while len(self._tat) > self.max_keys:
+                self._tat.popitem(last=False)
+        return True, 0.0
+
+    def clear(self):
+        with self._lock:
+            self._tat.clear()
+
+
+class CacheBuckets:
+    """存在 Django 缓存中的桶，多个 worker 共用；缓存里存的是墙上时间"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def consume(self, key, capacity, interval):
+        cache = caches[self.alias]
+        now = time.time()
+        tat = max(cache.get(key, now), now)
+        wait = tat - now - interval * (capacity - 1)
+        if wait > 0:
+            return False, wait
+        # 桶装满所需的时间过后这个键就没用了
+        cache.set(key, tat + interval, int(tat + interval - now) + 1)
+        return True, 0.0
+
+
+local_buckets = LocalBuckets(10000)
+
+
+def get_buckets():
+    if throttle_setting('BACKEND', 'local') == 'cache':
+        return CacheBuckets(throttle_setting('CACHE', 'default'))
+    return local_buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    子类指定 scope，对应 settings.THROTTLING['RATES'] 中的速率，没有配置速率的 scope 不限流。
+    默认按登录用户的 id 区分，匿名请求按 IP。只想限制某个 action 时在视图的 get_throttles() 中按 action 返回。
+    """
+    scope = None
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return 'user:{}'.format(request.user.pk)
+        return 'ip:{}'.format(self.get_ident(request))
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        rate = throttle_setting('RATES', {}).get(self.scope)
+        ident = self.get_ident_key(request)
+        if rate is None or ident is None:
+            return True
+
+        key = 'throttle:{}:{}'.format(self.scope, ident)
+        allowed, self.wait_seconds = get_buckets().consume(key, *parse_rate(rate))
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """登录按 IP 限流"""
+    scope = 'login'
+
+    def get_ident_key(self, request):
+        return 'ip:{}'.format(self.get_ident(request))
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    """同一个用户名的登录再单独限流，换着 IP 撞一个账号的密码也会被挡住"""
+    scope = 'login_username'
+
+    def get_ident_key(self, request):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not isinstance(username, str) or not username:
+            return None
+        # 按 Unicode 规范化、不区分大小写后取哈希：换个写法绕不开这个桶，
+        # 键的长度固定，缓存里也不会留下别人提交的原始用户名
+        username = AbstractBaseUser.normalize_username(username).casefold()
+        return 'username:{}'.format(hashlib.sha256(username.encode()).hexdigest())
+
+
+class RegisterThrottle(TokenBucketThrottle):
+    """注册按 IP 限流"""
+    scope = 'register'
+
+    def get_ident_key(self, request):
+        return 'ip:{}'.format(self.get_ident(request))
+
+
+class CommentThrottle(TokenBucketThrottle):
+    """发评论按用户限流"""
+    scope = 'comment'
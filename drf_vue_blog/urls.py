@@ -15,14 +15,18 @@ Including another URLconf
 """
 from django.conf.urls.static import static
 from django.contrib import admin
+from django.contrib.sitemaps import views as sitemap_views
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from article import views
+from article.syndication import AtomArticlesFeed, LatestArticlesFeed, cached_by_last_modified, sitemaps
 from comment.views import CommentViewSet
 from drf_vue_blog import settings
-from user_info.views import UserViewSet
+from drf_vue_blog.profiling import ProfileDetailView, ProfileListView
+from sync.views import SyncView
+from user_info.views import TokenObtainView, UserViewSet
 
 """由于使用了视图集，路由不用自己设计了，使用DRF框架提供的 Router 类就可以自动处理视图和 url 的连接。"""
 router = DefaultRouter()
@@ -31,6 +35,8 @@ router.register(r'article', views.ArticleViewSet)
 router.register(r'category', views.CategoryViewSet)
 router.register(r'tag', views.TagViewSet)
 router.register(r'avatar', views.AvatarViewSet)
+router.register(r'avatar-upload', views.AvatarUploadViewSet, basename='avatar-upload')
+router.register(r'archive', views.ArchiveViewSet, basename='archive')
 router.register(r'comment', CommentViewSet)
 router.register(r'user', UserViewSet)
 
@@ -43,9 +49,30 @@ urlpatterns = [
     path('api/', include(router.urls)),
 
     # Token接口
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', TokenObtainView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
+    # 首页数据：文章第一页、分类和标签
+    path('api/home/', views.HomeView.as_view(), name='home'),
+
+    # 文章和评论的增量同步
+    path('api/sync/', SyncView.as_view(), name='sync'),
+
+    # 请求性能分析的结果
+    path('api/profiles/', ProfileListView.as_view(), name='profile_list'),
+    path('api/profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile_detail'),
+
+    # 代码高亮缓存统计
+    path('api/highlight/stats/', views.HighlightStatsView.as_view(), name='highlight_stats'),
+
+    # 订阅和 sitemap
+    path('feed/rss/', cached_by_last_modified(LatestArticlesFeed()), name='feed_rss'),
+    path('feed/atom/', cached_by_last_modified(AtomArticlesFeed()), name='feed_atom'),
+    path('sitemap.xml', cached_by_last_modified(sitemap_views.index),
+         {'sitemaps': sitemaps, 'sitemap_url_name': 'sitemap_section'}, name='sitemap_index'),
+    path('sitemap-<section>.xml', cached_by_last_modified(sitemap_views.sitemap),
+         {'sitemaps': sitemaps}, name='sitemap_section'),
+
 ]
 
 
@@ -0,0 +1,107 @@
+import gc
+import time
+
+from django.db import connections
+from django.urls import get_resolver, reverse
+
+"""
+启动预热，在 drf_vue_blog/wsgi.py 中调用。
+
+uWSGI 默认在 master 进程里加载应用后再 fork 出 worker（不要开 lazy-apps），
+Markdown 扩展、Pygments 的 lexer 和样式、DRF 的序列化器和渲染器、URL 路由表都是第一次用到时才导入和构建的，
+不预热的话每个 worker 在各自的第一个请求里重复做一遍：重启后的第一批请求很慢，每个 worker 还各占一份内存。
+在 master 里先做完，worker 通过写时复制共享这些内存。
+
+预热只做导入和构建，不访问数据库；最后 gc.freeze() 把这些对象移出垃圾回收的跟踪，
+避免 worker 里的 GC 改写对象头，把共享的内存页复制成私有的。
+"""
+
+SAMPLE_MARKDOWN = '''
+[TOC]
+
+# Warmup
+
+Some *text* with `code`, a [link](http://example.com) and a table:
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+```python
+def hello():
+    return 'world'
+```
+
+```javascript
+const hello = () => 'world'
+```
+
+```bash
+echo hello
+```
+
+```html
+<p>hello</p>
+```
+
+```css
+p { color: red; }
+```
+
+```sql
+SELECT 1;
+```
+
+```json
+{"hello": "world"}
+```
+
+```
+没有写语言的代码块，会让 codehilite 猜测语言，把所有 lexer 都加载一遍
+```
+'''
+
+
+def warm_markdown():
+    from pygments.formatters import HtmlFormatter
+
+    from article.rendering import render_full
+
+    render_full(SAMPLE_MARKDOWN)
+    HtmlFormatter().get_style_defs('.codehilite')
+
+
+def warm_urls():
+    resolver = get_resolver()
+    resolver.resolve('/api/article/')
+    reverse('article-list')
+
+
+def warm_rest_framework():
+    from rest_framework.settings import api_settings
+
+    from drf_vue_blog.urls import router
+
+    # 导入渲染器、解析器、认证类（simplejwt）等
+    for name in ('DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'DEFAULT_AUTHENTICATION_CLASSES',
+                 'DEFAULT_PAGINATION_CLASS', 'DEFAULT_FILTER_BACKENDS'):
+        getattr(api_settings, name)
+
+    for _, viewset, _ in router.registry:
+        serializer_class = getattr(viewset, 'serializer_class', None)
+        if serializer_class is not None:
+            serializer_class().fields
+
+
+def warmup():
+    """返回预热用掉的秒数"""
+    started = time.perf_counter()
+    warm_urls()
+    warm_markdown()
+    warm_rest_framework()
+
+    # fork 前不能留下打开的数据库连接，否则 worker 会共用同一个连接
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+    return time.perf_counter() - started
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_vue_blog.settings')
 
 application = get_wsgi_application()
+
+# 在 uWSGI 的 master 里预热后再 fork，worker 共享预热的结果，见 drf_vue_blog/warmup.py
+# 设置环境变量 DJANGO_WARMUP=0 可以关闭
+if os.environ.get('DJANGO_WARMUP', '1') == '1':
+    from drf_vue_blog.warmup import warmup
+
+    warmup()
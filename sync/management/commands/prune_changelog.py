@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sync.models import ChangeLog
+from sync.views import sync_setting
+
+
+class Command(BaseCommand):
+    help = '清理旧的变更记录，游标早于保留范围的客户端下次同步时会收到 reset，重新全量下载'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=sync_setting('KEEP_DAYS', 30), help='保留最近多少天的记录')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每次删除的记录数')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # 最新的一条总是留着：SQLite 的表删空以后 id 会从 1 重新开始，客户端的游标就失效了
+        newest = ChangeLog.objects.order_by('-id').values_list('id', flat=True).first()
+        total = 0
+        while True:
+            # 分批删除，避免一个大事务长时间锁表
+            ids = list(ChangeLog.objects.filter(changed__lt=cutoff).exclude(id=newest).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            total += ChangeLog.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS('Pruned {} change log entr(ies).'.format(total)))
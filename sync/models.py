@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+
+
+class ChangeLog(models.Model):
+    """
+    文章、评论的变更记录，由 sync/signals.py 在保存、删除时写入。
+    自增的 id 就是增量同步的游标：客户端记下上次拿到的 id，下次只取比它大的记录。
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (UPSERT, '新建或修改'),
+        (DELETE, '删除'),
+    ]
+
+    # 'article' 或 'comment'
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # 按时间清理旧记录
+            models.Index(fields=['changed'], name='changelog_changed_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.action, self.model, self.object_id)
+
+    @classmethod
+    def record(cls, model, object_ids, action=UPSERT):
+        """记录一批对象的变更，queryset.update() 这类不触发信号的批量操作之后手动调用"""
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(model=model, object_id=object_id, action=action, changed=now)
+            for object_id in object_ids
+        ])
@@ -0,0 +1,45 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from article.models import Article
+from comment.archive import is_archiving
+from comment.models import Comment
+from comment.moderation import is_bulk_deleting
+from sync.models import ChangeLog
+
+"""文章、评论的增删改写进变更记录，供 /api/sync/ 增量同步"""
+
+MODEL_NAMES = {
+    Article: 'article',
+    Comment: 'comment',
+}
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Comment)
+def log_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ChangeLog.record(MODEL_NAMES[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=Comment)
+def log_deleted(sender, instance, **kwargs):
+    # 归档的评论仍然可以通过评论接口读到，对客户端来说没有删除
+    if sender is Comment and is_archiving():
+        return
+    # 批量删除自己一次写入整批的记录
+    if is_bulk_deleting():
+        return
+    ChangeLog.record(MODEL_NAMES[sender], [instance.pk], ChangeLog.DELETE)
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def log_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # 标签是文章数据的一部分
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        ChangeLog.record('article', [instance.pk])
+    elif pk_set:
+        ChangeLog.record('article', pk_set)
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from article.models import Article
+from comment.models import Comment
+
+
+@override_settings(SYNC={'SETTLE_SECONDS': 0})
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sync', password='pw')
+        self.client = APIClient()
+
+    def sync(self, cursor=None, **params):
+        if cursor is not None:
+            params['cursor'] = cursor
+        return self.client.get('/api/sync/', params).json()
+
+    def test_returns_only_changes_after_cursor(self):
+        old = Article.objects.create(title='old', body='x', author=self.user)
+        cursor = self.sync()['cursor']
+
+        article = Article.objects.create(title='new', body='x', author=self.user)
+        comment = Comment.objects.create(article=article, author=self.user, content='hi')
+        old_pk = old.pk
+        old.delete()
+
+        data = self.sync(cursor)
+        self.assertEqual([item['id'] for item in data['articles']], [article.pk])
+        self.assertEqual([item['id'] for item in data['comments']], [comment.pk])
+        self.assertEqual(data['deleted'], {'articles': [old_pk], 'comments': []})
+        self.assertEqual(self.sync(data['cursor'])['articles'], [])
+
+    def test_created_then_deleted_is_only_a_deletion(self):
+        cursor = self.sync()['cursor']
+        article = Article.objects.create(title='gone', body='x', author=self.user)
+        pk = article.pk
+        article.delete()
+
+        data = self.sync(cursor)
+        self.assertEqual(data['articles'], [])
+        self.assertEqual(data['deleted']['articles'], [pk])
+
+    def test_paging_with_limit(self):
+        cursor = self.sync()['cursor']
+        for i in range(3):
+            Article.objects.create(title=str(i), body='x', author=self.user)
+
+        first = self.sync(cursor, limit=2)
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['cursor'], limit=2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual(len(first['articles']) + len(second['articles']), 3)
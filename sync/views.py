@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from article.models import Article
+from article.serializers import ArticleSerializer
+from comment.models import Comment
+from comment.serializers import CommentSerializer
+from sync.models import ChangeLog
+
+# Create your views here.
+
+
+def sync_setting(name, default):
+    return getattr(settings, 'SYNC', {}).get(name, default)
+
+
+class SyncView(APIView):
+    """
+    增量同步：GET /api/sync/?cursor=<上次返回的 cursor>
+
+    返回游标之后新建、修改的文章和评论（最新的数据），以及被删除的 id；has_more 为 true 时用新的 cursor 接着取。
+    不带 cursor 时只返回当前的 cursor 和 reset: true，客户端先全量下载列表，再从这个 cursor 开始增量同步；
+    游标太旧、对应的变更记录已经被清理时同样返回 reset: true。
+    """
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 500)), sync_setting('MAX_LIMIT', 1000))
+            cursor = request.query_params.get('cursor')
+            cursor = int(cursor) if cursor is not None else None
+        except ValueError:
+            raise ValidationError({'cursor': 'cursor 和 limit 应该是整数'})
+
+        bounds = ChangeLog.objects.aggregate(first=Min('id'), last=Max('id'))
+        if cursor is None or (bounds['first'] is not None and cursor + 1 < bounds['first']):
+            return Response(self.empty(bounds['last'] or 0, reset=True))
+
+        # 刚写入的记录所在的事务可能还有比它 id 小的没提交，等一小会再发出去，避免跳过
+        settled = timezone.now() - timedelta(seconds=sync_setting('SETTLE_SECONDS', 1))
+        entries = list(
+            ChangeLog.objects.filter(id__gt=cursor, changed__lte=settled)
+            .values_list('id', 'model', 'object_id', 'action')[:limit + 1]
+        )
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        if not entries:
+            return Response(self.empty(cursor))
+
+        # 同一个对象多次变更只看最后一次
+        latest = {}
+        for _, model, object_id, action in entries:
+            latest[model, object_id] = action
+
+        def changed_ids(model, action):
+            return [object_id for (name, object_id), value in latest.items() if name == model and value == action]
+
+        context = {'request': request, 'view': self}
+        articles = Article.objects.filter(pk__in=changed_ids('article', ChangeLog.UPSERT)).select_related(
+            'author', 'category', 'avatar'
+        ).prefetch_related('tags')
+        comments = Comment.objects.filter(pk__in=changed_ids('comment', ChangeLog.UPSERT)).select_related(
+            'author', 'parent__author'
+        )
+
+        return Response({
+            'cursor': entries[-1][0],
+            'has_more': has_more,
+            'reset': False,
+            'articles': ArticleSerializer(articles, many=True, context=context).data,
+            'comments': CommentSerializer(comments, many=True, context=context).data,
+            'deleted': {
+                'articles': changed_ids('article', ChangeLog.DELETE),
+                'comments': changed_ids('comment', ChangeLog.DELETE),
+            },
+        })
+
+    def empty(self, cursor, reset=False):
+        return {
+            'cursor': cursor,
+            'has_more': False,
+            'reset': reset,
+            'articles': [],
+            'comments': [],
+            'deleted': {'articles': [], 'comments': []},
+        }
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TaskQueueConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'task_queue'
+
+    def ready(self):
+        # 导入各个 app 的 tasks.py，注册其中的任务
+        autodiscover_modules('tasks')
@@ -0,0 +1,66 @@
+import os
+import signal
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from task_queue.models import Job
+from task_queue.queue import claim_next, queue_setting, recover_stale, run_job
+
+
+class Command(BaseCommand):
+    help = '启动任务队列的 worker，执行 Job 表中的任务。可以同时运行多个'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='执行完当前可以执行的任务后退出')
+        parser.add_argument('--sleep', type=float, default=queue_setting('POLL_INTERVAL', 1.0),
+                            help='没有任务时的轮询间隔（秒）')
+        parser.add_argument('--lease', type=int, default=queue_setting('LEASE', 300),
+                            help='任务执行超过这么多秒视为 worker 已挂掉，放回队列')
+        parser.add_argument('--keep-days', type=int, default=queue_setting('KEEP_DAYS', 7),
+                            help='已完成的任务保留天数')
+
+    def handle(self, *args, **options):
+        worker_id = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.stopping = False
+        # 收到 SIGTERM / Ctrl-C 时做完手上的任务再退出
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write('Worker {} started.'.format(worker_id))
+        done = failed = 0
+        last_maintenance = 0
+        while not self.stopping:
+            close_old_connections()
+            if time.monotonic() - last_maintenance > 60:
+                recovered = recover_stale(options['lease'])
+                if recovered:
+                    self.stdout.write('Recovered {} stale job(s).'.format(recovered))
+                Job.objects.filter(
+                    status=Job.DONE, finished__lt=timezone.now() - timedelta(days=options['keep_days'])
+                ).delete()
+                last_maintenance = time.monotonic()
+
+            job = claim_next(worker_id)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.perf_counter()
+            if run_job(job):
+                done += 1
+                self.stdout.write('{} done in {:.3f}s'.format(job, time.perf_counter() - started))
+            else:
+                failed += 1
+                self.stderr.write('{} failed (attempt {}/{})'.format(job, job.attempts, job.max_attempts))
+
+        self.stdout.write(self.style.SUCCESS('Worker {} stopped: {} done, {} failed.'.format(worker_id, done, failed)))
+
+    def stop(self, signum, frame):
+        self.stopping = True
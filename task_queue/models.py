@@ -0,0 +1,54 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    数据库中的任务队列，一行是一次待执行的任务，由 python manage.py run_jobs 取出执行。
+    入队、执行的逻辑见 task_queue/queue.py
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, '等待执行'),
+        (RUNNING, '执行中'),
+        (DONE, '已完成'),
+        (FAILED, '已失败'),
+    ]
+
+    # 注册的任务名，见 task_queue.queue.task
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # 相同 dedupe_key 的任务同时只会有一个在等待
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # 不早于这个时间执行，重试的退避也靠它
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    created = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            # worker 取下一个可以执行的任务
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_job',
+            ),
+        ]
+
+    def __str__(self):
+        return '{} #{} ({})'.format(self.name, self.pk, self.status)
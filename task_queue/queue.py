@@ -0,0 +1,171 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from task_queue.models import Job
+
+"""
+不依赖外部消息队列的任务队列，任务存在数据库的 Job 表里。
+
+写操作之后要做的事（渲染 Markdown、更新相关文章和热度分等）用 @task 注册成任务，
+在请求里调用 some_task.delay(...) 入队：Job 和业务数据在同一个事务里写入，事务提交了任务就不会丢，
+请求不用等这些事做完就能返回。python manage.py run_jobs 启动 worker 取出任务执行，失败按指数退避重试。
+
+    @task(name='article.render', concurrency=2)
+    def render_article(pk):
+        ...
+
+    render_article.delay(pk=article.pk, dedupe_key='render:{}'.format(article.pk))
+
+dedupe_key 相同的任务同时只会有一个在等待，连续保存同一篇文章只会渲染一次；
+concurrency 限制同一个任务同时执行的数量（跨所有 worker）。
+开发时没有启动 worker 可以把 TASK_QUEUE['EAGER'] 设为 True，事务提交后直接在当前进程里执行。
+"""
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def queue_setting(name, default):
+    return getattr(settings, 'TASK_QUEUE', {}).get(name, default)
+
+
+class Task:
+    def __init__(self, func, name, max_attempts, backoff, concurrency):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        # 第 n 次失败后等 backoff * 2 ** (n - 1) 秒再试
+        self.backoff = backoff
+        self.concurrency = concurrency
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, dedupe_key=None, countdown=0, **kwargs):
+        return enqueue(self.name, kwargs, dedupe_key=dedupe_key, countdown=countdown)
+
+
+def task(name=None, max_attempts=5, backoff=10, concurrency=None):
+    """把函数注册为任务，参数只能是能存进 JSON 的值"""
+    def decorator(func):
+        task_name = name or '{}.{}'.format(func.__module__, func.__name__)
+        _registry[task_name] = Task(func, task_name, max_attempts, backoff, concurrency)
+        return _registry[task_name]
+
+    return decorator
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def enqueue(name, kwargs=None, dedupe_key=None, countdown=0):
+    """任务入队，返回 Job；已有相同 dedupe_key 的任务在等待时返回那一个"""
+    kwargs = kwargs or {}
+    registered = get_task(name)
+    if registered is None:
+        raise LookupError('Task {!r} is not registered.'.format(name))
+
+    if queue_setting('EAGER', False):
+        transaction.on_commit(lambda: registered.func(**kwargs))
+        return None
+
+    if dedupe_key is not None:
+        existing = Job.objects.filter(status=Job.PENDING, dedupe_key=dedupe_key).first()
+        if existing is not None:
+            return existing
+
+    try:
+        # 放在保存点里，并发入队撞上唯一约束时不影响外层事务
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name,
+                kwargs=kwargs,
+                dedupe_key=dedupe_key,
+                max_attempts=registered.max_attempts,
+                run_after=timezone.now() + timedelta(seconds=countdown),
+            )
+    except IntegrityError:
+        return Job.objects.filter(status=Job.PENDING, dedupe_key=dedupe_key).first()
+
+
+def recover_stale(lease):
+    """执行超过 lease 秒还没结束的任务视为 worker 已经挂掉，放回队列"""
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=lease)
+    ).update(status=Job.PENDING, locked_by='', dedupe_key=None)
+
+
+def saturated_tasks():
+    """已经达到并发上限的任务名"""
+    running = dict(
+        Job.objects.filter(status=Job.RUNNING).values('name').annotate(n=Count('id')).values_list('name', 'n')
+    )
+    return [
+        name for name, registered in _registry.items()
+        if registered.concurrency and running.get(name, 0) >= registered.concurrency
+    ]
+
+
+def claim_next(worker_id):
+    """取一个可以执行的任务并标记为执行中，没有则返回 None"""
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+        .exclude(name__in=saturated_tasks())
+        .values_list('id', 'name')[:10]
+    )
+    for pk, name in candidates:
+        # 带上状态条件更新，多个 worker 同时抢同一个任务时只有一个能改成功
+        claimed = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if not claimed:
+            continue
+
+        registered = get_task(name)
+        if registered and registered.concurrency and Job.objects.filter(
+                name=name, status=Job.RUNNING).count() > registered.concurrency:
+            # 和别的 worker 同时抢到，超过了并发上限，放回去
+            Job.objects.filter(pk=pk, locked_by=worker_id).update(
+                status=Job.PENDING, locked_by='', attempts=F('attempts') - 1, dedupe_key=None,
+            )
+            continue
+        return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """执行一个已经被 claim_next() 取出的任务，返回是否成功"""
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status=Job.RUNNING)
+    try:
+        registered = get_task(job.name)
+        if registered is None:
+            raise LookupError('Task {!r} is not registered.'.format(job.name))
+        registered.func(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s failed after %s attempt(s).\n%s', job, job.attempts, error)
+            mine.update(status=Job.FAILED, last_error=error, finished=timezone.now())
+        else:
+            backoff = registered.backoff if registered else 10
+            delay = backoff * 2 ** (job.attempts - 1)
+            logger.warning('Job %s failed, retrying in %ss.\n%s', job, delay, error)
+            mine.update(
+                status=Job.PENDING, last_error=error, locked_by='',
+                run_after=timezone.now() + timedelta(seconds=delay),
+                # 放回队列时可能已经有同样 dedupe_key 的任务在等待，不再占用这个 key
+                dedupe_key=None,
+            )
+        return False
+
+    mine.update(status=Job.DONE, finished=timezone.now())
+    return True
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from task_queue.models import Job
+from task_queue.queue import claim_next, enqueue, run_job, task
+
+calls = []
+
+
+@task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.flaky', max_attempts=2, backoff=30)
+def flaky():
+    raise RuntimeError('boom')
+
+
+@task(name='tests.limited', concurrency=1)
+def limited():
+    pass
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        del calls[:]
+
+    def test_dedupe_key_keeps_one_pending_job(self):
+        first = record.delay(value=1, dedupe_key='same')
+        second = record.delay(value=2, dedupe_key='same')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+        job = claim_next('w1')
+        # 执行中的任务不再占用 dedupe_key，新的改动要重新入队
+        third = record.delay(value=3, dedupe_key='same')
+        self.assertNotEqual(third.pk, job.pk)
+        self.assertTrue(run_job(job))
+        self.assertEqual(calls, [1])
+
+    def test_failed_job_is_retried_with_backoff_then_marked_failed(self):
+        flaky.delay()
+        job = claim_next('w1')
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+        self.assertIn('boom', job.last_error)
+        # 退避时间没到，取不到
+        self.assertIsNone(claim_next('w1'))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = claim_next('w1')
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_concurrency_limit(self):
+        limited.delay()
+        limited.delay()
+        first = claim_next('w1')
+        self.assertIsNotNone(first)
+        self.assertIsNone(claim_next('w2'))
+        run_job(first)
+        self.assertIsNotNone(claim_next('w2'))
+
+    @override_settings(TASK_QUEUE={'EAGER': True})
+    def test_eager_mode_runs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(enqueue('tests.record', {'value': 5}))
+        self.assertEqual(calls, [5])
+        self.assertFalse(Job.objects.exists())
@@ -1,3 +1,14 @@
 from django.contrib import admin
 
+from user_info.models import UserStats
+
 # Register your models here.
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'article_count', 'comment_count', 'last_activity']
+    list_select_related = ['user']
+    search_fields = ['=user__username']
+    autocomplete_fields = ['user']
+    readonly_fields = ['article_count', 'comment_count', 'last_activity']
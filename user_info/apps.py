@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UserInfoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_info'
+
+    def ready(self):
+        # 注册信号处理函数
+        from user_info import signals  # noqa: F401
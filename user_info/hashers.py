@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+"""
+密码哈希的配置层。
+
+登录、注册、改密码时的哈希计算都很吃 CPU，这里把它们放到一个有界线程池里执行：
+同一进程内同时计算的哈希数不超过 MAX_CONCURRENCY，排队超过 MAX_PENDING 或等待超过 WAIT_TIMEOUT 秒
+就抛出 HashingBusy，而不是让突发的登录请求把所有 worker 都拖住。
+API 请求中它由 drf_vue_blog/exceptions.py 转换成 503。
+hashlib.scrypt / pbkdf2_hmac 和 argon2-cffi 计算时都会释放 GIL，所以线程池能真正并行。
+
+具体参数在 settings.PASSWORD_HASHING 中配置，首选算法或参数变化后，
+Django 会在用户下次登录成功时用新配置重新哈希（check_password 的 setter）。
+"""
+
+
+def hashing_setting(name, default):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, default)
+
+
+class HashingBusy(Exception):
+    """哈希线程池已满；后台登录等非 API 的地方也会调用哈希，所以不是 APIException"""
+    pass
+
+
+class HashingPool:
+    """有界的哈希线程池，pending 信号量限制排队中 + 计算中的任务总数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = None
+        self._local = threading.local()
+
+    def _setup(self):
+        with self._lock:
+            if self._executor is None:
+                workers = hashing_setting('MAX_CONCURRENCY', 2)
+                self._pending = threading.BoundedSemaphore(workers + hashing_setting('MAX_PENDING', 8))
+                self._executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix='password-hash',
+                )
+        return self._executor
+
+    def _run_in_worker(self, func, args, kwargs):
+        self._local.inside = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.inside = False
+
+    def run(self, func, *args, **kwargs):
+        # verify() 内部会再调 encode()，已经在池内线程中时直接执行，避免自己等自己
+        if getattr(self._local, 'inside', False):
+            return func(*args, **kwargs)
+
+        executor = self._setup()
+        if not self._pending.acquire(timeout=hashing_setting('WAIT_TIMEOUT', 5)):
+            raise HashingBusy('Too many password operations in progress')
+        try:
+            return executor.submit(self._run_in_worker, func, args, kwargs).result()
+        finally:
+            self._pending.release()
+
+
+hashing_pool = HashingPool()
+
+
+class BoundedHasherMixin:
+    """把 encode / verify 交给 hashing_pool 执行"""
+
+    def encode(self, *args, **kwargs):
+        return hashing_pool.run(super().encode, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return hashing_pool.run(super().verify, password, encoded)
+
+
+class BoundedScryptPasswordHasher(BoundedHasherMixin, ScryptPasswordHasher):
+    """scrypt 是内存密集型算法，默认参数下比 PBKDF2 快一个数量级，且不依赖第三方库"""
+
+    @property
+    def work_factor(self):
+        return hashing_setting('SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+
+class BoundedArgon2PasswordHasher(BoundedHasherMixin, Argon2PasswordHasher):
+    """需要安装 argon2-cffi"""
+
+    @property
+    def time_cost(self):
+        return hashing_setting('ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return hashing_setting('ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return hashing_setting('ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+class BoundedPBKDF2PasswordHasher(BoundedHasherMixin, PBKDF2PasswordHasher):
+    """兼容老用户的 PBKDF2 哈希，下次登录时会升级为首选算法"""
+    pass
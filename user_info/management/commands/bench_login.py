@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hashers_by_algorithm
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = '测量每种密码哈希算法在单个 worker 进程内每秒能完成多少次登录校验'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', action='append', dest='algorithms',
+                            help='要测试的算法名，如 scrypt、argon2、pbkdf2_sha256，可重复，默认测试全部可用算法')
+        parser.add_argument('--logins', type=int, default=40, help='每种算法校验的次数')
+        parser.add_argument('--threads', type=int, default=8, help='同时发起校验的线程数，模拟登录突发')
+
+    def handle(self, *args, **options):
+        hashers = get_hashers_by_algorithm()
+        algorithms = options['algorithms'] or list(hashers)
+        password = 'benchmark-password'
+
+        self.stdout.write('MAX_CONCURRENCY={}  threads={}  logins={}'.format(
+            settings.PASSWORD_HASHING['MAX_CONCURRENCY'], options['threads'], options['logins']
+        ))
+        for algorithm in algorithms:
+            hasher = hashers.get(algorithm)
+            if hasher is None:
+                self.stderr.write('Unknown algorithm: {}'.format(algorithm))
+                continue
+            try:
+                encoded = hasher.encode(password, hasher.salt())
+            except ValueError as e:
+                # 例如没有安装 argon2-cffi
+                self.stdout.write('{:<16} skipped ({})'.format(algorithm, e))
+                continue
+
+            serial = self.measure(password, encoded, options['logins'], 1)
+            burst = self.measure(password, encoded, options['logins'], options['threads'])
+            self.stdout.write('{:<16} serial {:8.1f} logins/s   burst {:8.1f} logins/s'.format(
+                algorithm, serial, burst
+            ))
+
+    def measure(self, password, encoded, logins, threads):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(lambda _: check_password(password, encoded), range(logins)))
+        elapsed = time.perf_counter() - start
+
+        assert all(results)
+        return logins / elapsed
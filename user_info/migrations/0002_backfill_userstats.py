@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def backfill(apps, schema_editor):
+    """给还没有统计行的老用户补上，之后主页接口只读这张表"""
+    User = apps.get_model('auth', 'User')
+    Article = apps.get_model('article', 'Article')
+    Comment = apps.get_model('comment', 'Comment')
+    UserStats = apps.get_model('user_info', 'UserStats')
+
+    def totals(model):
+        return {
+            row['author_id']: row
+            for row in model.objects.order_by().values('author_id').annotate(n=Count('pk'), last=Max('created'))
+        }
+
+    articles = totals(Article)
+    comments = totals(Comment)
+    existing = set(UserStats.objects.values_list('user_id', flat=True))
+    empty = {'n': 0, 'last': None}
+
+    stats = []
+    for user_id in User.objects.exclude(pk__in=existing).values_list('pk', flat=True).iterator():
+        activities = [
+            row['last'] for row in (articles.get(user_id, empty), comments.get(user_id, empty)) if row['last']
+        ]
+        stats.append(UserStats(
+            user_id=user_id,
+            article_count=articles.get(user_id, empty)['n'],
+            comment_count=comments.get(user_id, empty)['n'],
+            last_activity=max(activities) if activities else None,
+        ))
+    UserStats.objects.bulk_create(stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_info', '0001_userstats'),
+        # 只读文章、评论的作者和创建时间，依赖建出这些字段的迁移即可
+        ('article', '0002_article_author'),
+        ('comment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
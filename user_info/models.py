@@ -1,3 +1,84 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import models
 
-# Create your models here.
+# 用户主页数据的缓存时间（秒）
+PROFILE_CACHE_TIMEOUT = 300
+
+
+def profile_cache_key(username):
+    return 'user_profile:{}'.format(username)
+
+
+class UserStats(models.Model):
+    """用户的活跃数据，由 user_info/signals.py 在文章、评论增删时维护，主页接口直接读这一行"""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    article_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.user_id)
+
+    @classmethod
+    def for_user(cls, user):
+        """取用户的统计行；还没有统计行时按现有数据算一遍，只读不写，GET 请求不会写数据库"""
+        try:
+            return cls.objects.get(user=user)
+        except cls.DoesNotExist:
+            return cls.compute(user)
+
+    @classmethod
+    def compute(cls, user):
+        """按文章、评论表算出统计数据，返回未保存的实例"""
+        last_article = user.articles.order_by('-created').values_list('created', flat=True).first()
+        last_comment = user.comments.order_by('-created').values_list('created', flat=True).first()
+        activities = [value for value in (last_article, last_comment) if value is not None]
+        return cls(
+            user=user,
+            article_count=user.articles.count(),
+            # 归档的评论也算
+            comment_count=user.comments.count() + user.archived_comments.count(),
+            last_activity=max(activities) if activities else None,
+        )
+
+    @classmethod
+    def rebuild(cls, user):
+        """重新计算并保存统计行，用于修复计数"""
+        stats = cls.compute(user)
+        stats.save()
+        invalidate_profile(user.pk)
+        return stats
+
+    @classmethod
+    def adjust(cls, user_id, articles=0, comments=0, activity=None):
+        """
+        增量更新已有的统计行，activity 比已有的 last_activity 新时才覆盖
+        统计行在注册时创建（见 user_info/signals.py），老用户的由迁移 0002 补上
+        """
+        queryset = cls.objects.filter(user_id=user_id)
+        if articles:
+            queryset.filter(article_count__gte=-articles).update(
+                article_count=models.F('article_count') + articles
+            )
+        if comments:
+            queryset.filter(comment_count__gte=-comments).update(
+                comment_count=models.F('comment_count') + comments
+            )
+        if activity is not None:
+            queryset.filter(
+                models.Q(last_activity__isnull=True) | models.Q(last_activity__lt=activity)
+            ).update(last_activity=activity)
+
+        invalidate_profile(user_id)
+
+
+def invalidate_profile(user_id):
+    username = User.objects.filter(pk=user_id).values_list('username', flat=True).first()
+    if username is not None:
+        cache.delete(profile_cache_key(username))
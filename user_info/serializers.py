@@ -1,6 +1,9 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
+from article.models import Article
+from user_info.models import UserStats
+
 
 class UserDescSerializer(serializers.ModelSerializer):
     """于文章列表中引用的嵌套序列化器"""
@@ -59,4 +62,40 @@ class UserDetailSerializer(serializers.ModelSerializer):
             'email',
             'last_login',
             'date_joined'
-        ]
\ No newline at end of file
+        ]
+
+
+"""用户主页的序列化器，计数直接来自 UserStats，只额外查一次最新文章"""
+class ProfileArticleSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='article-detail')
+
+    class Meta:
+        model = Article
+        fields = [
+            'id',
+            'url',
+            'title',
+            'created'
+        ]
+
+
+class UserProfileSerializer(serializers.ModelSerializer):
+    # 主页展示的最新文章数
+    latest_articles_count = 5
+
+    user = UserDescSerializer(read_only=True)
+    latest_articles = serializers.SerializerMethodField()
+
+    def get_latest_articles(self, obj):
+        articles = obj.user.articles.order_by('-created')[:self.latest_articles_count]
+        return ProfileArticleSerializer(articles, many=True, context=self.context).data
+
+    class Meta:
+        model = UserStats
+        fields = [
+            'user',
+            'article_count',
+            'comment_count',
+            'last_activity',
+            'latest_articles'
+        ]
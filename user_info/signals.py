@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from article.models import Article
+from comment.archive import is_archiving
+from comment.models import Comment
+from comment.moderation import is_bulk_deleting
+from user_info.models import UserStats, invalidate_profile
+
+
+"""新用户注册时建好统计行，之后只做增量更新，主页接口只读"""
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+"""文章、评论增删时更新作者的 UserStats，并清掉作者主页的缓存"""
+@receiver(post_save, sender=Article)
+def count_article_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.author_id is not None:
+        UserStats.adjust(instance.author_id, articles=1, activity=instance.created)
+
+
+@receiver(post_save, sender=Article)
+def refresh_profile_on_article_edit(sender, instance, created, raw=False, **kwargs):
+    # 主页上的最新文章列表显示标题和发布时间，文章改过就清掉作者主页的缓存
+    if not created and not raw and instance.author_id is not None:
+        invalidate_profile(instance.author_id)
+
+
+@receiver(post_delete, sender=Article)
+def count_article_deleted(sender, instance, **kwargs):
+    # 批量删除按作者汇总后一次更新
+    if instance.author_id is not None and not is_bulk_deleting():
+        UserStats.adjust(instance.author_id, articles=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.adjust(instance.author_id, comments=1, activity=instance.created)
+
+
+@receiver(post_delete, sender=Comment)
+def count_comment_deleted(sender, instance, **kwargs):
+    # 归档不算删除；批量删除按作者汇总后一次更新
+    if is_archiving() or is_bulk_deleting():
+        return
+    UserStats.adjust(instance.author_id, comments=-1)
@@ -1,3 +1,144 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from article.models import Article
+from drf_vue_blog.throttling import local_buckets
+from user_info.hashers import HashingBusy, HashingPool, hashing_pool
+from user_info.models import UserStats, profile_cache_key
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('writer', password='pw')
+        self.client = APIClient()
+
+    def test_stats_row_created_on_register_and_kept_up_to_date(self):
+        self.assertTrue(UserStats.objects.filter(user=self.user).exists())
+        Article.objects.create(title='a', body='x', author=self.user)
+        Article.objects.create(title='b', body='x', author=self.user).delete()
+
+        data = self.client.get('/api/user/writer/profile/').data
+        self.assertEqual(data['article_count'], 1)
+        self.assertEqual([article['title'] for article in data['latest_articles']], ['a'])
+
+    def test_profile_read_does_not_write(self):
+        Article.objects.create(title='a', body='x', author=self.user)
+        # 模拟还没有统计行的老用户
+        UserStats.objects.filter(user=self.user).delete()
+
+        data = self.client.get('/api/user/writer/profile/').data
+        self.assertEqual(data['article_count'], 1)
+        self.assertFalse(UserStats.objects.filter(user=self.user).exists())
+
+    def test_editing_article_title_refreshes_cached_profile(self):
+        article = Article.objects.create(title='old title', body='x', author=self.user)
+        self.assertEqual(self.client.get('/api/user/writer/profile/').data['latest_articles'][0]['title'], 'old title')
+
+        article.title = 'new title'
+        article.save()
+        self.assertEqual(self.client.get('/api/user/writer/profile/').data['latest_articles'][0]['title'], 'new title')
+
+
+    def test_cached_profile_links_follow_the_request_host(self):
+        article = Article.objects.create(title='a', body='x', author=self.user)
+        first = self.client.get('/api/user/writer/profile/', HTTP_HOST='a.example.com').data
+        second = self.client.get('/api/user/writer/profile/', HTTP_HOST='b.example.com').data
+        self.assertEqual(first['latest_articles'][0]['url'], 'http://a.example.com/api/article/{}/'.format(article.pk))
+        self.assertEqual(second['latest_articles'][0]['url'], 'http://b.example.com/api/article/{}/'.format(article.pk))
+        self.assertTrue(cache.get(profile_cache_key('writer'))['latest_articles'][0]['url'].startswith('/api/'))
+
+
+class HashingPoolTests(TestCase):
+    @override_settings(PASSWORD_HASHING={'MAX_CONCURRENCY': 1, 'MAX_PENDING': 0, 'WAIT_TIMEOUT': 0.05})
+    def test_saturated_pool_raises_outside_drf(self):
+        pool = HashingPool()
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=pool.run, args=(slow,))
+        worker.start()
+        started.wait(5)
+        try:
+            # 不是 APIException，后台登录、createsuperuser 中也能正常处理
+            with self.assertRaises(HashingBusy):
+                pool.run(lambda: None)
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(pool.run(lambda: 'done'), 'done')
+
+    @override_settings(PASSWORD_HASHERS=['user_info.hashers.BoundedPBKDF2PasswordHasher'])
+    def test_api_returns_503_when_pool_is_full(self):
+        with mock.patch.object(hashing_pool, 'run', side_effect=HashingBusy()):
+            response = APIClient().post('/api/user/', {'username': 'busy', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['detail'].code, 'hashing_busy')
+
+
+@override_settings(THROTTLING={'RATES': {'register': '2/min', 'login': '3/min', 'login_username': '100/min',
+                                         'comment': '60/min:2'}})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        local_buckets.clear()
+        self.addCleanup(local_buckets.clear)
+        self.client = APIClient()
+
+    def test_register_burst_gets_retry_after(self):
+        for i in range(2):
+            response = self.client.post('/api/user/', {'username': 'u{}'.format(i), 'password': 'secret-pass'})
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.post('/api/user/', {'username': 'u9', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 429)
+        # 每 30 秒补充一个令牌
+        self.assertEqual(response['Retry-After'], '30')
+        # 另一个 IP 不受影响，读接口也不受影响
+        other = self.client.post('/api/user/', {'username': 'u9', 'password': 'secret-pass'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 201)
+        self.assertEqual(self.client.get('/api/user/').status_code, 200)
+
+    def test_login_and_comment_buckets(self):
+        User.objects.create_user('reader', password='secret-pass')
+        statuses = [
+            self.client.post('/api/token/', {'username': 'reader', 'password': 'wrong'}).status_code
+            for _ in range(4)
+        ]
+        self.assertEqual(statuses, [401, 401, 401, 429])
+
+        user = User.objects.create_superuser('admin', password='x')
+        article = Article.objects.create(title='a', body='x', author=user)
+        self.client.force_authenticate(user)
+        statuses = [
+            self.client.post('/api/comment/', {'article_id': article.pk, 'content': 'hi'}).status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    @override_settings(THROTTLING={'BACKEND': 'cache', 'RATES': {'login_username': '1/min'}})
+    def test_username_bucket_key_is_hashed(self):
+        cache.clear()
+        self.client.post('/api/token/', {'username': 'Reader', 'password': 'wrong'})
+        keys = list(cache._cache)
+        self.assertEqual(len(keys), 1)
+        self.assertNotIn('reader', keys[0].lower())
+        # 大小写、全角写法都算同一个用户名
+        response = self.client.post('/api/token/', {'username': 'ｒｅａｄｅｒ', 'password': 'wrong'},
+                                    REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(THROTTLING={'BACKEND': 'cache', 'RATES': {'register': '1/min'}})
+    def test_cache_backend_is_shared(self):
+        cache.clear()
+        self.assertEqual(self.client.post('/api/user/', {'username': 'a', 'password': 'secret-pass'}).status_code, 201)
+        # 进程内的桶清空了也一样，计数在缓存里
+        local_buckets.clear()
+        self.assertEqual(self.client.post('/api/user/', {'username': 'b', 'password': 'secret-pass'}).status_code, 429)
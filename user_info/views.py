@@ -1,12 +1,17 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.shortcuts import render
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView
 
+from drf_vue_blog.chunked import streaming_response
+from drf_vue_blog.throttling import LoginThrottle, LoginUsernameThrottle, RegisterThrottle
+from user_info.models import UserStats, profile_cache_key, PROFILE_CACHE_TIMEOUT
 from user_info.permissions import IsSelfOrReadOnly
-from user_info.serializers import UserRegisterSerializer, UserDetailSerializer
+from user_info.serializers import UserRegisterSerializer, UserDetailSerializer, UserProfileSerializer
 
 # Create your views here.
 
@@ -27,14 +32,37 @@ class UserViewSet(viewsets.ModelViewSet):
 
         return super().get_permissions()
 
+    def get_throttles(self):
+        # 注册要算密码哈希，按 IP 限流
+        if self.action == 'create':
+            return [RegisterThrottle()]
+        return super().get_throttles()
+
     @action(detail=True, methods=['get'])
     def info(self, request, username=None):
-        queryset = User.objects.get(username=username)
-        serializer = UserDetailSerializer(queryset, many=False)
+        # get_object() 找不到用户时返回 404，而不是抛出 DoesNotExist
+        instance = self.get_object()
+        serializer = UserDetailSerializer(instance, many=False)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def profile(self, request, username=None):
+        """用户主页：文章数、评论数、最新文章和最后活跃时间，按用户名缓存"""
+        key = profile_cache_key(username)
+        data = cache.get(key)
+        if data is None:
+            stats = UserStats.for_user(self.get_object())
+            # 缓存里只放相对路径，不然第一个请求的域名会被返回给所有人
+            context = {**self.get_serializer_context(), 'request': None}
+            data = UserProfileSerializer(stats, context=context).data
+            cache.set(key, data, PROFILE_CACHE_TIMEOUT)
+
+        latest = [{**article, 'url': request.build_absolute_uri(article['url'])} for article in data['latest_articles']]
+        return Response({**data, 'latest_articles': latest})
+
     @action(detail=False)
     def sorted(self, request):
+        # username 有唯一索引，按它排序分页不需要额外排序
         users = User.objects.all().order_by('-username')
 
         page = self.paginate_queryset(users)
@@ -42,5 +70,10 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(users, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        # 关掉分页时按块查询、边查边输出，不把所有用户同时读进内存
+        return streaming_response(users, self.get_serializer_class(), self.get_serializer_context())
+
+
+class TokenObtainView(TokenObtainPairView):
+    """获取 token 的接口，按 IP 和用户名限流，挡住撞库时大量的密码哈希计算"""
+    throttle_classes = [LoginThrottle, LoginUsernameThrottle]